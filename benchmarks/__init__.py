@@ -0,0 +1,9 @@
+"""
+Benchmarks of unpack_recursive.
+
+Not installed with the package. Run them from the repository root, e.g.
+
+    python -m benchmarks.corpus --scale small /tmp/corpus
+    python -m benchmarks.end_to_end --corpus /tmp/corpus --output before.json
+    python -m benchmarks.compare before.json after.json
+"""
@@ -0,0 +1,53 @@
+"""
+Compare two result files of benchmarks.end_to_end (or benchmarks.micro): prints the ratio of
+median times per scenario and exits with status 1 if any scenario got slower than the threshold.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+
+def iter_medians(results: Dict[str, object]) -> Iterator[Tuple[str, float]]:
+    """Yield (name, median seconds) of all measured entries of a result file"""
+    for name, result in sorted(results.get("scenarios", {}).items()):
+        if "median" in result:
+            yield name, result["median"]
+
+
+def compare(baseline: Dict[str, object], current: Dict[str, object], threshold: float = 0.1) -> bool:
+    """Print the comparison table, return True if nothing is slower than baseline * (1 + threshold)"""
+    if baseline.get("environment", {}).get("platform") != current.get("environment", {}).get("platform"):
+        print("warning: results come from different platforms", file=sys.stderr)
+    baseline_medians = dict(iter_medians(baseline))
+    ok = True
+    print("%-24s %12s %12s %8s" % ("scenario", "baseline s", "current s", "ratio"))
+    for name, median in iter_medians(current):
+        if name not in baseline_medians:
+            print("%-24s %12s %12.6f %8s" % (name, "-", median, "new"))
+            continue
+        ratio = median / baseline_medians[name] if baseline_medians[name] else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  SLOWER"
+            ok = False
+        elif ratio < 1 - threshold:
+            mark = "  faster"
+        print("%-24s %12.6f %12.6f %8.2f%s" % (name, baseline_medians[name], median, ratio, mark))
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline", help="Result JSON of the reference run")
+    parser.add_argument("current", help="Result JSON of the run to check")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown reported as regression (default - 0.1, i.e. 10%%)")
+    args = parser.parse_args()
+    with open(args.baseline) as baseline_file, open(args.current) as current_file:
+        ok = compare(json.load(baseline_file), json.load(current_file), args.threshold)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Deterministic generation of a synthetic corpus of (nested) archives for benchmarks.
+
+Archives are created with the 'create_*' functions of the patool_unpack.programs modules,
+so the same programs that unpack the corpus are used to pack it. File contents only depend
+on the seed and the scale, archive bytes may still differ between runs (e.g. gzip headers
+contain the creation time).
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+from unpack_recursive.patool_unpack import create_archive as patool_create_archive
+from unpack_recursive.patool_unpack.util import PatoolError
+
+MANIFEST_NAME = "manifest.json"
+BLOCK_SIZE = 1024 * 1024
+
+# Size parameters of every scenario for each corpus scale
+SCALES: Dict[str, Dict[str, int]] = {
+    "tiny": {"nesting_depth": 3, "small_files": 200, "large_archive_bytes": 4 * BLOCK_SIZE, "large_archives": 1,
+             "encrypted_archives": 2, "wrong_passwords": 20, "mixed_files": 2},
+    "small": {"nesting_depth": 6, "small_files": 10000, "large_archive_bytes": 64 * BLOCK_SIZE, "large_archives": 2,
+              "encrypted_archives": 4, "wrong_passwords": 200, "mixed_files": 8},
+    "full": {"nesting_depth": 12, "small_files": 100000, "large_archive_bytes": 2048 * BLOCK_SIZE,
+             "large_archives": 3, "encrypted_archives": 8, "wrong_passwords": 1000, "mixed_files": 32},
+}
+
+# (file extension, archive format, compression) of the 'mixed' scenario
+MIXED_FORMATS = (
+    ("zip", "zip", None), ("tar", "tar", None), ("tar.gz", "tar", "gzip"), ("tar.bz2", "tar", "bzip2"),
+    ("tar.xz", "tar", "xz"), ("tar.zst", "tar", "zstd"), ("gz", "gzip", None), ("bz2", "bzip2", None),
+    ("xz", "xz", None), ("lzma", "lzma", None), ("zst", "zstd", None), ("7z", "7z", None),
+)
+
+WORDS = ("archive", "unpack", "recursive", "data", "value", "index", "block", "stream", "member", "header",
+         "lorem", "ipsum", "dolor", "sit", "amet", "config", "error", "debug", "info", "warning")
+
+
+def create_archive(archive: str, filenames: List[str], archive_format: str, compression: Optional[str] = None,
+                   password: Optional[str] = None, cwd: Optional[str] = None) -> None:
+    """Create an archive with the first installed program, filenames are relative to cwd"""
+    archive = os.path.abspath(archive)
+    previous_cwd = os.getcwd()
+    os.chdir(cwd or previous_cwd)
+    try:
+        patool_create_archive(archive, filenames, archive_format, compression=compression, verbosity=-1,
+                              interactive=False, password=password)
+    finally:
+        os.chdir(previous_cwd)
+    if not os.path.isfile(archive):
+        raise PatoolError("%s was not created" % archive)
+
+
+def text_data(rng: random.Random, size: int) -> bytes:
+    """Compressible pseudo text of the given size"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words).encode()[:size]
+
+
+def write_file(path: str, data: bytes) -> None:
+    """Write data to path, creating parent directories"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def write_leaf_files(rng: random.Random, directory: str, count: int, max_size: int = 4096) -> List[str]:
+    """Write count small text/binary files into directory, return their names"""
+    os.makedirs(directory, exist_ok=True)
+    names = []
+    for number in range(count):
+        size = rng.randint(0, max_size)
+        if number % 4 == 3:
+            name, data = "file_%06d.bin" % number, rng.getrandbits(8 * size).to_bytes(size, "little")
+        else:
+            name, data = "file_%06d.txt" % number, text_data(rng, size)
+        write_file(os.path.join(directory, name), data)
+        names.append(name)
+    return names
+
+
+def write_large_file(rng: random.Random, path: str, size: int) -> None:
+    """Write a half compressible file of the given size, built from a few pseudo random blocks"""
+    blocks = []
+    for _ in range(8):
+        random_part = rng.getrandbits(8 * BLOCK_SIZE // 2).to_bytes(BLOCK_SIZE // 2, "little")
+        blocks.append(random_part + text_data(rng, BLOCK_SIZE - len(random_part)))
+    with open(path, "wb") as file:
+        written = 0
+        number = 0
+        while written < size:
+            # the block number makes every block unique, so compressors can't just reference an earlier one
+            block = (b"%016d" % number) + blocks[number % len(blocks)][16:]
+            block = block[:size - written]
+            file.write(block)
+            written += len(block)
+            number += 1
+
+
+def generate_nested(rng: random.Random, directory: str, params: Dict[str, int]) -> Dict[str, object]:
+    """Deep nesting: leaf files packed into zip, then tar, then gzip, then zip again and so on"""
+    work_dir = os.path.join(directory, ".work")
+    cycle = ("zip", "tar", "gzip")
+    # path of the outermost archive created so far, it is always inside work_dir
+    current = None
+    for level in range(params["nesting_depth"]):
+        archive_format = cycle[level % len(cycle)]
+        if archive_format == "gzip":
+            create_archive(current + ".gz", [os.path.basename(current)], "gzip", cwd=work_dir)
+            os.remove(current)
+            current += ".gz"
+            continue
+        write_leaf_files(rng, work_dir, 20 if current is None else 3)
+        members = sorted(os.listdir(work_dir))
+        archive = os.path.join(directory, "level_%02d.%s" % (level, archive_format))
+        create_archive(archive, members, archive_format, cwd=work_dir)
+        for name in members:
+            os.remove(os.path.join(work_dir, name))
+        current = os.path.join(work_dir, os.path.basename(archive))
+        shutil.move(archive, current)
+    shutil.move(current, os.path.join(directory, os.path.basename(current)))
+    shutil.rmtree(work_dir)
+    return {"nesting_depth": params["nesting_depth"]}
+
+
+def generate_many_small(rng: random.Random, directory: str, params: Dict[str, int]) -> Dict[str, object]:
+    """A plain directory with lots of tiny non-archive files and one zip with as many members"""
+    count = params["small_files"]
+    write_leaf_files(rng, os.path.join(directory, "tree"), count, max_size=256)
+    members_dir = os.path.join(directory, ".work")
+    names = write_leaf_files(rng, members_dir, count, max_size=256)
+    create_archive(os.path.join(directory, "many_small.zip"), names, "zip", cwd=members_dir)
+    shutil.rmtree(members_dir)
+    return {"files": count, "archive_members": count}
+
+
+def generate_large(rng: random.Random, directory: str, params: Dict[str, int]) -> Dict[str, object]:
+    """A few big single file and tar archives"""
+    size = params["large_archive_bytes"]
+    work_dir = os.path.join(directory, ".work")
+    os.makedirs(work_dir)
+    kinds = (("gzip", None, "gz"), ("tar", "xz", "tar.xz"), ("bzip2", None, "bz2"))
+    created = []
+    for number in range(params["large_archives"]):
+        archive_format, compression, extension = kinds[number % len(kinds)]
+        name = "large_%02d" % number
+        write_large_file(rng, os.path.join(work_dir, name), size)
+        archive = os.path.join(directory, "%s.%s" % (name, extension))
+        create_archive(archive, [name], archive_format, compression=compression, cwd=work_dir)
+        os.remove(os.path.join(work_dir, name))
+        created.append(os.path.basename(archive))
+    shutil.rmtree(work_dir)
+    return {"uncompressed_bytes": size, "archives": created}
+
+
+def generate_encrypted(rng: random.Random, directory: str, params: Dict[str, int]) -> Dict[str, object]:
+    """Password protected zips; the right password is the last one of a long list"""
+    passwords = ["wrong-%05d" % number for number in range(params["wrong_passwords"])]
+    passwords.append("right-%08d" % rng.randint(0, 10 ** 8))
+    work_dir = os.path.join(directory, ".work")
+    for number in range(params["encrypted_archives"]):
+        names = write_leaf_files(rng, work_dir, 5)
+        create_archive(os.path.join(directory, "encrypted_%02d.zip" % number), names, "zip",
+                       password=passwords[-1], cwd=work_dir)
+        shutil.rmtree(work_dir)
+    return {"passwords": passwords}
+
+
+def generate_mixed(rng: random.Random, directory: str, params: Dict[str, int]) -> Dict[str, object]:
+    """One archive of every format that can be created on this machine"""
+    work_dir = os.path.join(directory, ".work")
+    created, unsupported = [], {}
+    for extension, archive_format, compression in MIXED_FORMATS:
+        names = write_leaf_files(rng, work_dir, params["mixed_files"])
+        if archive_format in ("gzip", "bzip2", "xz", "lzma", "zstd"):
+            # single file formats
+            names = names[:1]
+        archive = os.path.join(directory, "mixed.%s" % extension)
+        try:
+            create_archive(archive, names, archive_format, compression=compression, cwd=work_dir)
+            created.append(os.path.basename(archive))
+        except PatoolError as error:
+            unsupported[extension] = str(error)
+        shutil.rmtree(work_dir)
+    return {"archives": created, "unsupported": unsupported}
+
+
+SCENARIOS = {
+    "nested": generate_nested,
+    "many_small": generate_many_small,
+    "large": generate_large,
+    "encrypted": generate_encrypted,
+    "mixed": generate_mixed,
+}
+
+
+def generate_corpus(corpus_dir: str, scale: str = "small", seed: int = 0,
+                    scenarios: Optional[List[str]] = None) -> Dict[str, object]:
+    """Generate all (or the given) scenarios into corpus_dir/<scenario>, return the manifest"""
+    params = SCALES[scale]
+    manifest: Dict[str, object] = {"scale": scale, "seed": seed, "params": params, "scenarios": {}}
+    for name in scenarios or list(SCENARIOS):
+        scenario_dir = os.path.join(corpus_dir, name)
+        if os.path.exists(scenario_dir):
+            shutil.rmtree(scenario_dir)
+        os.makedirs(scenario_dir)
+        # every scenario gets its own generator, so a subset of scenarios has the same content
+        rng = random.Random("%s-%s" % (seed, name))
+        try:
+            manifest["scenarios"][name] = SCENARIOS[name](rng, scenario_dir, params)
+        except PatoolError as error:
+            # e.g. no program on this machine can create encrypted archives
+            shutil.rmtree(scenario_dir)
+            manifest["scenarios"][name] = {"skipped": str(error)}
+    with open(os.path.join(corpus_dir, MANIFEST_NAME), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+
+def load_manifest(corpus_dir: str) -> Dict[str, object]:
+    """Read the manifest written by generate_corpus()"""
+    with open(os.path.join(corpus_dir, MANIFEST_NAME)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic archive corpus for benchmarks")
+    parser.add_argument("corpus_dir", help="Directory to create the corpus in")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Corpus size (default - 'small')")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the file contents (default - 0)")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=None,
+                        help="Generate only these scenarios (default - all)")
+    args = parser.parse_args()
+    manifest = generate_corpus(args.corpus_dir, args.scale, args.seed, args.scenarios)
+    for name, info in manifest["scenarios"].items():
+        status = "skipped: " + info["skipped"] if "skipped" in info else "ok"
+        print("%-12s %s" % (name, status), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+End-to-end benchmark: times unpack_recursive (as a function or as the console program)
+on every scenario of a corpus generated by benchmarks.corpus and writes the results as JSON.
+
+Every repetition unpacks a fresh copy of the scenario, the copy time is not measured.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from unpack_recursive import unpack_recursive
+from unpack_recursive.patool_unpack import resources
+from unpack_recursive.patool_unpack.util import find_program
+
+from .corpus import SCENARIOS, generate_corpus, load_manifest, MANIFEST_NAME
+
+# external programs whose presence changes which backend is used
+PROGRAMS = ("file", "7z", "7za", "tar", "bsdtar", "unzip", "gzip", "pigz", "bzip2", "pbzip2", "lbzip2",
+            "xz", "lzma", "plzip", "lzip", "zstd", "pzstd", "lrzip")
+
+
+def get_environment() -> Dict[str, object]:
+    """Machine description stored with results, so that only comparable runs are compared"""
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                           cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_revision": revision,
+        "programs": dict((program, find_program(program)) for program in PROGRAMS),
+    }
+
+
+def count_tree(path: str) -> Dict[str, int]:
+    """Number of files and total bytes below path"""
+    files = size = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            files += 1
+            size += os.lstat(os.path.join(root, filename)).st_size
+    return {"files": files, "bytes": size}
+
+
+def run_once(scenario_dir: str, passwords: List[str], mode: str) -> float:
+    """Unpack scenario_dir in place, return elapsed wall time in seconds"""
+    start = time.perf_counter()
+    if mode == "api":
+        unpack_recursive(scenario_dir, encrypted_files_action="default" if passwords else "skip",
+                         default_passwords=tuple(passwords), verbosity_level=-1)
+    else:
+        command = [sys.executable, "-m", "unpack_recursive.console_app", "-i", scenario_dir, "-l", "-1"]
+        if passwords:
+            command.extend(["-pa", "default", "-pwds"] + passwords)
+        subprocess.check_call(command)
+    return time.perf_counter() - start
+
+
+def benchmark_scenario(corpus_dir: str, name: str, info: Dict[str, object], work_dir: str, repeat: int,
+                       mode: str) -> Dict[str, object]:
+    """Unpack a scenario repeat times, return timings and output statistics"""
+    passwords = info.get("passwords", [])
+    timings = []
+    output = {}
+    resources.reset()
+    for number in range(repeat):
+        target = os.path.join(work_dir, "%s-%d" % (name, number))
+        shutil.copytree(os.path.join(corpus_dir, name), target)
+        try:
+            timings.append(run_once(target, passwords, mode))
+            output = count_tree(target)
+        finally:
+            shutil.rmtree(target, ignore_errors=True)
+    return {
+        "timings": timings,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "output": output,
+        # external programs run in this process only in 'api' mode
+        "resources": resources.get_summary() if mode == "api" else None,
+    }
+
+
+def run_benchmarks(corpus_dir: str, scenarios: List[str], repeat: int = 3, mode: str = "api",
+                   work_dir: str = None) -> Dict[str, object]:
+    """Benchmark all given scenarios of the corpus, return the JSON serializable results"""
+    manifest = load_manifest(corpus_dir)
+    results = {"environment": get_environment(), "corpus": {"scale": manifest["scale"], "seed": manifest["seed"]},
+               "mode": mode, "repeat": repeat, "scenarios": {}}
+    work_dir = tempfile.mkdtemp(prefix="unpack_bench_", dir=work_dir)
+    try:
+        for name in scenarios:
+            info = manifest["scenarios"].get(name)
+            if info is None or "skipped" in info:
+                results["scenarios"][name] = {"skipped": info["skipped"] if info else "not in corpus"}
+                continue
+            results["scenarios"][name] = benchmark_scenario(corpus_dir, name, info, work_dir, repeat, mode)
+            print("%-12s median %.3fs" % (name, results["scenarios"][name]["median"]), file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of unpack_recursive")
+    parser.add_argument("--corpus", required=True, help="Corpus directory (generated if it has no manifest)")
+    parser.add_argument("--scale", default="small", help="Scale of a newly generated corpus (default - 'small')")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario (default - 3)")
+    parser.add_argument("--mode", choices=["api", "cli"], default="api",
+                        help="Call unpack_recursive() in this process or run the console program")
+    parser.add_argument("--work-dir", default=None, help="Where to put the unpacked copies (default - temp dir)")
+    parser.add_argument("--output", default="-", help="Result JSON file (default - stdout)")
+    args = parser.parse_args()
+
+    if not os.path.isfile(os.path.join(args.corpus, MANIFEST_NAME)):
+        generate_corpus(args.corpus, args.scale)
+    results = run_benchmarks(args.corpus, args.scenarios, args.repeat, args.mode, args.work_dir)
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Micro-benchmarks of the per-file detection path on a big synthetic tree (1M entries by default):
+is_archive, get_archive_format, util.guess_mime, find_archive_program, get_archive_cmdlist_func
+and the directory walk of unpack_recursive on a tree without archives.
+
+For every function the latency distribution of single calls is reported together with the
+number of subprocesses, audited file system events (open, listdir, scandir, ...) and, on Linux,
+read/write syscalls per call. Results use the same layout as benchmarks.end_to_end, so
+benchmarks.compare works on them too.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zipfile
+from collections import Counter
+from typing import Callable, Dict, List, Sequence
+
+from unpack_recursive import is_archive, unpack_recursive
+from unpack_recursive.patool_unpack import get_archive_format, find_archive_program, get_archive_cmdlist_func, \
+    ArchivePrograms, util
+
+from .end_to_end import get_environment
+
+TREE_MANIFEST = "micro_tree.json"
+FILES_PER_DIRECTORY = 1000
+
+# extensions of the non-archive files of the tree, archive extensions are added separately
+PLAIN_EXTENSIONS = ("txt", "log", "csv", "json", "py", "jpg", "png", "dll", "")
+
+
+class EventCounter(object):
+    """Counts audit events (sys.addaudithook, Python 3.8+) raised by the current thread while active"""
+
+    COUNTED = ("subprocess.Popen", "open", "os.listdir", "os.scandir", "os.chmod", "os.rename", "os.remove",
+               "os.mkdir", "os.rmdir", "shutil.move")
+
+    def __init__(self):
+        self.counts = Counter()
+        self.active = False
+        self.thread = None
+        if hasattr(sys, "addaudithook"):
+            sys.addaudithook(self.hook)
+
+    def hook(self, event, args):
+        if self.active and event in self.COUNTED and threading.get_ident() == self.thread:
+            self.counts[event] += 1
+
+    def start(self):
+        self.counts.clear()
+        self.thread = threading.get_ident()
+        self.active = True
+
+    def stop(self) -> Dict[str, int]:
+        self.active = False
+        return dict(self.counts)
+
+
+def read_syscall_counters() -> Dict[str, int]:
+    """Read and write syscall counters of this process (Linux only, empty elsewhere)"""
+    try:
+        with open("/proc/self/io") as io_file:
+            values = dict(line.split(":", 1) for line in io_file.read().splitlines() if ":" in line)
+        return {"syscr": int(values["syscr"]), "syscw": int(values["syscw"])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+def latency_distribution(timings: List[float]) -> Dict[str, float]:
+    """min/percentiles/max/mean of per call timings in seconds"""
+    timings = sorted(timings)
+
+    def percentile(fraction):
+        return timings[min(len(timings) - 1, int(fraction * len(timings)))]
+
+    return {"calls": len(timings), "min": timings[0], "median": percentile(0.5), "p90": percentile(0.9),
+            "p99": percentile(0.99), "max": timings[-1], "mean": sum(timings) / len(timings)}
+
+
+def measure(counter: EventCounter, function: Callable, arguments: Sequence[tuple]) -> Dict[str, object]:
+    """Call function once per argument tuple, return latency distribution and per call counts"""
+    timings = []
+    syscalls_before = read_syscall_counters()
+    counter.start()
+    for args in arguments:
+        start = time.perf_counter()
+        try:
+            function(*args)
+        except util.PatoolError:
+            # e.g. 'unknown archive format', a normal outcome of detection
+            pass
+        timings.append(time.perf_counter() - start)
+    events = counter.stop()
+    syscalls_after = read_syscall_counters()
+    result = latency_distribution(timings)
+    calls = float(len(timings))
+    result["events_per_call"] = dict((event, count / calls) for event, count in events.items())
+    result["syscalls_per_call"] = dict((name, (syscalls_after[name] - syscalls_before[name]) / calls)
+                                       for name in syscalls_after)
+    return result
+
+
+def make_zip_bytes(directory: str) -> bytes:
+    """A tiny valid zip archive used as the content of all archive files of the tree"""
+    path = os.path.join(directory, ".template.zip")
+    with zipfile.ZipFile(path, "w") as zfile:
+        zfile.writestr("member.txt", "member")
+    with open(path, "rb") as template:
+        data = template.read()
+    os.remove(path)
+    return data
+
+
+def generate_tree(tree_dir: str, entries: int, archive_ratio: float = 0.01, seed: int = 0) -> Dict[str, object]:
+    """Create 'plain' (no archives) and 'mixed' (some real and fake archives) subtrees of about
+    `entries` files in total. Reused if already generated with the same parameters."""
+    manifest_path = os.path.join(tree_dir, TREE_MANIFEST)
+    manifest = {"entries": entries, "archive_ratio": archive_ratio, "seed": seed}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as manifest_file:
+            existing = json.load(manifest_file)
+        if all(existing.get(key) == value for key, value in manifest.items()):
+            return existing
+    rng = random.Random(seed)
+    os.makedirs(tree_dir, exist_ok=True)
+    zip_data = make_zip_bytes(tree_dir)
+    plain_entries = entries // 2
+    for number in range(plain_entries):
+        directory = os.path.join(tree_dir, "plain", "d%04d" % (number // FILES_PER_DIRECTORY))
+        if number % FILES_PER_DIRECTORY == 0:
+            os.makedirs(directory, exist_ok=True)
+        extension = rng.choice(PLAIN_EXTENSIONS)
+        with open(os.path.join(directory, "f%07d%s" % (number, "." + extension if extension else "")), "wb"):
+            pass
+    archives, fakes = [], []
+    for number in range(entries - plain_entries):
+        directory = os.path.join(tree_dir, "mixed", "d%04d" % (number // FILES_PER_DIRECTORY))
+        if number % FILES_PER_DIRECTORY == 0:
+            os.makedirs(directory, exist_ok=True)
+        draw = rng.random()
+        if draw < archive_ratio:
+            path = os.path.join(directory, "a%07d.zip" % number)
+            data = zip_data
+            archives.append(path)
+        elif draw < archive_ratio * 1.5:
+            # archive extension, but not an archive: passes the extension check, fails detection
+            path = os.path.join(directory, "x%07d.gz" % number)
+            data = b"not an archive"
+            fakes.append(path)
+        else:
+            extension = rng.choice(PLAIN_EXTENSIONS)
+            path = os.path.join(directory, "f%07d%s" % (number, "." + extension if extension else ""))
+            data = b""
+        with open(path, "wb") as file:
+            file.write(data)
+    manifest.update({"archives": archives, "fake_archives": fakes})
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    return manifest
+
+
+def list_files(directory: str) -> List[str]:
+    files = []
+    for root, _, filenames in os.walk(directory):
+        files.extend(os.path.join(root, filename) for filename in filenames)
+    return files
+
+
+def run_micro_benchmarks(tree_dir: str, entries: int, samples: int, seed: int = 0) -> Dict[str, object]:
+    """Run all micro-benchmarks, at most `samples` calls of each detection function"""
+    manifest = generate_tree(tree_dir, entries, seed=seed)
+    rng = random.Random(seed)
+    counter = EventCounter()
+    mixed_files = list_files(os.path.join(tree_dir, "mixed"))
+    rng.shuffle(mixed_files)
+    candidates = manifest["archives"] + manifest["fake_archives"]
+    rng.shuffle(candidates)
+    formats_and_commands = [(archive_format, command) for archive_format in sorted(ArchivePrograms)
+                            for command in ("test", "extract", "list")]
+    programs = []
+    for archive_format, command in formats_and_commands:
+        try:
+            programs.append((find_archive_program(archive_format, command), command, archive_format))
+        except util.PatoolError:
+            pass
+    results = {}
+
+    def run(name, function, arguments):
+        results[name] = measure(counter, function, arguments)
+        print("%-28s median %9.1fus  p99 %9.1fus" % (name, results[name]["median"] * 1e6,
+                                                     results[name]["p99"] * 1e6), file=sys.stderr)
+
+    # guess_mime results are memoized, start the uncached measurements with an empty cache
+    util.guess_mime.cache.clear()
+    run("is_archive", is_archive, [(path,) for path in mixed_files[:samples]])
+    util.guess_mime.cache.clear()
+    run("get_archive_format", get_archive_format, [(path,) for path in candidates[:samples]])
+    run("guess_mime.uncached", util.guess_mime.func, [(path,) for path in candidates[:samples]])
+    # the cache is filled by get_archive_format above
+    run("guess_mime.cached", util.guess_mime, [(path,) for path in candidates[:samples]])
+    run("find_archive_program", find_archive_program, formats_and_commands)
+    run("get_archive_cmdlist_func", get_archive_cmdlist_func, programs)
+    # one call walking the whole tree without archives, reported per visited entry as well
+    walk = measure(counter, unpack_recursive, [(os.path.join(tree_dir, "plain"), "skip", (), False, "rename", -1)])
+    plain_entries = entries // 2
+    walk["per_entry"] = walk["median"] / plain_entries
+    results["unpack_recursive.walk"] = walk
+    print("%-28s total %.3fs, %.1fus per entry" % ("unpack_recursive.walk", walk["median"],
+                                                   walk["per_entry"] * 1e6), file=sys.stderr)
+    return {"environment": get_environment(), "tree": {"entries": entries, "seed": seed},
+            "samples": samples, "scenarios": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of archive detection and tree traversal")
+    parser.add_argument("--tree", required=True, help="Directory of the synthetic tree (generated once, reused)")
+    parser.add_argument("--entries", type=int, default=1000000, help="Files in the tree (default - 1000000)")
+    parser.add_argument("--samples", type=int, default=20000,
+                        help="Maximal number of calls per detection function (default - 20000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="-", help="Result JSON file (default - stdout)")
+    args = parser.parse_args()
+    results = run_micro_benchmarks(args.tree, args.entries, args.samples, args.seed)
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
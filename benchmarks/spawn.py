@@ -0,0 +1,97 @@
+"""
+Benchmark of the cost of starting an external program, the fixed price of every archive test, listing
+and extraction (and of every 'file' call of the MIME detection).
+
+A no-op program (true(1) by default) is started over and over with several launchers:
+
+- fork: subprocess with a real fork() (forced by a no-op preexec_fn), what older Pythons always did
+- subprocess: subprocess.Popen defaults (close_fds=True, vfork() on Linux with Python 3.10+)
+- util.popen: the launcher of patool_unpack, posix_spawn() where subprocess can use it
+- util.popen.cwd: util.popen with a working directory, which rules out posix_spawn (vfork() instead)
+- util.call: util.popen plus wait4() and the resource summary, as used for every archive command
+
+fork() copies the page tables of the parent, so its cost grows with the memory of the process;
+--ballast allocates that many MiB first to show the effect on a big long-lived process.
+Results use the same layout as benchmarks.end_to_end, so benchmarks.compare works on them too.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+from unpack_recursive.patool_unpack import util
+
+from .end_to_end import get_environment
+from .micro import latency_distribution
+
+
+def _no_op():
+    pass
+
+
+def get_launchers(program: str, cwd: str) -> Dict[str, Callable[[], None]]:
+    """Functions that start program once and wait for it, by launcher name"""
+    cmd = [program]
+
+    def wait(process):
+        process.wait()
+
+    return {
+        "fork": lambda: wait(subprocess.Popen(cmd, preexec_fn=_no_op)),
+        "subprocess": lambda: wait(subprocess.Popen(cmd)),
+        "util.popen": lambda: wait(util.popen(cmd)),
+        "util.popen.cwd": lambda: wait(util.popen(cmd, cwd=cwd)),
+        "util.call": lambda: util.call(cmd),
+    }
+
+
+def measure_spawn(launch: Callable[[], None], calls: int) -> Dict[str, float]:
+    """Start the program `calls` times, return the latency distribution of a start (and wait)"""
+    timings: List[float] = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        launch()
+        timings.append(time.perf_counter() - start)
+    return latency_distribution(timings)
+
+
+def run_spawn_benchmarks(calls: int, program: str = "true", ballast_mib: int = 0) -> Dict[str, object]:
+    """Measure all launchers, each one `calls` times"""
+    executable = util.find_program(program)
+    if not executable:
+        raise SystemExit("%s is not installed" % program)
+    # touched, so the pages are really mapped and have to be copied by fork()
+    ballast = bytearray(b"x" * (ballast_mib * 1024 * 1024))
+    results = {}
+    for name, launch in get_launchers(program, os.getcwd()).items():
+        # the first calls fill caches (e.g. the PATH lookup of util.find_program)
+        measure_spawn(launch, min(calls, 10))
+        results[name] = measure_spawn(launch, calls)
+        print("%-16s median %8.1fus  p99 %8.1fus" % (name, results[name]["median"] * 1e6,
+                                                     results[name]["p99"] * 1e6), file=sys.stderr)
+    del ballast
+    return {"environment": get_environment(), "program": executable, "calls": calls, "ballast_mib": ballast_mib,
+            "scenarios": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark of the cost of starting external programs")
+    parser.add_argument("--calls", type=int, default=2000, help="Starts per launcher (default - 2000)")
+    parser.add_argument("--program", default="true", help="Program to start without arguments (default - 'true')")
+    parser.add_argument("--ballast", type=int, default=0, metavar="MIB",
+                        help="Memory to allocate before measuring, in MiB (default - 0)")
+    parser.add_argument("--output", default="-", help="Result JSON file (default - stdout)")
+    args = parser.parse_args()
+    results = run_spawn_benchmarks(args.calls, args.program, args.ballast)
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
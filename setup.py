@@ -28,7 +28,9 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/Theodikes/unpack-recursive",
     install_requires=["typing_extensions"],
-    packages=setuptools.find_packages('.', exclude='test'),
+    # in-process zstd (.zst, .tar.zst, zip method 93) is built into Python 3.14
+    extras_require={"zstd": ['backports.zstd; python_version < "3.14"']},
+    packages=setuptools.find_packages('.', exclude=['test', 'benchmarks', 'benchmarks.*']),
     entry_points={'console_scripts': ['unpack-recursive = unpack_recursive.console_app:main']},
     classifiers=[
         'Programming Language :: Python',
@@ -0,0 +1,45 @@
+"""Fixtures shared by the tests of the multi-threaded decompressors."""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from unpack_recursive.patool_unpack import extract_archive, threads
+
+
+def make_data(size, seed=0):
+    """Half compressible data, so blocks and streams have some size"""
+    rng = random.Random(seed)
+    words = b"archive unpack data value index block stream member header "
+    chunks = []
+    while sum(map(len, chunks)) < size:
+        chunks.append(rng.getrandbits(8 * 4096).to_bytes(4096, "little") + words * 40)
+    return b"".join(chunks)[:size]
+
+
+class ParallelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="unpack_recursive_test_")
+        threads.set_budget(4)
+
+    def tearDown(self):
+        threads.set_budget(None)
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as archive_file:
+            archive_file.write(data)
+        return path
+
+    def extract(self, archive, program):
+        """Extract with program, return the data of the single output file"""
+        output_dir = os.path.join(self.directory, "output")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        extract_archive(archive, verbosity=-1, output_dir=output_dir, program=program, interactive=False)
+        names = os.listdir(output_dir)
+        self.assertEqual(len(names), 1)
+        with open(os.path.join(output_dir, names[0]), "rb") as output_file:
+            return output_file.read()
@@ -0,0 +1,112 @@
+"""Tests of the multi-threaded bzip2 decompression of py_bz2."""
+import bz2
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from unpack_recursive.patool_unpack import util
+from unpack_recursive.patool_unpack.programs import py_bz2
+
+from helpers import ParallelTestCase, make_data
+
+
+class TestParallelBz2(ParallelTestCase):
+
+    def compress(self, parts):
+        """bzip2 file made by concatenating one stream per part"""
+        return self.write("data.bz2", b"".join(bz2.compress(part) for part in parts))
+
+    def test_concatenated_streams(self):
+        parts = [make_data(200 * 1024, seed) for seed in range(6)]
+        archive = self.compress(parts)
+        with mock.patch.object(py_bz2, "TASK_SIZE_BYTES", 1):
+            with open(archive, "rb") as archive_file:
+                tasks = list(py_bz2.get_stream_tasks(archive_file))
+                self.assertEqual(len(tasks), 6)
+                with tempfile.TemporaryFile(dir=self.directory) as target:
+                    self.assertTrue(py_bz2.extract_streams_parallel(archive_file, tasks, target, 4))
+                    target.seek(0)
+                    self.assertEqual(target.read(), b"".join(parts))
+            self.assertEqual(self.extract(archive, "py_bz2"), b"".join(parts))
+
+    def test_false_header_match_falls_back(self):
+        parts = [make_data(200 * 1024, seed) for seed in range(3)]
+        archive = self.compress(parts)
+        iter_stream_boundaries = py_bz2.iter_stream_boundaries
+
+        def with_false_match(fileobj, data=b""):
+            # as if the compressed data of the second stream contained a stream header by chance
+            boundaries = list(iter_stream_boundaries(fileobj, data))
+            return iter(sorted(boundaries + [(boundaries[1] + boundaries[2]) // 2]))
+
+        with mock.patch.object(py_bz2, "iter_stream_boundaries", with_false_match), \
+                mock.patch.object(py_bz2, "TASK_SIZE_BYTES", 1):
+            with open(archive, "rb") as archive_file:
+                tasks = py_bz2.get_stream_tasks(archive_file)
+                with tempfile.TemporaryFile(dir=self.directory) as target:
+                    self.assertFalse(py_bz2.extract_streams_parallel(archive_file, tasks, target, 4))
+            self.assertEqual(self.extract(archive, "py_bz2"), b"".join(parts))
+
+    def test_single_stream_reads_first_scan_only(self):
+        data = make_data(1024 * 1024)
+        archive = self.write("data.bz2", bz2.compress(data))
+        with mock.patch.object(py_bz2, "SCAN_SIZE_BYTES", 64 * 1024):
+            with open(archive, "rb") as archive_file:
+                self.assertIsNone(py_bz2.get_stream_tasks(archive_file))
+                self.assertEqual(archive_file.tell(), 64 * 1024)
+            self.assertEqual(self.extract(archive, "py_bz2"), data)
+
+    def test_scan_runs_with_tasks(self):
+        parts = [make_data(200 * 1024, seed) for seed in range(6)]
+        archive = self.compress(parts)
+        with mock.patch.object(py_bz2, "SCAN_SIZE_BYTES", 512 * 1024), \
+                mock.patch.object(py_bz2, "TASK_SIZE_BYTES", 1):
+            with open(archive, "rb") as archive_file:
+                tasks = py_bz2.get_stream_tasks(archive_file)
+                self.assertEqual(next(tasks)[:2], (0, len(bz2.compress(parts[0]))))
+                self.assertLess(archive_file.tell(), os.path.getsize(archive))
+                self.assertEqual(len(list(tasks)), 5)
+            self.assertEqual(self.extract(archive, "py_bz2"), b"".join(parts))
+
+    def test_big_stream_falls_back(self):
+        parts = [make_data(200 * 1024, seed) for seed in range(4)]
+        archive = self.compress(parts)
+        with mock.patch.object(py_bz2, "MAX_STREAM_SIZE_BYTES", len(bz2.compress(parts[2])) - 1), \
+                mock.patch.object(py_bz2, "TASK_SIZE_BYTES", 1):
+            with open(archive, "rb") as archive_file:
+                tasks = py_bz2.get_stream_tasks(archive_file)
+                with tempfile.TemporaryFile(dir=self.directory) as target:
+                    self.assertFalse(py_bz2.extract_streams_parallel(archive_file, tasks, target, 4))
+            self.assertEqual(self.extract(archive, "py_bz2"), b"".join(parts))
+
+    def test_corrupt_stream_falls_back(self):
+        parts = [make_data(200 * 1024, seed) for seed in range(3)]
+        data = bytearray(b"".join(bz2.compress(part) for part in parts))
+        second = len(bz2.compress(parts[0]))
+        data[second + 5000] ^= 0xff
+        archive = self.write("data.bz2", bytes(data))
+        with mock.patch.object(py_bz2, "TASK_SIZE_BYTES", 1):
+            with open(archive, "rb") as archive_file:
+                tasks = py_bz2.get_stream_tasks(archive_file)
+                with tempfile.TemporaryFile(dir=self.directory) as target:
+                    self.assertFalse(py_bz2.extract_streams_parallel(archive_file, tasks, target, 4))
+            with mock.patch.object(py_bz2.bz2, "BZ2File", wraps=py_bz2.bz2.BZ2File) as bz2_file:
+                with self.assertRaises(util.PatoolError):
+                    self.extract(archive, "py_bz2")
+                self.assertEqual(bz2_file.call_count, 1)
+
+    def test_task_output_limit_falls_back(self):
+        parts = [b"\x00" * (1024 * 1024) for _ in range(4)]
+        archive = self.compress(parts)
+        with mock.patch.object(py_bz2, "MAX_TASK_OUTPUT_BYTES", 512 * 1024), \
+                mock.patch.object(py_bz2, "TASK_SIZE_BYTES", 1):
+            with open(archive, "rb") as archive_file:
+                tasks = py_bz2.get_stream_tasks(archive_file)
+                with tempfile.TemporaryFile(dir=self.directory) as target:
+                    self.assertFalse(py_bz2.extract_streams_parallel(archive_file, tasks, target, 4))
+            self.assertEqual(self.extract(archive, "py_bz2"), b"".join(parts))
+
+
+if __name__ == "__main__":
+    unittest.main()
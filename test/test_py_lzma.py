@@ -0,0 +1,70 @@
+"""Tests of the multi-threaded xz decompression of py_lzma."""
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from unpack_recursive.patool_unpack import util
+from unpack_recursive.patool_unpack.programs import py_lzma
+
+from helpers import ParallelTestCase, make_data
+
+
+@unittest.skipUnless(util.find_program("xz"), "xz is not installed")
+class TestParallelXz(ParallelTestCase):
+
+    def compress(self, data, name="data.xz"):
+        """Multi-block xz file as written by xz -T"""
+        process = subprocess.run(["xz", "-T4", "--block-size=65536", "-c"], input=data, stdout=subprocess.PIPE,
+                                 check=True)
+        return self.write(name, process.stdout)
+
+    def decompress_parallel(self, archive, size):
+        with open(archive, "rb") as archive_file, tempfile.TemporaryFile(dir=self.directory) as target:
+            blocks = py_lzma.get_parallel_blocks(archive_file)
+            self.assertIsNotNone(blocks)
+            self.assertTrue(py_lzma.extract_blocks_parallel(archive_file, blocks, target, 4))
+            self.assertEqual(blocks[-1][2] + blocks[-1][4], size)
+            target.seek(0)
+            return target.read()
+
+    def test_multi_block(self):
+        data = make_data(1024 * 1024)
+        archive = self.compress(data)
+        self.assertEqual(self.decompress_parallel(archive, len(data)), data)
+        self.assertEqual(self.extract(archive, "py_lzma"), data)
+
+    def test_multi_stream_with_padding(self):
+        first, second = make_data(300 * 1024, 1), make_data(200 * 1024, 2)
+        with open(self.compress(first, "first.xz"), "rb") as first_file, \
+                open(self.compress(second, "second.xz"), "rb") as second_file:
+            # stream padding is a multiple of four null bytes, between streams and at the end
+            data = first_file.read() + b"\x00" * 8 + second_file.read() + b"\x00" * 4
+        archive = self.write("streams.xz", data)
+        with open(archive, "rb") as archive_file:
+            self.assertGreater(len(py_lzma.get_parallel_blocks(archive_file)), 4)
+        self.assertEqual(self.decompress_parallel(archive, len(first + second)), first + second)
+        self.assertEqual(self.extract(archive, "py_lzma"), first + second)
+
+    def test_corrupt_block_falls_back(self):
+        archive = self.compress(make_data(512 * 1024))
+        with open(archive, "rb") as archive_file:
+            blocks = py_lzma.get_parallel_blocks(archive_file)
+        offset, unpadded = blocks[2][:2]
+        with open(archive, "r+b") as archive_file:
+            archive_file.seek(offset + unpadded // 2)
+            byte = archive_file.read(1)
+            archive_file.seek(-1, os.SEEK_CUR)
+            archive_file.write(bytes([byte[0] ^ 0xff]))
+        with open(archive, "rb") as archive_file, tempfile.TemporaryFile(dir=self.directory) as target:
+            self.assertFalse(py_lzma.extract_blocks_parallel(archive_file, blocks, target, 4))
+        # the sequential decompression reports the error
+        with mock.patch.object(py_lzma.lzma, "LZMAFile", wraps=py_lzma.lzma.LZMAFile) as lzma_file:
+            with self.assertRaises(util.PatoolError):
+                self.extract(archive, "py_lzma")
+            self.assertEqual(lzma_file.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,18 @@
+import json
+import stat
 import sys
-from os import listdir, remove, rmdir
-from os.path import isdir, isfile, splitext, basename, join, dirname, exists
-from .patool_unpack import get_archive_format, check_archive_format, test_archive, extract_archive, ArchiveFormats
-from .patool_unpack.util import PatoolError
-from typing import Optional, Tuple, List
+import zipfile
+from os import listdir, remove, rmdir, lstat
+from os.path import isdir, isfile, splitext, basename, join, dirname, exists, getsize, normpath, isabs, pardir, sep
+from .patool_unpack import get_archive_format, check_archive_format, test_archive, extract_archive, ArchiveFormats, \
+    ArchiveCompressions
+from .patool_unpack.util import PatoolError, strip_file_extension
+from .patool_unpack import tracing, listing
+from .patool_unpack.filtering import MemberFilter
+from .patool_unpack.hashing import OutputHashes
+from .patool_unpack.dedup import OutputDedup
+from .patool_unpack.scanning import scan_output_dir
+from typing import Optional, Tuple, List, Union, TextIO
 
 if sys.version_info > (3, 7):
     from typing import Literal
@@ -13,6 +22,20 @@ else:
 
 def is_encrypted(path_to_archive: str, verbosity_level: int = 0) -> bool:
     """returns bool value - is archive password-protected or not - by path fi archive file"""
+    with tracing.span('is_encrypted', archive=path_to_archive):
+        return _probe_encryption(path_to_archive, verbosity_level)
+
+
+def _probe_encryption(path_to_archive: str, verbosity_level: int) -> bool:
+    """checks the archive with a wrong password, see 'is_encrypted'"""
+    # zip archives mark encrypted members in the central directory, which is read without decompressing
+    # anything, while testing a zip reads all of its members
+    if zipfile.is_zipfile(path_to_archive):
+        try:
+            return any(member.encrypted for member in listing.list_members(path_to_archive, 'zip'))
+        except PatoolError:
+            # an unreadable central directory, let the test report it
+            pass
     # To find out if the archive is encrypted, we will try to open the archive with the wrong password,
     # if there is no password - it will open, if there is a password - it will give an error
     try:
@@ -39,12 +62,21 @@ def get_extension_without_dot_from_path(path: str) -> Optional[str]:
     return splitext(basename(path))[1][1:] if splitext(basename(path))[1] else None
 
 
+# extensions of compressed files, checked by 'is_archive' in addition to the archive format names
+COMPRESSION_EXTENSIONS = ['gz', 'bz2', 'lz', 'xz', 'zst', 'tzst']
+
+
+def has_archive_extension(file_path: str) -> bool:
+    """returns true if the file extension is the name of an archive format or a compression extension"""
+    file_extension = get_extension_without_dot_from_path(file_path)
+    return bool(file_extension) and (file_extension in ArchiveFormats or file_extension in COMPRESSION_EXTENSIONS)
+
+
 def is_archive(file_path: str) -> bool:
     """returns true if file by specified path is supported (unpackable with patool) archive, false otherwise"""
     try:
-        file_extension = get_extension_without_dot_from_path(file_path)
         # first carry out a basic check of the file extension to immediately discard unsuitable files
-        if file_extension and (file_extension in ArchiveFormats or file_extension in ['gz', 'bz2', 'lz', 'xz']):
+        if has_archive_extension(file_path):
             # if the simple check is passed, we call patool, which will fully check if the file is an archive
             check_archive_format(*get_archive_format(file_path))
             return True
@@ -54,6 +86,55 @@ def is_archive(file_path: str) -> bool:
         return False
 
 
+# archives of formats listed with 7z that are smaller than this are scanned after extraction instead,
+# starting 7z costs more than scanning their output
+MIN_7Z_LISTING_BYTES = 1024 * 1024
+
+
+def list_nested_candidates(path: str, extract_dir: str, password: Optional[str] = None) -> Optional[List[str]]:
+    """
+    finds the extracted files with archive extensions from the member listing of the archive (zip central
+    directory, tar headers or '7z l -slt'), so that only these paths are touched in the output directory
+
+    :param str path: Path to the archive, which was extracted to extract_dir
+    :param str extract_dir: Directory the archive was extracted to
+    :param Optional[str] password: Password the archive was extracted with
+    :return: paths of the extracted regular files with archive extensions, or 'None' if the listing can't tell
+             (no cheap listing for the format, names that don't map to paths in extract_dir, duplicate names
+             that were renamed or members without user read permission), then the directory has to be scanned
+    """
+    try:
+        archive_format, compression = get_archive_format(path)
+        if archive_format in ArchiveCompressions or (archive_format == "tar" and compression is not None):
+            # single files, or listing would decompress the whole tar
+            return None
+        if not listing.can_list_in_process(archive_format, compression) and getsize(path) < MIN_7Z_LISTING_BYTES:
+            return None
+        with tracing.span('list_nested_candidates', archive=path):
+            members = listing.list_members(path, archive_format, compression, password)
+    except (PatoolError, OSError):
+        return None
+    names = set()
+    candidates = []
+    for member in members:
+        name = normpath(member.name)
+        if isabs(name) or name == pardir or name.startswith(pardir + sep) or name in names:
+            return None
+        names.add(name)
+        required = stat.S_IRUSR | stat.S_IXUSR if member.is_dir else stat.S_IRUSR
+        if member.mode is not None and member.mode & required != required:
+            return None
+        if not member.is_dir and has_archive_extension(name):
+            candidate_path = join(extract_dir, name)
+            try:
+                if stat.S_ISREG(lstat(candidate_path).st_mode):
+                    candidates.append(candidate_path)
+            except OSError:
+                # extracted under another name
+                return None
+    return candidates
+
+
 def get_result_extract_dir_renamed_path(archive_extract_dir: str) -> str:
     """
     creates a unique path to the resulting directory so that it does not match other folder or file paths
@@ -66,7 +147,7 @@ def get_result_extract_dir_renamed_path(archive_extract_dir: str) -> str:
     dir_number = 1
     # generate names by incrementing the number at the end, e.g. 'folder_1', 'folder_2' and so on
     archive_extract_dir_renamed = archive_extract_dir + "_" + str(dir_number)
-    while isdir(archive_extract_dir_renamed):
+    while exists(archive_extract_dir_renamed):
         dir_number += 1
         archive_extract_dir_renamed = archive_extract_dir + "_" + str(dir_number)
 
@@ -76,7 +157,10 @@ def get_result_extract_dir_renamed_path(archive_extract_dir: str) -> str:
 def unpack_recursive(path: str, encrypted_files_action: Literal["skip", "default", "manually"] = "skip",
                      default_passwords: Tuple[str] = (), remove_after_unpacking: bool = False,
                      result_directory_exists_action: Literal["skip", "rename", "overwrite"] = "rename",
-                     verbosity_level: int = 0) -> Optional[str]:
+                     verbosity_level: int = 0, dry_run: bool = False, include: Tuple[str] = (),
+                     exclude: Tuple[str] = (), hash_manifest: Optional[str] = None,
+                     dedup: Optional[Literal["auto", "reflink", "hardlink"]] = None
+                     ) -> Union[Optional[str], "UnpackPlan"]:
     """
     Unpacks the specified archive or all archives in the specified folder and their subfolders
 
@@ -97,21 +181,77 @@ def unpack_recursive(path: str, encrypted_files_action: Literal["skip", "default
     :param int verbosity_level: Logging to user in console: -1 - completely absent, 0 - only errors,
                                        1 - all important information (default - 0)
 
+    :param bool dry_run: Don't extract anything, only detect and list the archives (nested ones too, where
+                                       the listing allows it) and return the plan with estimated totals,
+                                       see 'plan_unpack'
+
+    :param Tuple[str] include: Glob patterns of the files to extract from archives, e.g. '*.log' (patterns with a
+                                       '/' are matched against the path in the archive, others against the file
+                                       name); if empty, all files are extracted. Nested archives are always
+                                       extracted, so the files in them are found too
+
+    :param Tuple[str] exclude: Glob patterns of the files not to extract from archives, like include
+
+    :param Optional[str] hash_manifest: Path of a JSON Lines file to append one record per extracted file to: its
+                                       path, size, SHA-256 and the chain of archives it came from (outermost
+                                       first); the files are hashed while they are written where the format
+                                       allows it, else in the pass over the output that fixes permissions
+
+    :param Optional[Literal["auto", "reflink", "hardlink"]] dedup: Replace extracted files identical to one extracted
+                                       before in this run (same size and SHA-256) with a reflink (copy-on-write,
+                                       on file systems like Btrfs or XFS) or a hard link to it; 'auto' uses reflinks
+                                       where possible. Zip members whose size and CRC-32 match a file extracted
+                                       from a zip before are linked without decompressing them. Default - None
+                                       (no deduplication)
+
     :returns: path to the folder where the archive was unpacked, or to the root folder
-              where the archives were located or 'None', if unpacking fails
+              where the archives were located or 'None', if unpacking fails; the plan if dry_run is set
     :rtype: Optional[string]
     :raise: Nothing, return None if anything goes wrong
     """
 
+    if dry_run:
+        return plan_unpack(path, encrypted_files_action)
+    member_filter = MemberFilter(include, exclude, keep=has_archive_extension)
+    output_dedup = OutputDedup(dedup) if dedup is not None else None
+    if hash_manifest is None:
+        return _unpack_recursive_span(path, encrypted_files_action, default_passwords, remove_after_unpacking,
+                                      result_directory_exists_action, verbosity_level, member_filter, None,
+                                      output_dedup, [])
+    with open(hash_manifest, "a", encoding="utf-8") as manifest:
+        return _unpack_recursive_span(path, encrypted_files_action, default_passwords, remove_after_unpacking,
+                                      result_directory_exists_action, verbosity_level, member_filter, manifest,
+                                      output_dedup, [])
+
+
+def _unpack_recursive_span(path: str, encrypted_files_action: Literal["skip", "default", "manually"],
+                           default_passwords: Tuple[str], remove_after_unpacking: bool,
+                           result_directory_exists_action: Literal["skip", "rename", "overwrite"],
+                           verbosity_level: int, member_filter: MemberFilter, manifest: Optional[TextIO],
+                           output_dedup: Optional[OutputDedup], sources: List[str]) -> Optional[str]:
+    with tracing.span('unpack_recursive', path=path):
+        return _unpack_recursive(path, encrypted_files_action, default_passwords, remove_after_unpacking,
+                                 result_directory_exists_action, verbosity_level, member_filter, manifest,
+                                 output_dedup, sources)
+
+
+def _unpack_recursive(path: str, encrypted_files_action: Literal["skip", "default", "manually"],
+                      default_passwords: Tuple[str], remove_after_unpacking: bool,
+                      result_directory_exists_action: Literal["skip", "rename", "overwrite"],
+                      verbosity_level: int, member_filter: MemberFilter, manifest: Optional[TextIO],
+                      output_dedup: Optional[OutputDedup], sources: List[str]) -> Optional[str]:
+    """Implementation of 'unpack_recursive', wrapped in a tracing span; manifest is the open hash manifest,
+    output_dedup the index of the files extracted in this run, sources the archives path was extracted from"""
     try:
         # If the path is a directory, recursively call the same function for all subfolders
         if isdir(path):
             # List for the result paths of all unpacked archives from the current directory
             unpacked_subpaths: List[Optional[str]] = []
             for sub_path in listdir(path):
-                sub_result_path = unpack_recursive(join(path, sub_path), encrypted_files_action, default_passwords,
-                                                   remove_after_unpacking, result_directory_exists_action,
-                                                   verbosity_level)
+                sub_result_path = _unpack_recursive_span(join(path, sub_path), encrypted_files_action,
+                                                         default_passwords, remove_after_unpacking,
+                                                         result_directory_exists_action, verbosity_level,
+                                                         member_filter, manifest, output_dedup, sources)
                 unpacked_subpaths.append(sub_result_path)
             # Return the path to the source (input) directory, since all the archives in it will be unpacked inside it
             # If no archives in source directory, or all archives were skipped / unpacked incorrectly, return None
@@ -119,6 +259,11 @@ def unpack_recursive(path: str, encrypted_files_action: Literal["skip", "default
 
         # If the file is an archive, try to unpack it
         elif isfile(path) and is_archive(path):
+            # the single file in e.g. a '.csv.gz' is not decompressed if the filters don't select it
+            if member_filter and get_archive_format(path)[0] in ArchiveCompressions and \
+                    not member_filter(strip_file_extension(path)):
+                return None
+
             # The final folder where the archive is unpacked - root folder + name of the archive without extension
             # For example, for a 'test.tar' archive, all unpacked files will be in the '/test' folder
             # in the same directory as the archive
@@ -156,10 +301,12 @@ def unpack_recursive(path: str, encrypted_files_action: Literal["skip", "default
                     return None
 
             # Handle the situation if the directory with the archive name already exists
-            if isdir(archive_extract_dir):
+            # (the path may also be taken by a file, e.g. 'test.tar' next to 'test.tar.gz',
+            # files are never overwritten, the directory is renamed instead)
+            if exists(archive_extract_dir):
                 if verbosity_level > 0:
                     print("dir already exists " + archive_extract_dir)
-                if result_directory_exists_action == "rename":
+                if result_directory_exists_action == "rename" or not isdir(archive_extract_dir):
                     archive_extract_dir = get_result_extract_dir_renamed_path(archive_extract_dir)
                 elif result_directory_exists_action == "overwrite":
                     rmdir(archive_extract_dir)
@@ -167,8 +314,20 @@ def unpack_recursive(path: str, encrypted_files_action: Literal["skip", "default
                     return None
 
             try:
+                output_hashes = None
+                if manifest is not None or output_dedup is not None:
+                    output_hashes = OutputHashes(dedup=output_dedup, is_candidate=has_archive_extension)
                 extract_archive(path, output_dir=archive_extract_dir, existing_action=result_directory_exists_action,
-                                password=default_password if is_archive_encrypted else None, verbosity=verbosity_level)
+                                password=default_password if is_archive_encrypted else None, verbosity=verbosity_level,
+                                member_filter=member_filter, output_hashes=output_hashes)
+                if manifest is not None:
+                    write_manifest_records(manifest, archive_extract_dir, output_hashes, sources + [path])
+                # nested archives are found from the listing of the archive, so archives without them
+                # don't cost a traversal of their output, unless the output was scanned for hashing anyway
+                candidate_paths = output_hashes.candidates if output_hashes is not None else None
+                if candidate_paths is None:
+                    candidate_paths = list_nested_candidates(path, archive_extract_dir,
+                                                             default_password if is_archive_encrypted else None)
                 if remove_after_unpacking:
                     remove(path)
 
@@ -182,9 +341,14 @@ def unpack_recursive(path: str, encrypted_files_action: Literal["skip", "default
                     print(e)
                 return None
 
-            # start searching for archives in the folder with the elements of the just unpacked archive
-            unpack_recursive(archive_extract_dir, encrypted_files_action, default_passwords, remove_after_unpacking,
-                             result_directory_exists_action, verbosity_level)
+            # otherwise one pass over the elements of the just unpacked archive adds missing read permissions
+            # and finds the files with archive extensions, only those are checked for nested archives
+            if candidate_paths is None:
+                candidate_paths = scan_output_dir(archive_extract_dir, has_archive_extension).candidates
+            for candidate_path in candidate_paths:
+                _unpack_recursive_span(candidate_path, encrypted_files_action, default_passwords,
+                                       remove_after_unpacking, result_directory_exists_action, verbosity_level,
+                                       member_filter, manifest, output_dedup, sources + [path])
 
             return archive_extract_dir
 
@@ -195,6 +359,23 @@ def unpack_recursive(path: str, encrypted_files_action: Literal["skip", "default
             print(e)
 
 
-# If the project is installed as a module, only the 'unpack_recursive' and is_archive functions
-# is available for external use.
-__all__ = [unpack_recursive, is_archive]
+def write_manifest_records(manifest: TextIO, extract_dir: str, output_hashes: OutputHashes,
+                           sources: List[str]) -> None:
+    """Write a JSON line for each file hashed while extracting the last of sources into extract_dir; files linked
+    to an identical one by size and CRC-32 alone (see 'dedup') are marked, their hash was not computed"""
+    for name, (size, digest) in output_hashes.items():
+        record = {"path": join(extract_dir, name), "size": size, output_hashes.algorithm: digest, "sources": sources}
+        if output_hashes.is_crc_match(name):
+            record["crc32_match"] = True
+        manifest.write(json.dumps(record) + "\n")
+
+
+from .planning import plan_unpack, UnpackPlan
+from .streaming import iter_leaf_files, LeafFile
+from .indexing import build_index, search_index, IndexedMember
+from .access import open_nested, LayerCache
+
+# If the project is installed as a module, only the 'unpack_recursive', is_archive, plan_unpack, iter_leaf_files,
+# build_index, search_index and open_nested functions and the types of their results are available for external use.
+__all__ = ['unpack_recursive', 'is_archive', 'plan_unpack', 'UnpackPlan', 'iter_leaf_files', 'LeafFile', 'build_index',
+           'search_index', 'IndexedMember', 'open_nested', 'LayerCache']
@@ -0,0 +1,278 @@
+"""
+Random access to single files deep inside nested archives: 'open_nested' opens only the members on the way to the
+file (zip members are found from the central directory, tar members by skipping from header to header) and keeps
+the decompressed nested archives in an LRU cache, so later lookups in the same container start from there.
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack
+from os.path import abspath, isdir, join, basename
+from typing import BinaryIO, Optional, Tuple
+
+from .planning import NESTED_SEPARATOR, get_member_archive_format
+from .streaming import SINGLE_FILE_FORMATS, can_stream, open_single_file
+from .patool_unpack import get_archive_format, extract_archive, tracing
+from .patool_unpack.filtering import normalize_member_name
+from .patool_unpack.util import PatoolError, strip_file_extension
+
+try:
+    # backports of the Python 3.14 modules, which read zstd compressed data
+    from backports.zstd import tarfile, zipfile
+except ImportError:
+    import tarfile
+    import zipfile
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class LayerCache(object):
+    """LRU cache of decompressed nested archives (layers), kept in memory or, if scratch_dir is given, as files in
+    it; layers are evicted when all of them together exceed max_bytes, bigger layers are not cached at all"""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES, scratch_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.scratch_dir = scratch_dir
+        # key -> (bytes or file path, size)
+        self._layers = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def bytes(self) -> int:
+        """Size of all cached layers"""
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._layers)
+
+    def get(self, key: tuple) -> Optional[BinaryIO]:
+        """A seekable file object of the cached layer, None if it's not cached"""
+        with self._lock:
+            entry = self._layers.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._layers.move_to_end(key)
+            self.hits += 1
+            data = entry[0]
+            # opened under the lock, so an eviction can't remove the file first
+            return io.BytesIO(data) if isinstance(data, bytes) else open(data, "rb")
+
+    def put(self, key: tuple, fileobj: BinaryIO) -> BinaryIO:
+        """Read fileobj to its end into the cache, return a seekable file object of the data
+        (of a temporary copy if the layer is too big for the cache)"""
+        if self.scratch_dir is None:
+            spooled = tempfile.SpooledTemporaryFile(max_size=self.max_bytes)
+            shutil.copyfileobj(fileobj, spooled, 1024 * 1024)
+            size = spooled.tell()
+            if size > self.max_bytes:
+                spooled.seek(0)
+                return spooled
+            spooled.seek(0)
+            data = spooled.read()
+            spooled.close()
+            self._add(key, data, size)
+            return io.BytesIO(data)
+        descriptor, path = tempfile.mkstemp(prefix="layer_", dir=self.scratch_dir)
+        layer = os.fdopen(descriptor, "w+b")
+        shutil.copyfileobj(fileobj, layer, 1024 * 1024)
+        size = layer.tell()
+        layer.seek(0)
+        if size > self.max_bytes:
+            # only this open file object still refers to it
+            os.remove(path)
+            return layer
+        self._add(key, path, size)
+        return layer
+
+    def _add(self, key: tuple, data, size: int) -> None:
+        with self._lock:
+            if key in self._layers:
+                self._remove(key)
+            while self._layers and self._bytes + size > self.max_bytes:
+                self._remove(next(iter(self._layers)))
+            self._layers[key] = (data, size)
+            self._bytes += size
+
+    def _remove(self, key: tuple) -> None:
+        data, size = self._layers.pop(key)
+        self._bytes -= size
+        if not isinstance(data, bytes):
+            try:
+                os.remove(data)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        """Remove all layers"""
+        with self._lock:
+            while self._layers:
+                self._remove(next(iter(self._layers)))
+
+
+# used by 'open_nested' if no cache is given
+DEFAULT_CACHE = LayerCache()
+
+
+class NestedFile(object):
+    """File object of a member returned by 'open_nested', closing it also closes the archives it was read from"""
+
+    def __init__(self, fileobj: BinaryIO, stack: ExitStack):
+        self._fileobj = fileobj
+        self._stack = stack
+
+    def __getattr__(self, name: str):
+        return getattr(self._fileobj, name)
+
+    def __iter__(self):
+        return iter(self._fileobj)
+
+    def close(self) -> None:
+        self._stack.close()
+
+    def __enter__(self) -> "NestedFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def open_nested(path: str, member_path: Optional[str] = None, password: Optional[str] = None,
+                cache: Optional[LayerCache] = None) -> NestedFile:
+    """
+    Opens one file inside (nested) archives without extracting anything else
+
+    :param str path: Logical path of the file, e.g. 'backup.tar.gz!/app.zip!/conf.zip!/x.cfg' (as yielded by
+                     'iter_leaf_files' or found by 'search_index'), or a folder or archive if member_path is given
+    :param Optional[str] member_path: Logical path of the file relative to the folder, or inside the archive
+    :param Optional[str] password: Password of encrypted members
+    :param Optional[LayerCache] cache: Cache of the decompressed nested archives (default - a process wide cache
+                                       of up to 256 MiB in memory)
+    :returns: a readable file object of the file, to be closed by the caller
+    :raise: PatoolError if a member does not exist or an archive can't be read
+    """
+    if member_path is not None:
+        path = join(path, member_path) if isdir(path) else path + NESTED_SEPARATOR + member_path
+    archive_path, *members = path.split(NESTED_SEPARATOR)
+    if not members:
+        raise PatoolError(f"{path} is no path inside an archive")
+    members = [normalize_member_name(name) for name in members]
+    cache = DEFAULT_CACHE if cache is None else cache
+    with tracing.span("open_nested", path=path):
+        stack = ExitStack()
+        try:
+            return _open_nested(stack, archive_path, members, password, cache)
+        except BaseException:
+            stack.close()
+            raise
+
+
+def _open_nested(stack: ExitStack, archive_path: str, members: list, password: Optional[str],
+                 cache: LayerCache) -> NestedFile:
+    fileobj = stack.enter_context(open(archive_path, "rb"))
+    stat_result = os.fstat(fileobj.fileno())
+    key: Tuple = (abspath(archive_path), stat_result.st_size, stat_result.st_mtime_ns)
+    # start from the innermost cached layer
+    start = 0
+    for depth in range(len(members) - 1, 0, -1):
+        layer = cache.get(key + tuple(members[:depth]))
+        if layer is not None:
+            stack.close()
+            fileobj = stack.enter_context(layer)
+            start = depth
+            break
+    if start == 0:
+        archive_format, compression = get_archive_format(archive_path)
+    else:
+        archive_format, compression = get_member_archive_format(members[start - 1])
+    container = NESTED_SEPARATOR.join([archive_path] + members[:start])
+    for depth in range(start, len(members)):
+        name = members[depth]
+        member_fileobj = _open_member(stack, fileobj, archive_format, compression, name, container,
+                                      archive_path if depth == 0 else None, password)
+        container += NESTED_SEPARATOR + name
+        if depth == len(members) - 1:
+            return NestedFile(member_fileobj, stack)
+        member_format = get_member_archive_format(name)
+        if member_format is None:
+            raise PatoolError(f"{container} is no archive")
+        archive_format, compression = member_format
+        layer = cache.put(key + tuple(members[:depth + 1]), member_fileobj)
+        # the outer layers are not needed anymore
+        stack.close()
+        fileobj = stack.enter_context(layer)
+
+
+def _open_member(stack: ExitStack, fileobj: BinaryIO, archive_format: str, compression: Optional[str], name: str,
+                 container: str, archive_file: Optional[str], password: Optional[str]) -> BinaryIO:
+    """Open the named member of the archive read from fileobj (archive_file is its path, if it's a file on disk)"""
+    try:
+        if archive_format == "zip" and compression is None:
+            return _open_zip_member(stack, fileobj, name, password)
+        if archive_format == "tar" and can_stream(archive_format, compression):
+            return _open_tar_member(stack, fileobj, name)
+        if archive_format in SINGLE_FILE_FORMATS and can_stream(archive_format, compression):
+            if name != strip_file_extension(container):
+                raise KeyError(name)
+            return stack.enter_context(open_single_file(fileobj, archive_format))
+    except KeyError:
+        raise PatoolError(f"there is no member {name} in {container}")
+    except (OSError, EOFError, RuntimeError, zipfile.BadZipFile, tarfile.TarError) as error:
+        raise PatoolError(f"error reading {container}: {error}")
+    return _extract_member(stack, fileobj, name, container, archive_file, password)
+
+
+def _open_zip_member(stack: ExitStack, fileobj: BinaryIO, name: str, password: Optional[str]) -> BinaryIO:
+    zfile = stack.enter_context(zipfile.ZipFile(fileobj))
+    try:
+        info = zfile.getinfo(name)
+    except KeyError:
+        # e.g. stored as './name'
+        info = next((info for info in zfile.infolist()
+                     if not info.is_dir() and normalize_member_name(info.filename) == name), None)
+        if info is None:
+            raise
+    pwd = password.encode() if password and info.flag_bits & 0x1 else None
+    return stack.enter_context(zfile.open(info, pwd=pwd))
+
+
+def _open_tar_member(stack: ExitStack, fileobj: BinaryIO, name: str) -> BinaryIO:
+    tfile = stack.enter_context(tarfile.open(fileobj=fileobj, mode="r:*"))
+    # header by header instead of getmember(), which reads the whole archive first
+    info = tfile.next()
+    while info is not None and (info.isdir() or normalize_member_name(info.name) != name):
+        info = tfile.next()
+    member_fileobj = tfile.extractfile(info) if info is not None else None
+    if member_fileobj is None:
+        raise KeyError(name)
+    return stack.enter_context(member_fileobj)
+
+
+def _extract_member(stack: ExitStack, fileobj: BinaryIO, name: str, container: str, archive_file: Optional[str],
+                    password: Optional[str]) -> BinaryIO:
+    """Extract only the named member with an external program (formats the Python modules can't read)"""
+    scratch = tempfile.mkdtemp(prefix="unpack_recursive_")
+    try:
+        if archive_file is None:
+            archive_file = join(scratch, basename(container))
+            with open(archive_file, "wb") as copy:
+                shutil.copyfileobj(fileobj, copy, 1024 * 1024)
+        output_dir = join(scratch, "output")
+        extract_archive(archive_file, verbosity=-1, output_dir=output_dir, interactive=False, password=password,
+                        member_filter=lambda member_name: normalize_member_name(member_name) == name)
+        member_file = join(output_dir, name)
+        if not os.path.isfile(member_file) or os.path.islink(member_file):
+            raise PatoolError(f"there is no member {name} in {container}")
+        member_fileobj = stack.enter_context(tempfile.SpooledTemporaryFile(max_size=DEFAULT_CACHE_BYTES))
+        with open(member_file, "rb") as extracted:
+            shutil.copyfileobj(extracted, member_fileobj, 1024 * 1024)
+        member_fileobj.seek(0)
+        return member_fileobj
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
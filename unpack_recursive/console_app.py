@@ -1,4 +1,5 @@
-from .__init__ import unpack_recursive, is_archive
+from .__init__ import unpack_recursive, is_archive, plan_unpack, build_index, search_index
+from .patool_unpack import tracing, resources, tuning, threads
 from os.path import isdir
 
 
@@ -21,8 +22,131 @@ def main():
     parser.add_argument("-l", "--log-level", type=int, choices=[-1, 0, 1], default=0,
                         help="Logging level: -1 - completely absent, 0 - only errors, "
                              "1 - all important information (default - 0)", )
+    parser.add_argument("--include", type=str, nargs="+", default=(), metavar="PATTERN",
+                        help="extract only the files matching these glob patterns from archives, e.g. '*.log' "
+                             "(patterns with a '/' are matched against the path in the archive, others against "
+                             "the file name); nested archives are always extracted")
+    parser.add_argument("--exclude", type=str, nargs="+", default=(), metavar="PATTERN",
+                        help="don't extract the files matching these glob patterns from archives (nested "
+                             "archives are always extracted)")
+    parser.add_argument("--hash-manifest", type=str, default=None, metavar="FILE",
+                        help="write path, size, SHA-256 and source archives of every extracted file to this JSON "
+                             "Lines file, hashed while the files are written")
+    parser.add_argument("--dedup", type=str, nargs="?", const="auto", default=None,
+                        choices=["auto", "reflink", "hardlink"],
+                        help="replace extracted files identical to one extracted before with a reflink or a hard "
+                             "link to it (default method - 'auto': reflinks where the file system supports them, "
+                             "else hard links)")
+    parser.add_argument("-t", "--threads", type=int, default=None, metavar="THREADS",
+                        help="number of threads all archiver programs may use together, divided among the "
+                             "ones running at the same time (default - $UNPACK_RECURSIVE_THREADS or the number "
+                             "of CPUs)")
+    parser.add_argument("--trace", type=str, default=None, metavar="TRACE FILE",
+                        help="write timings of all unpacking phases to this file in Chrome trace-event format "
+                             "(can be opened in chrome://tracing or ui.perfetto.dev)")
+    parser.add_argument("--resource-summary", type=str, nargs="?", const="-", default=None, metavar="JSON FILE",
+                        help="print wall time, CPU time, max RSS and block I/O of all archiver runs, aggregated "
+                             "per program and per format, or write them to a JSON file if a path is given")
+    parser.add_argument("--plan", type=str, nargs="?", const="-", default=None, metavar="JSON FILE",
+                        help="don't unpack anything, only list the archives (nested ones too, where possible) and "
+                             "print the estimated number of files and bytes after unpacking, the nesting depth and "
+                             "the program used for each format, or write the full plan to a JSON file if a path "
+                             "is given")
+    parser.add_argument("--index", type=str, default=None, metavar="DATABASE",
+                        help="don't unpack anything, record the members of all archives (nested ones too, where "
+                             "possible) in this SQLite database; archives that didn't change since the last run "
+                             "are not listed again")
+    parser.add_argument("--search", type=str, default=None, metavar="PATTERN",
+                        help="print the members matching this glob pattern (matched against the path in the "
+                             "archive if it contains a '/', else against the file name) from the --index database, "
+                             "after indexing the input paths, if any")
+    parser.add_argument("--autotune", action="store_true", default=False,
+                        help="measure which installed program unpacks each archive format fastest on this machine "
+                             "and save the ranking, which is then used by all later runs (takes a few minutes)")
     args = parser.parse_args()
+    if args.search and not args.index:
+        parser.error("--search requires --index")
+    if args.threads is not None:
+        threads.set_budget(args.threads)
 
+    if args.autotune:
+        tuning.autotune(log=print if args.log_level > 0 else None)
+        print(f"Program preferences saved to {tuning.get_preferences_filename()}")
+    if not args.input_paths:
+        if args.search:
+            search_input_paths(args)
+        elif not args.autotune:
+            parser.error("at least one input path is required")
+        return
+
+    if args.trace:
+        tracing.enable()
+    try:
+        if args.plan:
+            plan_input_paths(args)
+        elif args.index:
+            index_input_paths(args)
+            if args.search:
+                search_input_paths(args)
+        else:
+            unpack_input_paths(args)
+    finally:
+        if args.trace:
+            tracing.disable().write_chrome_trace(args.trace)
+        if args.resource_summary:
+            write_resource_summary(args.resource_summary)
+
+
+def write_resource_summary(destination):
+    """Print resource usage summary of all archiver runs ('-') or save it as JSON"""
+    if destination == "-":
+        print(resources.format_summary())
+        return
+    import json
+    with open(destination, "w") as summary_file:
+        json.dump(resources.get_summary(), summary_file, indent=2)
+
+
+def plan_input_paths(args):
+    """Print the plans (or save them as JSON) of all input paths from parsed command line arguments"""
+    plans = []
+    for start_path in args.input_paths:
+        if not (isdir(start_path) or is_archive(start_path)):
+            raise Exception("Input path must be a folder or an archive, but got: " + start_path)
+        plan = plan_unpack(start_path, encrypted_files_action=args.password_protected_action)
+        if args.plan == "-":
+            print(f"Plan for [{start_path}]:")
+            print(plan.format(args.log_level))
+        plans.append(plan.as_dict())
+    if args.plan != "-":
+        import json
+        with open(args.plan, "w") as plan_file:
+            json.dump(plans, plan_file, indent=2)
+
+
+def index_input_paths(args):
+    """Add the archives of all input paths from parsed command line arguments to the index database"""
+    for start_path in args.input_paths:
+        if not (isdir(start_path) or is_archive(start_path)):
+            raise Exception("Input path must be a folder or an archive, but got: " + start_path)
+        stats = build_index(start_path, args.index, password=(args.default_passwords or [None])[0])
+        if args.log_level >= 0:
+            print(f"Indexed [{start_path}]: {stats.archives} archives ({stats.listed} listed, {stats.unchanged} "
+                  f"unchanged, {stats.removed} removed, {stats.errors} errors), {stats.members} members recorded")
+
+
+def search_input_paths(args):
+    """Print the members matching the search pattern from parsed command line arguments"""
+    for member in search_index(args.index, args.search):
+        size = "?" if member.size is None else str(member.size)
+        print(f"{member.path}\t{size}" if args.log_level > 0 else member.path)
+
+
+def unpack_input_paths(args):
+    """Unpack all input paths from parsed command line arguments"""
+    if args.hash_manifest:
+        # the records of all input paths are appended to it
+        open(args.hash_manifest, "w").close()
     for start_path in args.input_paths:
         if not (isdir(start_path) or is_archive(start_path)):
             raise Exception("Input path must be a folder or an archive, but got: " + start_path)
@@ -30,7 +154,9 @@ def main():
         result_dir = unpack_recursive(start_path, remove_after_unpacking=args.remove,
                                       default_passwords=args.default_passwords, verbosity_level=args.log_level,
                                       encrypted_files_action=args.password_protected_action,
-                                      result_directory_exists_action=args.existing_directory_action)
+                                      result_directory_exists_action=args.existing_directory_action,
+                                      include=args.include, exclude=args.exclude, hash_manifest=args.hash_manifest,
+                                      dedup=args.dedup)
         if args.log_level > 0:
             if not result_dir:
                 print(f"Unpacking of [{start_path} failed")
@@ -0,0 +1,232 @@
+"""
+Persistent index of archive members: walks a tree like 'plan_unpack' does, lists every archive (and the archives
+nested in zip, tar, gzip and xz archives) and records all members in a SQLite database, so questions like
+"which archive contains file X" are answered without unpacking anything. Archives whose size and modification
+time did not change since the last run are not listed again.
+"""
+import os
+import sqlite3
+import time
+from contextlib import closing
+from os.path import isdir, isfile, join, abspath
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from . import is_archive
+from .planning import NESTED_SEPARATOR, DEFAULT_MAX_NESTED_BYTES, get_member_archive_format
+from .patool_unpack import get_archive_format, listing, tracing
+from .patool_unpack.filtering import normalize_member_name
+from .patool_unpack.util import PatoolError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    indexed_at REAL NOT NULL,
+    members INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS members (
+    archive TEXT NOT NULL REFERENCES archives(path) ON DELETE CASCADE,
+    container TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER,
+    crc INTEGER,
+    mtime REAL,
+    is_dir INTEGER NOT NULL,
+    encrypted INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS members_filename ON members (filename);
+CREATE INDEX IF NOT EXISTS members_archive ON members (archive);
+CREATE INDEX IF NOT EXISTS members_crc ON members (crc);
+"""
+
+
+class IndexedMember(NamedTuple):
+    """One member of an indexed archive; container is the logical path of the archive it is in
+    ('outer.zip!/inner.tar.gz'), depth 1 for members of the archive file itself"""
+    archive: str
+    container: str
+    depth: int
+    name: str
+    size: Optional[int]
+    crc: Optional[int]
+    mtime: Optional[float]
+    is_dir: bool
+    encrypted: bool
+
+    @property
+    def path(self) -> str:
+        """Logical path of the member, e.g. 'outer.zip!/inner.tar.gz!/dir/file.txt'"""
+        return self.container + NESTED_SEPARATOR + self.name
+
+    @property
+    def containers(self) -> List[str]:
+        """The chain of archives the member is in, outermost first"""
+        parts = self.container.split(NESTED_SEPARATOR)
+        return [NESTED_SEPARATOR.join(parts[:number]) for number in range(1, len(parts) + 1)]
+
+
+class IndexStats(NamedTuple):
+    """Result of 'build_index'"""
+    archives: int
+    listed: int
+    unchanged: int
+    removed: int
+    members: int
+    errors: int
+
+
+def connect(database: str) -> sqlite3.Connection:
+    """Open (and create, if needed) an index database"""
+    connection = sqlite3.connect(database)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def build_index(path: str, database: str, password: Optional[str] = None,
+                max_nested_bytes: int = DEFAULT_MAX_NESTED_BYTES) -> IndexStats:
+    """
+    Records the members of an archive or of all archives in a folder (nested archives included) in the database,
+    archives indexed before are listed again only if their size or modification time changed
+
+    :param str path: Path to archive or folder with archives, as for 'unpack_recursive'
+    :param str database: Path of the SQLite database, created if it doesn't exist
+    :param Optional[str] password: Password for archives with encrypted headers
+    :param int max_nested_bytes: Nested archives bigger than this are not listed, as for 'plan_unpack'
+    :returns: numbers of archives found, listed, unchanged and removed (archives in path that are gone since
+              the last run), of recorded members and of archives that could not be listed
+    """
+    archives = listed = unchanged = members = errors = 0
+    seen = set()
+    with tracing.span("build_index", path=path), closing(connect(database)) as connection:
+        for archive_path in _iter_archives(path):
+            archives += 1
+            seen.add(archive_path)
+            stat_result = os.stat(archive_path)
+            # archives that could not be listed are tried again
+            row = connection.execute("SELECT size, mtime_ns FROM archives WHERE path = ? AND error IS NULL",
+                                     (archive_path,)).fetchone()
+            if row == (stat_result.st_size, stat_result.st_mtime_ns):
+                unchanged += 1
+                continue
+            records, error = _list_archive(archive_path, password, max_nested_bytes)
+            listed += 1
+            members += len(records)
+            errors += error is not None
+            # one transaction per archive, so an interrupted run keeps what was indexed
+            with connection:
+                connection.execute("DELETE FROM archives WHERE path = ?", (archive_path,))
+                connection.execute("INSERT INTO archives VALUES (?, ?, ?, ?, ?, ?)",
+                                   (archive_path, stat_result.st_size, stat_result.st_mtime_ns, time.time(),
+                                    len(records), error))
+                connection.executemany("INSERT INTO members VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       [(archive_path,) + record for record in records])
+        removed = _remove_missing(connection, abspath(path), seen)
+    return IndexStats(archives, listed, unchanged, removed, members, errors)
+
+
+def _iter_archives(path: str) -> Iterator[str]:
+    """Absolute paths of the archives in path"""
+    if isdir(path):
+        for root, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                file_path = join(root, filename)
+                if is_archive(file_path):
+                    yield abspath(file_path)
+    elif isfile(path) and is_archive(path):
+        yield abspath(path)
+
+
+def _remove_missing(connection: sqlite3.Connection, root: str, seen: set) -> int:
+    """Delete the archives in root that were not found by this run"""
+    prefix = root.rstrip(os.sep) + os.sep
+    stale = [archive_path for archive_path, in connection.execute("SELECT path FROM archives")
+             if (archive_path == root or archive_path.startswith(prefix)) and archive_path not in seen]
+    with connection:
+        connection.executemany("DELETE FROM archives WHERE path = ?", [(archive_path,) for archive_path in stale])
+    return len(stale)
+
+
+def _list_archive(path: str, password: Optional[str],
+                  max_nested_bytes: int) -> Tuple[List[tuple], Optional[str]]:
+    """Member records of an archive file and its nested archives, and the first listing error"""
+    records: List[tuple] = []
+    try:
+        archive_format, compression = get_archive_format(path)
+        if listing.can_list_in_process(archive_format, compression):
+            with open(path, "rb") as fileobj:
+                return records, _list_nested(records, path, 1, fileobj, archive_format, compression,
+                                             max_nested_bytes)
+        _add_records(records, path, 1, listing.list_members(path, archive_format, compression, password))
+    except PatoolError as error:
+        return records, str(error)
+    return records, None
+
+
+def _list_nested(records: List[tuple], container: str, depth: int, fileobj, archive_format: str,
+                 compression: Optional[str], max_nested_bytes: int) -> Optional[str]:
+    """Add the members of the archive read from fileobj and, recursively, of the archives nested in it"""
+    first_error = None
+    with listing.open_listing(fileobj, container, archive_format, compression) as archive_listing:
+        _add_records(records, container, depth, archive_listing.members)
+        for member in archive_listing.members:
+            if member.is_dir or member.encrypted or member.size is None or member.size > max_nested_bytes:
+                continue
+            member_format = get_member_archive_format(member.name)
+            if member_format is None or not listing.can_list_in_process(*member_format):
+                continue
+            member_path = container + NESTED_SEPARATOR + normalize_member_name(member.name)
+            try:
+                with archive_listing.open(member.name) as member_fileobj:
+                    error = _list_nested(records, member_path, depth + 1, member_fileobj, member_format[0],
+                                         member_format[1], max_nested_bytes)
+            except Exception as error_opening:
+                # e.g. a file with an archive extension that is no archive
+                error = str(error_opening)
+            first_error = first_error or error
+    return first_error
+
+
+def _add_records(records: List[tuple], container: str, depth: int, members: List[listing.Member]) -> None:
+    for member in members:
+        name = normalize_member_name(member.name)
+        if not name:
+            # the './' entry of tars
+            continue
+        records.append((container, depth, name, name.rsplit("/", 1)[-1], member.size, member.crc, member.mtime,
+                        int(member.is_dir), int(bool(member.encrypted))))
+
+
+def search_index(database: str, pattern: str, crc: Optional[int] = None, limit: Optional[int] = None
+                 ) -> List[IndexedMember]:
+    """
+    Finds members in an index built by 'build_index'
+
+    :param str database: Path of the SQLite database
+    :param str pattern: Glob pattern (case-sensitive, '*', '?' and '[...]'), matched against the member path inside
+                        its archive if it contains a '/', against the file name otherwise
+    :param Optional[int] crc: Only members with this CRC-32 (where the format records it)
+    :param Optional[int] limit: Return at most this many members
+    :returns: the matching members, ordered by archive and logical path
+    """
+    column = "name" if "/" in pattern else "filename"
+    query = f"SELECT archive, container, depth, name, size, crc, mtime, is_dir, encrypted FROM members " \
+            f"WHERE {column} GLOB ?"
+    parameters: list = [pattern]
+    if crc is not None:
+        query += " AND crc = ?"
+        parameters.append(crc)
+    query += " ORDER BY archive, container, name"
+    if limit is not None:
+        query += " LIMIT ?"
+        parameters.append(limit)
+    with tracing.span("search_index", pattern=pattern), closing(connect(database)) as connection:
+        return [IndexedMember(archive, container, depth, name, size, member_crc, mtime, bool(is_dir),
+                              bool(encrypted))
+                for archive, container, depth, name, size, member_crc, mtime, is_dir, encrypted
+                in connection.execute(query, parameters)]
@@ -15,16 +15,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import print_function
 
-import inspect
 import sys
 if not hasattr(sys, "version_info") or sys.version_info < (2, 7, 0, "final", 0):
     raise SystemExit("This program requires Python 2.7 or later.")
 import os
 import shutil
 import stat
-import importlib
 # PEP 396
-__all__ = ['extract_archive', 'test_archive', 'ArchiveFormats',
+__all__ = ['extract_archive', 'test_archive', 'create_archive', 'ArchiveFormats',
            'program_supports_compression', 'get_archive_format', 'check_archive_format']
 
 
@@ -37,11 +35,11 @@ ArchiveFormats = (
     'bzip2', 'cab', 'chm', 'compress', 'cpio', 'deb', 'dms',
     'flac', 'gzip', 'iso', 'lrzip', 'lzh', 'lzip', 'lzma', 'lzop',
     'rar', 'rpm', 'rzip', 'shar', 'shn', 'tar', 'vhd', 'xz',
-    'zip', 'zoo', 'zpaq', 'wim')
+    'zip', 'zoo', 'zpaq', 'zstd', 'wim')
 
 # Supported compressions (used with tar for example)
 # Note that all compressions must also be archive formats
-ArchiveCompressions = ('bzip2', 'compress', 'gzip', 'lzip', 'lzma', 'xz')
+ArchiveCompressions = ('bzip2', 'compress', 'gzip', 'lzip', 'lzma', 'xz', 'zstd')
 
 # Map MIME types to archive format
 ArchiveMimetypes = {
@@ -85,6 +83,8 @@ ArchiveMimetypes = {
     'application/x-zoo': 'zoo',
     'application/zip': 'zip',
     'application/zpaq': 'zpaq',
+    'application/zstd': 'zstd',
+    'application/x-zstd': 'zstd',
     'audio/x-ape': 'ape',
     'audio/x-shn': 'shn',
     'audio/flac': 'flac',
@@ -97,6 +97,16 @@ try:
 except ImportError:
     py_lzma = ()
 
+try:
+    # Python 3.14 zstd module, backports.zstd provides it for older versions
+    try:
+        from compression import zstd
+    except ImportError:
+        from backports import zstd
+    py_zstd = ('py_zstd',)
+except ImportError:
+    py_zstd = ()
+
 # List of programs supporting the given archive format and command.
 # If command is None, the program supports all commands (list, extract, ...)
 # Programs starting with "py_" are Python modules.
@@ -275,6 +285,12 @@ ArchivePrograms = {
     'zpaq': {
         None: ('zpaq',)
     },
+    'zstd': {
+        'extract': py_zstd + ('pzstd', 'zstd'),
+        'test': py_zstd + ('pzstd', 'zstd'),
+        'create': py_zstd + ('pzstd', 'zstd'),
+        'list': ('zstd', 'py_echo'),
+    },
 }
 
 # List of programs by archive type, which don't support password use
@@ -331,6 +347,11 @@ ProgramModules = {
     'extract_chmlib': 'chmlib',
 }
 
+# in-process programs whose extracted files are always readable by the user
+# (py_tarfile adds missing read permissions when it sets the member modes),
+# their output directory is not walked to fix permissions
+ReadableOutputPrograms = ('py_bz2', 'py_gzip', 'py_lzma', 'py_tarfile', 'py_zipfile', 'py_zstd')
+
 
 def program_supports_compression(program, compression):
     """Decide if the given program supports the compression natively.
@@ -338,18 +359,43 @@ def program_supports_compression(program, compression):
       natively, else False.
     """
     if program in ('tar', ):
-        return compression in ('gzip', 'bzip2', 'xz', 'lzip', 'compress', 'lzma') + py_lzma
-    elif program in ('star', 'bsdtar', 'py_tarfile'):
+        return compression in ('gzip', 'bzip2', 'xz', 'lzip', 'compress', 'lzma', 'zstd') + py_lzma
+    elif program == 'bsdtar':
+        return compression in ('gzip', 'bzip2', 'zstd') + py_lzma
+    elif program == 'py_tarfile' and py_zstd:
+        return compression in ('gzip', 'bzip2', 'zstd') + py_lzma
+    elif program in ('star', 'py_tarfile'):
         return compression in ('gzip', 'bzip2') + py_lzma
     return False
 
 
-from . import util
+# Programs GNU tar runs for these compressions, one of them must be installed
+TarCompressPrograms = {
+    'lzma': ('lzma',),
+    'xz': ('xz',),
+    'lzip': ('lzip', 'plzip'),
+    'zstd': ('zstd', 'pzstd'),
+}
+
+
+def program_handles_compression(program, compression):
+    """Check if the program can read or write a compressed archive (e.g. a
+    tar archive): 7z can't do lzip and zstd, GNU tar runs a separate
+    program for some compressions, which must be installed."""
+    if program in ('7z', '7za', '7zr'):
+        return compression not in ('lzip', 'zstd')
+    if program == 'tar' and compression in TarCompressPrograms:
+        return any(util.find_program(name) for name in TarCompressPrograms[compression])
+    return True
+
+
+from . import util, tracing, resources, tuning, threads, registry, scanning, filtering
 
 
 def get_archive_format(filename):
     """Detect filename archive format and optional compression."""
-    mime, compression = util.guess_mime(filename)
+    with tracing.span('guess_mime', archive=filename):
+        mime, compression = util.guess_mime(filename)
     if not (mime or compression):
         raise util.PatoolError("unknown archive format for file `%s'" % filename)
     if mime in ArchiveMimetypes:
@@ -370,17 +416,33 @@ def check_archive_format(format, compression):
         raise util.PatoolError("unknown archive compression `%s'" % compression)
 
 
-def find_archive_program(archive_file_format, command, program=None, password=None):
-    """Find suitable archive program for given format and mode."""
+def find_archive_program(archive_file_format, command, program=None, password=None, archive=None, compression=None):
+    """Find suitable archive program for given format and mode.
+    If the archive is given, size dependent preferences of the machine-local
+    ranking (see tuning module) are applied too. If the compression is given,
+    programs that can't handle it are skipped."""
+    with tracing.span('find_archive_program', format=archive_file_format, command=command) as span:
+        program = _find_archive_program(archive_file_format, command, program=program, password=password,
+                                        archive=archive, compression=compression)
+        span.tag(program=program)
+        return program
+
+
+def _find_archive_program(archive_file_format, command, program=None, password=None, archive=None,
+                          compression=None):
+    """Find the first installed program for given format and mode."""
+    registry.load_entry_points()
     commands = ArchivePrograms[archive_file_format]
     programs = []
-    if program is not None:
-        # try a specific program first
-        programs.append(program)
     # first try the universal programs with key None
     for key in (None, command):
         if key in commands:
             programs.extend(commands[key])
+    # use the order measured on this machine, if there is one
+    programs = tuning.rank_programs(archive_file_format, command, programs, archive, compression)
+    if program is not None:
+        # try a specific program first
+        programs.insert(0, program)
     if password is not None:
         programs = _remove_command_without_password_support(programs, archive_file_format, command)
     if not programs:
@@ -394,6 +456,8 @@ def find_archive_program(archive_file_format, command, program=None, password=No
         if exe:
             if program == '7z' and archive_file_format == 'rar' and not util.p7zip_supports_rar():
                 continue
+            if compression and not program_handles_compression(program, compression):
+                continue
             return exe
     # no programs found
     raise util.PatoolError("could not find an executable program to %s format %s; candidates are (%s),"
@@ -476,17 +540,26 @@ def make_dir_readable(filename):
 def make_user_readable(directory):
     """Make all files in given directory user readable. Also recurse into
     subdirectories."""
-    for root, dirs, files in os.walk(directory, onerror=util.log_error):
-        for filename in files:
-            make_file_readable(os.path.join(root, filename))
-        for dirname in dirs:
-            make_dir_readable(os.path.join(root, dirname))
+    with tracing.span('make_user_readable', directory=directory):
+        _make_user_readable(directory)
+
 
+def _make_user_readable(directory):
+    """Walk the directory once and set missing read (and execute for directories) flags."""
+    scanning.scan_output_dir(directory)
 
-def cleanup_output_dir(output_dir, archive):
+
+def cleanup_output_dir(output_dir, archive, fix_permissions=True):
     """Cleanup output_dir after extraction and return target file name and
     result string."""
-    make_user_readable(output_dir)
+    with tracing.span('cleanup_output_dir', archive=archive, directory=output_dir):
+        return _cleanup_output_dir(output_dir, archive, fix_permissions)
+
+
+def _cleanup_output_dir(output_dir, archive, fix_permissions=True):
+    """Make extracted files readable, then move or rename output_dir."""
+    if fix_permissions:
+        make_user_readable(output_dir)
     # move single directory or file in output_dir
     (success, msg) = move_output_dir_orphan(output_dir)
     if success:
@@ -501,31 +574,65 @@ def cleanup_output_dir(output_dir, archive):
 
 
 def _extract_archive(archive, verbosity=0, interactive=True, output_dir=None,
-                     program=None, format=None, compression=None, password=None, existing_action: str = "rename"):
-    """Extract an archive.
+                     program=None, format=None, compression=None, password=None, existing_action: str = "rename",
+                     member_filter=None, output_hashes=None):
+    """Extract an archive, only the members selected by member_filter
+    (see filtering module) if it is given. The extracted files are hashed
+    into output_hashes (see hashing module) if it is given.
     @return: output directory if command is 'extract', else None
     """
     if format is None:
         format, compression = get_archive_format(archive)
     check_archive_format(format, compression)
-    program = find_archive_program(format, 'extract', program=program, password=password)
+    if program is None and member_filter and format == 'tar' and compression is not None and \
+            program_supports_compression('py_tarfile', compression):
+        # other programs would need the member names, and listing them
+        # decompresses the whole archive once more: py_tarfile applies the
+        # filter while it decompresses the archive once
+        program = 'py_tarfile'
+    program = find_archive_program(format, 'extract', program=program, password=password, archive=archive,
+                                   compression=compression)
     check_program_compression(archive, 'extract', program, compression)
     get_archive_cmdlist = get_archive_cmdlist_func(program, 'extract', format)
     if output_dir is None:
         output_dir = util.create_temporary_directory(dir="")
         do_cleanup_output_dir = True
     else:
+        # unlike 7z, most programs expect the output directory to exist
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
         do_cleanup_output_dir = False
+    filter_kwargs, prune = get_filter_kwargs(archive, format, compression, password, get_archive_cmdlist,
+                                             output_dir, member_filter)
     try:
-        cmdlist = get_archive_cmdlist(archive, compression, program, verbosity, interactive, output_dir,
-                                      password=password, existing_action=existing_action)
-        if cmdlist:
-            # an empty command list means the get_archive_cmdlist() function
-            # already handled the command (e.g. when it's a builtin Python
-            # function)
-            run_archive_cmdlist(cmdlist, verbosity=verbosity)
+        with tracing.span('extract', archive=archive, format=format, compression=compression,
+                          program=program), resources.usage_context(program, format, compression), \
+                threads.lease():
+            # no selected members: most programs would extract all of them
+            if filter_kwargs.get('members') != []:
+                cmdlist = get_archive_cmdlist(archive, compression, program, verbosity, interactive, output_dir,
+                                              password=password, existing_action=existing_action,
+                                              output_hashes=output_hashes, **filter_kwargs)
+                if cmdlist:
+                    # an empty command list means the get_archive_cmdlist() function
+                    # already handled the command (e.g. when it's a builtin Python
+                    # function)
+                    run_archive_cmdlist(cmdlist, verbosity=verbosity)
+        if prune:
+            filtering.prune_output_dir(output_dir, member_filter)
+        hashed_by_scan = output_hashes is not None and not get_archive_cmdlist.supports_output_hashes
+        if hashed_by_scan:
+            # one pass that fixes the permissions and finds the candidates too
+            scan = scanning.scan_output_dir(output_dir, output_hashes.is_candidate, output_hashes=output_hashes)
+            if output_hashes.is_candidate is not None:
+                output_hashes.candidates = scan.candidates
+        if output_hashes is not None and output_hashes.dedup is not None:
+            with tracing.span('dedup', archive=archive, directory=output_dir):
+                output_hashes.dedup.dedup_output(output_hashes, output_dir)
         if do_cleanup_output_dir:
-            target, msg = cleanup_output_dir(output_dir, archive)
+            fix_permissions = not hashed_by_scan and \
+                registry.get_program_key(program) not in ReadableOutputPrograms
+            target, msg = cleanup_output_dir(output_dir, archive, fix_permissions)
         else:
             target, msg = output_dir, "`%s'" % output_dir
         if verbosity > 0:
@@ -540,6 +647,26 @@ def _extract_archive(archive, verbosity=0, interactive=True, output_dir=None,
                 pass
 
 
+def get_filter_kwargs(archive, format, compression, password, handler, output_dir, member_filter):
+    """Return the keyword arguments that make the handler extract only the
+    members selected by member_filter, and if the output has to be pruned
+    after extraction instead."""
+    if not member_filter:
+        return {}, False
+    if handler.supports_member_filter:
+        return {'member_filter': member_filter}, False
+    # listing a compressed tar would decompress it just to get the names
+    if handler.supports_members and not (format == 'tar' and compression is not None):
+        members = filtering.select_members(archive, format, compression, password, member_filter)
+        if members is not None:
+            return {'members': members}, False
+    if os.listdir(output_dir):
+        # pruning would remove files that were there before
+        util.log_error("extracting all members of %s, %s is not empty" % (archive, output_dir))
+        return {}, False
+    return {}, True
+
+
 def _handle_archive(archive, command, verbosity=0, interactive=True,
                     program=None, archive_file_format=None, compression=None, password=None):
     """Test and list archives."""
@@ -548,49 +675,44 @@ def _handle_archive(archive, command, verbosity=0, interactive=True,
     check_archive_format(archive_file_format, compression)
     if command not in ('list', 'test'):
         raise util.PatoolError("invalid archive command `%s'" % command)
-    program = find_archive_program(archive_file_format, command, program=program, password=password)
+    program = find_archive_program(archive_file_format, command, program=program, password=password,
+                                   archive=archive, compression=compression)
     check_program_compression(archive, command, program, compression)
     get_archive_cmdlist = get_archive_cmdlist_func(program, command, archive_file_format)
-    # prepare keyword arguments for command list
-    cmdlist = get_archive_cmdlist(archive, compression, program, verbosity, interactive, password=password)
-    if cmdlist:
-        # an empty command list means the get_archive_cmdlist() function
-        # already handled the command (e.g. when it's a builtin Python
-        # function)
-        run_archive_cmdlist(cmdlist, verbosity=verbosity)
+    with tracing.span(command, archive=archive, format=archive_file_format, compression=compression,
+                      program=program), resources.usage_context(program, archive_file_format, compression), \
+            threads.lease():
+        # prepare keyword arguments for command list
+        cmdlist = get_archive_cmdlist(archive, compression, program, verbosity, interactive, password=password)
+        if cmdlist:
+            # an empty command list means the get_archive_cmdlist() function
+            # already handled the command (e.g. when it's a builtin Python
+            # function)
+            run_archive_cmdlist(cmdlist, verbosity=verbosity)
 
 
-def get_archive_cmdlist_func(program, command, archive_file_format):
-    """Get the Python function that executes the given program."""
-    # get python module for given archive program
-    key = util.strip_file_extension(os.path.basename(program).lower())
-    modulename = ".programs." + ProgramModules.get(key, key)
-    # import the module
-    try:
-        module = importlib.import_module(modulename, __name__)
-    except ImportError as msg:
-        raise util.PatoolError(msg)
-    # get archive handler function (e.g. patoolib.programs.star.extract_tar)
-    try:
-        archive_cmdlist_func = getattr(module, '%s_%s' % (command, archive_file_format))
-
-        def check_for_password_before_cmdlist_func_call(*args, **kwargs):
-            """ If password is None, or not set, run command as usual.
-            If password is set, but can't be accepted raise appropriate
-            message.
-            """
-            if 'password' in kwargs and kwargs['password'] is None:
-                kwargs.pop('password')
-            if 'password' not in kwargs:
-                return archive_cmdlist_func(*args, **kwargs)
-            else:
-                if 'password' in inspect.signature(archive_cmdlist_func).parameters:
-                    return archive_cmdlist_func(*args, **kwargs)
-                raise util.PatoolError('There is no support for password in %s' % program)
-        return check_for_password_before_cmdlist_func_call
+def _create_archive(archive, filenames, verbosity=0, interactive=True, program=None, format=None,
+                    compression=None, password=None):
+    """Create an archive."""
+    check_archive_format(format, compression)
+    program = find_archive_program(format, 'create', program=program, password=password, compression=compression)
+    check_program_compression(archive, 'create', program, compression)
+    get_archive_cmdlist = get_archive_cmdlist_func(program, 'create', format)
+    with tracing.span('create', archive=archive, format=format, compression=compression,
+                      program=program), resources.usage_context(program, format, compression), \
+            threads.lease():
+        cmdlist = get_archive_cmdlist(archive, compression, program, verbosity, interactive, filenames,
+                                      password=password)
+        if cmdlist:
+            # an empty command list means the get_archive_cmdlist() function
+            # already handled the command (e.g. when it's a builtin Python
+            # function)
+            run_archive_cmdlist(cmdlist, verbosity=verbosity)
 
-    except AttributeError as msg:
-        raise util.PatoolError(msg)
+
+def get_archive_cmdlist_func(program, command, archive_file_format):
+    """Get the handler (see registry module) that executes the given program."""
+    return registry.resolve(program, command, archive_file_format)
 
 
 def rmtree_log_error(func, path, exc):
@@ -600,13 +722,18 @@ def rmtree_log_error(func, path, exc):
 
 
 def extract_archive(archive, verbosity=0, output_dir=None, program=None, interactive=True, password=None,
-                    existing_action: str = "rename"):
-    """Extract given archive."""
+                    existing_action: str = "rename", member_filter=None, output_hashes=None):
+    """Extract given archive, only the members selected by member_filter
+    (a filtering.MemberFilter or any function of the member name) if given.
+    With a hashing.OutputHashes as output_hashes the size and digest of every
+    extracted file is recorded, by path relative to the output directory,
+    and files seen before are linked if it has a dedup.OutputDedup."""
     util.check_existing_filename(archive)
     if verbosity > 0:
         util.log_info("Extracting %s ..." % archive)
     return _extract_archive(archive, verbosity=verbosity, interactive=interactive, output_dir=output_dir,
-                            program=program, password=password, existing_action=existing_action)
+                            program=program, password=password, existing_action=existing_action,
+                            member_filter=member_filter, output_hashes=output_hashes)
 
 
 def test_archive(archive, verbosity=0, program=None, interactive=True, password=None):
@@ -619,3 +746,17 @@ def test_archive(archive, verbosity=0, program=None, interactive=True, password=
     if verbosity > 0:
         util.log_info("... tested ok.")
     return res
+
+
+def create_archive(archive, filenames, format, compression=None, verbosity=0, program=None, interactive=True,
+                   password=None):
+    """Create given archive of the given format (and compression) from filenames.
+    Used to make sample archives for benchmarks and program tuning."""
+    if os.path.exists(archive):
+        raise util.PatoolError("archive `%s' already exists" % archive)
+    if verbosity > 0:
+        util.log_info("Creating %s ..." % archive)
+    _create_archive(archive, filenames, verbosity=verbosity, interactive=interactive, program=program,
+                    format=format, compression=compression, password=password)
+    if verbosity > 0:
+        util.log_info("... %s created." % archive)
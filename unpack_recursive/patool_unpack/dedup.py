@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Deduplication of identical extracted files.
+
+An OutputDedup remembers the files written during a run by size and
+content hash (see hashing module) and replaces later identical files with
+a reflink (FICLONE, the blocks are shared copy-on-write, on file systems
+like Btrfs or XFS) or a hard link to the first one. It is handed to the
+backends as the 'dedup' attribute of their OutputHashes. The zip backend
+also looks members up by size and CRC-32 from the central directory and
+links them without decompressing or writing anything; such a match is not
+verified, so their digest is recorded as taken from the CRC match (see
+OutputHashes.is_crc_match). Both lookups lead to the same first copy of a
+content, so all copies end up as links to one file.
+"""
+import errno
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+METHODS = ('auto', 'reflink', 'hardlink')
+
+# smaller files take a block anyway, a link saves nothing worth the system calls
+DEFAULT_MIN_BYTES = 4096
+
+# errors meaning that files can't be linked here (other file system, no reflink support, ...)
+_UNSUPPORTED_ERRNOS = frozenset(getattr(errno, name) for name in
+                                ('EXDEV', 'ENOSYS', 'EINVAL', 'EOPNOTSUPP', 'ENOTSUP', 'ENOTTY', 'EPERM',
+                                 'EMLINK', 'EBADF')
+                                if hasattr(errno, name))
+
+
+class OutputDedup(object):
+    """Thread-safe index of the first copy of each content by (size, hex
+    digest), and of the (size, hex digest) by (size, CRC-32) where the
+    CRC-32 is known; method is 'reflink', 'hardlink' or 'auto' (reflink
+    where the file system supports it, else hard link)."""
+
+    def __init__(self, method='auto', min_bytes=DEFAULT_MIN_BYTES):
+        if method not in METHODS:
+            raise ValueError("unknown deduplication method `%s'" % method)
+        self.method = method
+        self.min_bytes = min_bytes
+        # (size, digest) -> path of the first copy
+        self._by_digest = {}
+        # (size, CRC-32) -> (size, digest)
+        self._by_crc = {}
+        # files that are links already
+        self._linked_paths = set()
+        self._lock = threading.Lock()
+        self.linked = 0
+        self.saved_bytes = 0
+
+    def add_crc(self, size, crc, path, digest):
+        """Record a written file whose CRC-32 is known, e.g. from a zip, and
+        deduplicate it right away (another thread may have written the same
+        content at the same time). @return: True if it was replaced"""
+        if size < self.min_bytes:
+            return False
+        with self._lock:
+            self._by_crc.setdefault((size, crc), (size, digest))
+        return self.dedup(path, size, digest)
+
+    def link_crc(self, size, crc, path):
+        """Link path to the first copy of a content with this size and
+        CRC-32. @return: hex digest of that content (not verified for path),
+        None if nothing was linked"""
+        if size < self.min_bytes:
+            return None
+        with self._lock:
+            key = self._by_crc.get((size, crc))
+            source = self._by_digest.get(key) if key is not None else None
+        if source is None or not self._link(source, path, size):
+            return None
+        return key[1]
+
+    def dedup(self, path, size, digest):
+        """Replace the file at path by a link if an identical file was seen
+        before, else record it. @return: True if it was replaced"""
+        if size < self.min_bytes:
+            return False
+        key = (size, digest)
+        with self._lock:
+            if path in self._linked_paths:
+                return False
+            source = self._by_digest.setdefault(key, path)
+        if source == path:
+            return False
+        try:
+            if os.path.samefile(source, path):
+                return False
+        except OSError:
+            # the first copy is gone (e.g. a removed nested archive), this one takes its place
+            with self._lock:
+                self._by_digest[key] = path
+            return False
+        return self._link(source, path, size)
+
+    def dedup_output(self, output_hashes, output_dir):
+        """Deduplicate all files of an extraction recorded in output_hashes."""
+        for name, (size, digest) in output_hashes.items():
+            self.dedup(os.path.join(output_dir, name), size, digest)
+
+    def _link(self, source, path, size):
+        try:
+            if source_changed(source, size):
+                return False
+            link_file(source, path, self.method)
+        except OSError as err:
+            if err.errno not in _UNSUPPORTED_ERRNOS and err.errno != errno.ENOENT:
+                raise
+            return False
+        with self._lock:
+            self._linked_paths.add(path)
+            self.linked += 1
+            self.saved_bytes += size
+        return True
+
+
+def source_changed(source, size):
+    """Check if the recorded file is no regular file of the size anymore."""
+    try:
+        return os.path.getsize(source) != size or os.path.islink(source)
+    except OSError:
+        return True
+
+
+_no_reflink_devices = set()
+
+
+def link_file(source, path, method='auto'):
+    """Replace (or create) path by a reflink or hard link to source.
+    Raise OSError if neither works."""
+    temporary = '%s.%d.dedup' % (path, threading.get_ident())
+    device = os.stat(source).st_dev
+    try:
+        if method == 'hardlink' or method == 'auto' and (not can_reflink() or device in _no_reflink_devices):
+            os.link(source, temporary)
+        else:
+            try:
+                reflink(source, temporary)
+            except OSError as err:
+                if method == 'reflink' or err.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                if err.errno != errno.EXDEV:
+                    # not tried again on this file system
+                    _no_reflink_devices.add(device)
+                os.link(source, temporary)
+        if os.path.exists(path) and os.stat(temporary).st_nlink == 1:
+            # reflinks are new files, they keep the metadata of the replaced one
+            shutil.copystat(path, temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+
+
+def can_reflink():
+    """Check if reflink() can work on this platform (Linux only)."""
+    return fcntl is not None and hasattr(fcntl, 'ioctl') and os.uname().sysname == 'Linux'
+
+
+def reflink(source, target):
+    """Create target as a copy-on-write clone of source (FICLONE)."""
+    if not can_reflink():
+        raise OSError(errno.ENOSYS, "reflinks are not supported on this platform")
+    with open(source, 'rb') as src:
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            fcntl.ioctl(fd, FICLONE, src.fileno())
+        except BaseException:
+            os.close(fd)
+            os.remove(target)
+            raise
+        os.close(fd)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Copying file data with as little work in Python as possible.
+
+copy_range() copies a byte range of one file into another with
+os.copy_file_range(), which copies inside the kernel (or shares the
+blocks on file systems with reflinks like Btrfs or XFS), else with
+os.sendfile(), and only if neither works with pread() and write().
+crc32_range() checks such a copied range, reading it from the page cache.
+
+copy_stream() copies a (decompressing) file object into a file through
+one reused buffer, sized for the storage the archive is on.
+"""
+import errno
+import os
+import threading
+import zlib
+
+# files smaller than this are not worth the extra system calls
+MIN_COPY_RANGE_BYTES = 128 * 1024
+# maximal bytes per system call, so that big copies can be interrupted
+COPY_CHUNK_BYTES = 64 * 1024 * 1024
+# bytes per pread() of the last fallback
+READ_SIZE_BYTES = 1024 * 1024
+# buffer of copy_stream() for files on rotational disks, which read
+# sequentially much faster in big requests
+ROTATIONAL_READ_SIZE_BYTES = 8 * 1024 * 1024
+
+# errors meaning that a copy function can't be used for these files
+_UNSUPPORTED_ERRNOS = frozenset(getattr(errno, name) for name in
+                                ('EXDEV', 'ENOSYS', 'EINVAL', 'EOPNOTSUPP', 'ENOTSUP', 'EBADF')
+                                if hasattr(errno, name))
+
+
+def _copy_file_range(src_fd, offset, count, dst_fd):
+    return os.copy_file_range(src_fd, dst_fd, min(count, COPY_CHUNK_BYTES), offset)
+
+
+def _sendfile(src_fd, offset, count, dst_fd):
+    return os.sendfile(dst_fd, src_fd, offset, min(count, COPY_CHUNK_BYTES))
+
+
+def _pread_write(src_fd, offset, count, dst_fd):
+    data = memoryview(os.pread(src_fd, min(count, READ_SIZE_BYTES), offset))
+    written = 0
+    while written < len(data):
+        written += os.write(dst_fd, data[written:])
+    return len(data)
+
+
+_COPY_FUNCTIONS = tuple(func for name, func in (('copy_file_range', _copy_file_range),
+                                                ('sendfile', _sendfile),
+                                                ('pread', _pread_write))
+                        if hasattr(os, name))
+
+
+def can_copy_range():
+    """Check if copy_range() works on this platform (not on Windows)."""
+    return bool(_COPY_FUNCTIONS)
+
+
+def copy_range(src_fd, offset, length, dst_fd):
+    """Copy length bytes at offset of file descriptor src_fd to the current
+    position of dst_fd; the position of src_fd is not changed.
+    Raise OSError if src_fd ends before."""
+    copied = 0
+    for copy in _COPY_FUNCTIONS:
+        try:
+            while copied < length:
+                count = copy(src_fd, offset + copied, length - copied, dst_fd)
+                if count == 0:
+                    raise OSError(errno.EIO, "unexpected end of file at offset %d" % (offset + copied))
+                copied += count
+            return copied
+        except OSError as err:
+            if err.errno not in _UNSUPPORTED_ERRNOS or copy is _COPY_FUNCTIONS[-1]:
+                raise
+    raise OSError(errno.ENOSYS, "no function to copy file data")
+
+
+def crc32_range(fd, offset, length):
+    """Return the CRC-32 of length bytes at offset of file descriptor fd,
+    read with pread(). Raise OSError if fd ends before."""
+    crc = 0
+    end = offset + length
+    while offset < end:
+        data = os.pread(fd, min(end - offset, READ_SIZE_BYTES), offset)
+        if not data:
+            raise OSError(errno.EIO, "unexpected end of file at offset %d" % offset)
+        crc = zlib.crc32(data, crc)
+        offset += len(data)
+    return crc
+
+
+_buffer_sizes = {}
+_buffer_sizes_lock = threading.Lock()
+
+
+def get_buffer_size(path):
+    """Return the buffer size for streaming the file at path: bigger if it
+    is on a rotational disk (Linux only, where /sys tells)."""
+    try:
+        device = os.stat(path).st_dev
+    except OSError:
+        return READ_SIZE_BYTES
+    with _buffer_sizes_lock:
+        if device not in _buffer_sizes:
+            _buffer_sizes[device] = ROTATIONAL_READ_SIZE_BYTES if is_rotational(device) else READ_SIZE_BYTES
+        return _buffer_sizes[device]
+
+
+def is_rotational(device):
+    """Check if the block device with the given number is a rotational disk,
+    False if unknown (e.g. network or memory file systems)."""
+    sysfs = '/sys/dev/block/%d:%d' % (os.major(device), os.minor(device))
+    # partitions have the queue attributes in the directory of their disk
+    for queue in (os.path.join(sysfs, 'queue'), os.path.join(sysfs, '..', 'queue')):
+        try:
+            with open(os.path.join(queue, 'rotational')) as rotational:
+                return rotational.read().strip() == '1'
+        except (OSError, ValueError):
+            pass
+    return False
+
+
+def open_sequential(path):
+    """Open a file for reading it once from start to end, the kernel is told
+    so (it reads ahead more and drops pages behind sooner)."""
+    fileobj = open(path, 'rb')
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fileobj.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+    return fileobj
+
+
+def write_all(target, data):
+    """Write all of data to target, which may be unbuffered: a raw write
+    can write less than given (on Linux at most about 2 GiB per call)."""
+    view = memoryview(data)
+    written = 0
+    while written < len(view):
+        written += target.write(view[written:])
+    return written
+
+
+def copy_stream(source, target, buffer_size=READ_SIZE_BYTES):
+    """Copy all data of the file object source to target with readinto()
+    on one buffer. target should be unbuffered (e.g. opened with
+    buffering=0 or a compressor), so it writes from the buffer directly.
+    @return: number of copied bytes"""
+    buffer = memoryview(bytearray(buffer_size))
+    copied = 0
+    while True:
+        count = source.readinto(buffer)
+        if not count:
+            return copied
+        view = buffer[:count]
+        written = target.write(view)
+        # raw files may write less than given
+        while written is not None and written < count:
+            written += target.write(view[written:])
+        copied += count
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Selective extraction with include/exclude glob patterns.
+
+A MemberFilter decides by member name which files of an archive are
+extracted. Programs that can select members themselves get either the
+filter (in-process py_* backends, 'member_filter' parameter) or the
+list of selected names from the listing ('members' parameter, e.g. 7z,
+tar and unzip); the output of all others is pruned after extraction.
+Compressed tars are not listed for that, which would decompress them
+twice: they go to py_tarfile, or are pruned.
+"""
+import fnmatch
+import os
+import posixpath
+
+from . import util, listing, tracing
+
+# longer lists of selected names are not passed as command line arguments
+# (Linux limits the size of all arguments), the output is pruned instead
+MAX_MEMBER_ARGS_BYTES = 512 * 1024
+
+
+class MemberFilter(object):
+    """Select archive members by glob patterns. Patterns with a '/' are
+    matched against the whole member path, others against the file name.
+    A member is selected if it matches an include pattern (or there are
+    none) and no exclude pattern; names accepted by keep (e.g. nested
+    archives) are always selected."""
+
+    def __init__(self, include=(), exclude=(), keep=None):
+        self.include = tuple(include or ())
+        self.exclude = tuple(exclude or ())
+        self.keep = keep
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+    def __call__(self, name):
+        path = normalize_member_name(name)
+        if self.keep is not None and self.keep(path):
+            return True
+        if self.include and not self._matches(path, self.include):
+            return False
+        return not self._matches(path, self.exclude)
+
+    @staticmethod
+    def _matches(path, patterns):
+        filename = posixpath.basename(path)
+        for pattern in patterns:
+            if fnmatch.fnmatchcase(path if '/' in pattern else filename, pattern.strip('/')):
+                return True
+        return False
+
+    def __repr__(self):
+        return '<MemberFilter include=%r exclude=%r>' % (self.include, self.exclude)
+
+
+def normalize_member_name(name):
+    """Return the member name with '/' separators and without leading
+    './' or '/' or trailing '/' ('' for the '.' entry of tars)."""
+    name = name.replace(os.sep, '/')
+    while name.startswith('./'):
+        name = name[2:]
+    name = name.strip('/')
+    return '' if name == '.' else name
+
+
+def select_members(archive, archive_file_format, compression, password, member_filter):
+    """Return the names of the non-directory members selected by the
+    filter, or None if the archive can't be listed or the names are too
+    long for command line arguments."""
+    try:
+        members = listing.list_members(archive, archive_file_format, compression, password)
+    except (util.PatoolError, OSError):
+        return None
+    names = [member.name for member in members if not member.is_dir and member_filter(member.name)]
+    if sum(len(name) + 1 for name in names) > MAX_MEMBER_ARGS_BYTES:
+        return None
+    return names
+
+
+def prune_output_dir(output_dir, member_filter):
+    """Remove the extracted files not selected by the filter, and the
+    directories left empty by that. Return the number of removed files."""
+    removed = 0
+    with tracing.span('prune_output_dir', directory=output_dir):
+        for root, dirnames, filenames in os.walk(output_dir, topdown=False):
+            relative = os.path.relpath(root, output_dir)
+            # symbolic links to directories are removed like files
+            links = [dirname for dirname in dirnames if os.path.islink(os.path.join(root, dirname))]
+            for filename in filenames + links:
+                name = filename if relative == os.curdir else os.path.join(relative, filename)
+                if not member_filter(name):
+                    os.remove(os.path.join(root, filename))
+                    removed += 1
+            if removed and root != output_dir:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    # not empty
+                    pass
+    return removed
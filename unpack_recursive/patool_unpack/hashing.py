@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Content hashes of extracted files.
+
+An OutputHashes collects (size, hex digest) of the files an extraction
+wrote, by path relative to the output directory. The in-process py_*
+backends hash the data while they write it ('output_hashes' parameter);
+the output of other programs is hashed by the scan after extraction
+(see scanning module), which reads every file once.
+"""
+import hashlib
+import os
+import threading
+
+from . import fileio
+
+DEFAULT_ALGORITHM = 'sha256'
+
+
+class OutputHashes(object):
+    """Thread-safe mapping of relative path to (size, hex digest); dedup
+    is an optional dedup.OutputDedup the extracted files are linked with.
+    If the output is hashed by the scan, that scan also collects the paths
+    of the files is_candidate(name) selects into candidates (else None), so
+    the caller needs no second pass to find them."""
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, dedup=None, is_candidate=None):
+        self.algorithm = algorithm
+        self.dedup = dedup
+        self.is_candidate = is_candidate
+        self.candidates = None
+        self._hashes = {}
+        self._crc_matches = set()
+        self._lock = threading.Lock()
+
+    def new(self):
+        """Return a new hash object of the algorithm."""
+        return hashlib.new(self.algorithm)
+
+    def add(self, name, size, digest, crc_match=False):
+        """Record the size and the hex digest of a file; crc_match means that
+        the digest is the one of a file with the same size and CRC-32, the
+        file itself was not hashed (see dedup module)."""
+        name = name.replace(os.sep, '/')
+        with self._lock:
+            self._hashes[name] = (size, digest)
+            if crc_match:
+                self._crc_matches.add(name)
+            else:
+                self._crc_matches.discard(name)
+
+    def is_crc_match(self, name):
+        """Check if the digest of the named file was taken from a CRC-32 match."""
+        return name in self._crc_matches
+
+    def writer(self, fileobj):
+        """Return a HashingWriter that writes to fileobj."""
+        return HashingWriter(fileobj, self.new())
+
+    def add_writer(self, writer, path, output_dir):
+        """Record what writer wrote to path, under its path relative to output_dir."""
+        self.add(os.path.relpath(path, output_dir), writer.size, writer.digest.hexdigest())
+
+    def add_file(self, path, output_dir):
+        """Hash a file already on disk (e.g. written by several threads out
+        of order) and record it under its path relative to output_dir."""
+        size, digest = hash_file(path, self.new())
+        self.add(os.path.relpath(path, output_dir), size, digest)
+
+    def items(self):
+        """Return a sorted list of (relative path, (size, hex digest))."""
+        with self._lock:
+            return sorted(self._hashes.items())
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, name):
+        return name in self._hashes
+
+
+class HashingWriter(object):
+    """Write to a file object and hash the data on the way."""
+
+    def __init__(self, fileobj, digest):
+        self.fileobj = fileobj
+        self.digest = digest
+        self.size = 0
+
+    def write(self, data):
+        written = self.fileobj.write(data)
+        if written is None:
+            written = len(data)
+        # raw files may write less than given, the caller writes the rest
+        self.digest.update(data[:written])
+        self.size += written
+        return written
+
+
+def hash_file(path, digest):
+    """Return (size, hex digest) of the file at path."""
+    with fileio.open_sequential(path) as fileobj:
+        size = fileio.copy_stream(fileobj, _DigestSink(digest), fileio.get_buffer_size(path))
+    return size, digest.hexdigest()
+
+
+class _DigestSink(object):
+    def __init__(self, digest):
+        self.digest = digest
+
+    def write(self, data):
+        self.digest.update(data)
+        return len(data)
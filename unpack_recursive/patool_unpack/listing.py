@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Member listings of archives without extracting them.
+
+zip, tar (also compressed with gzip, bzip2, xz, lzma or zstd), gzip,
+xz and zstd are read in-process from any seekable file object, so
+archives nested in them can be listed too. Other formats are listed
+with '7z l -slt' if 7z is installed.
+"""
+import collections
+import gzip
+import os
+import struct
+import subprocess
+import time
+try:
+    # backports of the Python 3.14 modules, which read zstd compressed data
+    from backports.zstd import tarfile, zipfile
+except ImportError:
+    import tarfile
+    import zipfile
+
+from . import util, tracing, py_zstd
+
+# size, mode (permission bits), crc (CRC-32 of the data) and mtime (seconds
+# since the epoch) are None if the format does not record them
+Member = collections.namedtuple('Member', ('name', 'size', 'is_dir', 'encrypted', 'mode', 'crc', 'mtime'))
+
+# compressions of tar archives the tarfile module can read
+TarfileCompressions = (None, 'gzip', 'bzip2', 'xz', 'lzma') + (('zstd',) if 'zst' in tarfile.TarFile.OPEN_METH else ())
+
+# formats (without compression) listed in-process
+InProcessFormats = ('zip', 'tar', 'gzip', 'xz', 'zstd')
+
+
+class Listing(object):
+    """Members of an archive and, for in-process listings, access to their data."""
+
+    def __init__(self, members, opener=None, closer=None):
+        """Store members, opener(name) returns a file object of a member."""
+        self.members = members
+        self.opener = opener
+        self.closer = closer
+
+    def can_open(self):
+        """True if member data can be read with open()."""
+        return self.opener is not None
+
+    def open(self, name):
+        """Return a readable (and seekable) file object of the named member."""
+        if self.opener is None:
+            raise util.PatoolError("members of this listing can't be opened")
+        return self.opener(name)
+
+    def close(self):
+        """Release the archive."""
+        if self.closer is not None:
+            self.closer()
+            self.closer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def can_list_in_process(archive_file_format, compression):
+    """Check if the archive can be listed from a file object."""
+    if archive_file_format == 'tar':
+        return compression in TarfileCompressions
+    return archive_file_format in InProcessFormats and compression is None
+
+
+def open_listing(fileobj, name, archive_file_format, compression=None):
+    """List an archive from a seekable file object, name is used for
+    single file formats. Raise PatoolError if it can't be read."""
+    if not can_list_in_process(archive_file_format, compression):
+        raise util.PatoolError("%s archive `%s' can't be listed in-process" % (archive_file_format, name))
+    try:
+        if archive_file_format == 'zip':
+            return _open_zip_listing(fileobj)
+        if archive_file_format == 'tar':
+            return _open_tar_listing(fileobj)
+        if archive_file_format == 'gzip':
+            return _open_gzip_listing(fileobj, name)
+        if archive_file_format == 'zstd':
+            return _open_zstd_listing(fileobj, name)
+        return _open_xz_listing(fileobj, name)
+    except (OSError, EOFError, ValueError, struct.error, zipfile.BadZipFile, tarfile.TarError) as err:
+        raise util.PatoolError("error listing %s: %s" % (name, err))
+
+
+def _open_zip_listing(fileobj):
+    zfile = zipfile.ZipFile(fileobj)
+    members = [Member(info.filename, info.file_size, info.is_dir(), bool(info.flag_bits & 0x1), _get_zip_mode(info),
+                      info.CRC, _get_zip_mtime(info))
+               for info in zfile.infolist()]
+    return Listing(members, zfile.open, zfile.close)
+
+
+def _get_zip_mode(info):
+    # only zips made on Unix store permission bits
+    if info.create_system != 3 or not info.external_attr >> 16:
+        return None
+    return (info.external_attr >> 16) & 0o7777
+
+
+def _get_zip_mtime(info):
+    # DOS date and time, in local time
+    try:
+        return time.mktime(info.date_time + (0, 0, -1))
+    except (OverflowError, ValueError):
+        return None
+
+
+def _open_tar_listing(fileobj):
+    tfile = tarfile.open(fileobj=fileobj, mode='r:*')
+    members = [Member(info.name, info.size if info.isfile() else 0, info.isdir(), False, info.mode, None, info.mtime)
+               for info in tfile.getmembers()]
+    return Listing(members, tfile.extractfile, tfile.close)
+
+
+def _open_gzip_listing(fileobj, name):
+    """The member size and CRC are the ISIZE and CRC32 fields of the last
+    gzip member (exact for all but multi-stream and >4GB files)."""
+    header = fileobj.read(10)
+    if len(header) < 10 or header[:2] != b'\x1f\x8b':
+        raise util.PatoolError("not a gzip file")
+    mtime, = struct.unpack('<I', header[4:8])
+    fileobj.seek(-8, os.SEEK_END)
+    crc, size = struct.unpack('<II', fileobj.read(8))
+    fileobj.seek(0)
+    member_name = get_gzip_member_name(fileobj) or os.path.splitext(os.path.basename(name))[0]
+    return Listing([Member(member_name, size, False, False, None, crc, mtime or None)],
+                   lambda _: gzip.GzipFile(fileobj=_rewind(fileobj), mode='rb'))
+
+
+def get_gzip_member_name(fileobj):
+    """Return the original file name stored in the gzip header, or None."""
+    header = fileobj.read(10)
+    flags = header[3]
+    if not flags & 0x08:
+        return None
+    if flags & 0x04:
+        extra_length, = struct.unpack('<H', fileobj.read(2))
+        fileobj.read(extra_length)
+    name = bytearray()
+    while True:
+        char = fileobj.read(1)
+        if not char or char == b'\x00':
+            break
+        name += char
+    return os.path.basename(name.decode('latin-1')) or None
+
+
+def _open_xz_listing(fileobj, name):
+    import lzma
+    size = sum(uncompressed for _, uncompressed in read_xz_index(fileobj))
+    member_name = os.path.splitext(os.path.basename(name))[0]
+    return Listing([Member(member_name, size, False, False, None, None, None)],
+                   lambda _: lzma.LZMAFile(_rewind(fileobj)))
+
+
+def _open_zstd_listing(fileobj, name):
+    """The member size is the sum of the content sizes in the frame headers,
+    the data can only be read if a zstd module is available."""
+    size = read_zstd_content_size(fileobj)
+    member_name = os.path.splitext(os.path.basename(name))[0]
+    opener = None
+    if py_zstd:
+        from .programs.py_zstd import zstd
+        opener = lambda _: zstd.ZstdFile(_rewind(fileobj))
+    return Listing([Member(member_name, size, False, False, None, None, None)], opener)
+
+
+def read_zstd_content_size(fileobj):
+    """Return the decompressed size of a zstd file by walking its frame and
+    block headers, or None if a frame does not record its content size."""
+    fileobj.seek(0, os.SEEK_END)
+    end = fileobj.tell()
+    position = 0
+    total = 0
+    while position < end:
+        fileobj.seek(position)
+        magic, = struct.unpack('<I', fileobj.read(4))
+        if magic & 0xfffffff0 == 0x184d2a50:
+            # skippable frame
+            frame_size, = struct.unpack('<I', fileobj.read(4))
+            position += 8 + frame_size
+            continue
+        if magic != 0xfd2fb528:
+            raise util.PatoolError("not a zstd file")
+        descriptor = fileobj.read(1)[0]
+        single_segment = descriptor & 0x20
+        content_size_bytes = {0: 1 if single_segment else 0, 1: 2, 2: 4, 3: 8}[descriptor >> 6]
+        dictionary_id_bytes = (0, 1, 2, 4)[descriptor & 0x3]
+        fileobj.seek((0 if single_segment else 1) + dictionary_id_bytes, os.SEEK_CUR)
+        if not content_size_bytes:
+            return None
+        content_size = int.from_bytes(fileobj.read(content_size_bytes), 'little')
+        total += content_size + (256 if content_size_bytes == 2 else 0)
+        while True:
+            header = int.from_bytes(fileobj.read(3), 'little')
+            # RLE blocks store one byte, the others their compressed size
+            fileobj.seek(1 if (header >> 1) & 0x3 == 1 else header >> 3, os.SEEK_CUR)
+            if header & 0x1:
+                break
+        position = fileobj.tell() + (4 if descriptor & 0x4 else 0)
+    return total
+
+
+def _rewind(fileobj):
+    fileobj.seek(0)
+    return fileobj
+
+
+def _read_multibyte_integer(data, offset):
+    """Decode a variable length integer of the xz format, return (value, next offset)."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def read_xz_index(fileobj):
+    """Return (unpadded size, uncompressed size) of all blocks of an xz file,
+    from the indexes at the end of its streams."""
+    return [(unpadded, uncompressed) for _, unpadded, uncompressed, _ in read_xz_blocks(fileobj)]
+
+
+def read_xz_blocks(fileobj):
+    """Return (offset, unpadded size, uncompressed size, stream flags) of
+    all blocks of an xz file, from the indexes at the end of its streams."""
+    fileobj.seek(0, os.SEEK_END)
+    position = fileobj.tell()
+    streams = []
+    while position > 0:
+        # skip stream padding (multiples of 4 null bytes)
+        fileobj.seek(position - 4)
+        if fileobj.read(4) == b'\x00' * 4:
+            position -= 4
+            continue
+        fileobj.seek(position - 12)
+        footer = fileobj.read(12)
+        if footer[10:12] != b'YZ':
+            raise util.PatoolError("not an xz file")
+        backward_size = (struct.unpack('<I', footer[4:8])[0] + 1) * 4
+        index_start = position - 12 - backward_size
+        fileobj.seek(index_start)
+        index = fileobj.read(backward_size)
+        if index[0] != 0:
+            raise util.PatoolError("broken xz index")
+        count, offset = _read_multibyte_integer(index, 1)
+        records = []
+        compressed = 0
+        for _ in range(count):
+            unpadded, offset = _read_multibyte_integer(index, offset)
+            uncompressed, offset = _read_multibyte_integer(index, offset)
+            records.append((compressed, unpadded, uncompressed))
+            compressed += (unpadded + 3) & ~3
+        # stream header (12 bytes) + blocks + index + footer
+        position = index_start - compressed - 12
+        if position < 0:
+            raise util.PatoolError("broken xz index")
+        flags = footer[8:10]
+        streams.append([(position + 12 + block_offset, unpadded, uncompressed, flags)
+                        for block_offset, unpadded, uncompressed in records])
+    return [block for blocks in reversed(streams) for block in blocks]
+
+
+def list_members(archive, archive_file_format=None, compression=None, password=None):
+    """Return the members of an archive file. Formats not readable
+    in-process are listed with 7z. Raise PatoolError if that fails."""
+    if archive_file_format is None:
+        from . import get_archive_format
+        archive_file_format, compression = get_archive_format(archive)
+    with tracing.span('list_members', archive=archive, format=archive_file_format):
+        if can_list_in_process(archive_file_format, compression):
+            with open(archive, 'rb') as fileobj:
+                with open_listing(fileobj, archive, archive_file_format, compression) as listing:
+                    return listing.members
+        return list_members_7z(archive, password=password)
+
+
+def list_members_7z(archive, password=None):
+    """List an archive with the technical listing of 7z ('7z l -slt')."""
+    exe = util.find_program('7z') or util.find_program('7za')
+    if not exe:
+        raise util.PatoolError("cannot list `%s': 7z is not installed" % archive)
+    # a wrong password still lists archives without encrypted headers
+    cmd = [exe, 'l', '-slt', '-y', '-p%s' % (password or 'FakePwd'), '--', archive]
+    process = util.popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0].decode('utf-8', 'replace')
+    if process.returncode != 0:
+        if 'Wrong password' in output:
+            raise util.PatoolError("cannot list `%s': wrong password" % archive)
+        raise util.PatoolError("cannot list `%s': 7z returned exit status %d" % (archive, process.returncode))
+    return parse_7z_technical_listing(output)
+
+
+def _parse_7z_time(value):
+    """Parse a 'Modified' time of 7z ('2024-01-31 12:00:00', maybe with
+    fractions of seconds), which is in local time."""
+    if not value:
+        return None
+    try:
+        return time.mktime(time.strptime(value[:19], '%Y-%m-%d %H:%M:%S'))
+    except (OverflowError, ValueError):
+        return None
+
+
+def parse_7z_technical_listing(output):
+    """Parse the member blocks after the '----------' line of '7z l -slt' output."""
+    members = []
+    _, _, body = output.partition('\n----------\n')
+    for block in body.split('\n\n'):
+        fields = {}
+        for line in block.splitlines():
+            key, separator, value = line.partition(' = ')
+            if separator:
+                fields[key] = value
+        if 'Path' not in fields:
+            continue
+        size = fields.get('Size')
+        is_dir = fields.get('Folder') == '+' or fields.get('Attributes', '').startswith('D')
+        crc = fields.get('CRC')
+        members.append(Member(fields['Path'], int(size) if size else None, is_dir,
+                              fields.get('Encrypted') == '+', None, int(crc, 16) if crc else None,
+                              _parse_7z_time(fields.get('Modified'))))
+    return members
@@ -13,17 +13,17 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from .. import util
+import functools
+from .. import util, threads
 
 def extract_singlefile_standard (archive, compression, cmd, verbosity, interactive, output_dir):
     """Standard routine to extract a singlefile archive (like gzip)."""
-    cmdlist = [util.shell_quote(cmd)]
+    cmdlist = [cmd]
     if verbosity > 1:
         cmdlist.append('-v')
     outfile = util.get_single_outfile(output_dir, archive)
-    cmdlist.extend(['-c', '-d', '--', util.shell_quote(archive), '>',
-                    util.shell_quote(outfile)])
-    return (cmdlist, {'shell': True})
+    cmdlist.extend(['-c', '-d', '--', archive])
+    return (cmdlist, {'stdout_file': outfile})
 
 
 def test_singlefile_standard (archive, compression, cmd, verbosity, interactive):
@@ -37,10 +37,27 @@ def test_singlefile_standard (archive, compression, cmd, verbosity, interactive)
 
 def create_singlefile_standard (archive, compression, cmd, verbosity, interactive, filenames):
     """Standard routine to create a singlefile archive (like gzip)."""
-    cmdlist = [util.shell_quote(cmd)]
+    cmdlist = [cmd]
     if verbosity > 1:
         cmdlist.append('-v')
     cmdlist.extend(['-c', '--'])
-    cmdlist.extend([util.shell_quote(x) for x in filenames])
-    cmdlist.extend(['>', util.shell_quote(archive)])
-    return (cmdlist, {'shell': True})
+    cmdlist.extend(filenames)
+    return (cmdlist, {'stdout_file': archive})
+
+
+def insert_options(archive_cmdlist, options):
+    """Insert options after the program of a command list (which may come with run keyword arguments)."""
+    if isinstance(archive_cmdlist, tuple):
+        cmdlist, run_kwargs = archive_cmdlist
+        return (cmdlist[:1] + options + cmdlist[1:], run_kwargs)
+    return archive_cmdlist[:1] + options + archive_cmdlist[1:]
+
+
+def with_thread_option(func, *option):
+    """Wrap a command list function to pass the thread share of the command
+    (see threads module) with the given option, e.g. ('-p', '%d')."""
+    @functools.wraps(func)
+    def add_thread_option(*args, **kwargs):
+        share = threads.current_share()
+        return insert_options(func(*args, **kwargs), [part.replace('%d', str(share)) for part in option])
+    return add_thread_option
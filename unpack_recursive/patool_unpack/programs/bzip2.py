@@ -14,7 +14,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the bzip2 program."""
-from .. import util
 from . import extract_singlefile_standard, test_singlefile_standard
 
 extract_bzip2 = extract_singlefile_standard
@@ -22,10 +21,9 @@ test_bzip2 = test_singlefile_standard
 
 def create_bzip2 (archive, compression, cmd, verbosity, interactive, filenames):
     """Create a BZIP2 archive."""
-    cmdlist = [util.shell_quote(cmd)]
+    cmdlist = [cmd]
     if verbosity > 1:
         cmdlist.append('-v')
     cmdlist.extend(['-c', '-z', '-9', '--'])
-    cmdlist.extend([util.shell_quote(x) for x in filenames])
-    cmdlist.extend(['>', util.shell_quote(archive)])
-    return (cmdlist, {'shell': True})
+    cmdlist.extend(filenames)
+    return (cmdlist, {'stdout_file': archive})
@@ -15,7 +15,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the clzip program."""
 from . import extract_singlefile_standard, test_singlefile_standard
-from .. import util
 
 
 extract_lzip = extract_singlefile_standard
@@ -23,10 +22,9 @@ test_lzip = test_singlefile_standard
 
 def create_lzip(archive, compression, cmd, verbosity, interactive, filenames):
     """Create an LZIP archive."""
-    cmdlist = [util.shell_quote(cmd)]
+    cmdlist = [cmd]
     if verbosity > 1:
         cmdlist.append('-v')
     cmdlist.extend(['-c', '-9', '--'])
-    cmdlist.extend([util.shell_quote(x) for x in filenames])
-    cmdlist.extend(['>', util.shell_quote(archive)])
-    return (cmdlist, {'shell': True})
+    cmdlist.extend(filenames)
+    return (cmdlist, {'stdout_file': archive})
@@ -14,15 +14,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the uncompress.real program."""
-from .. import util
 
 
 def create_compress (archive, compression, cmd, verbosity, interactive, filenames):
     """Create a compressed archive."""
-    cmdlist = [util.shell_quote(cmd)]
+    cmdlist = [cmd]
     if verbosity > 1:
         cmdlist.append('-v')
     cmdlist.append('-c')
-    cmdlist.extend([util.shell_quote(x) for x in filenames])
-    cmdlist.extend(['>', util.shell_quote(archive)])
-    return (cmdlist, {'shell': True})
+    cmdlist.extend(filenames)
+    return (cmdlist, {'stdout_file': archive})
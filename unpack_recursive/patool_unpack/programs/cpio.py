@@ -16,19 +16,17 @@
 """Archive commands for the cpio program."""
 import os
 import sys
-from .. import util
 
 def extract_cpio (archive, compression, cmd, verbosity, interactive, output_dir):
     """Extract a CPIO archive."""
-    cmdlist = [util.shell_quote(cmd), '--extract', '--make-directories',
+    cmdlist = [cmd, '--extract', '--make-directories',
         '--preserve-modification-time']
     if sys.platform.startswith('linux') and not cmd.endswith('bsdcpio'):
         cmdlist.extend(['--no-absolute-filenames',
-        '--force-local', '--nonmatching', r'"*\.\.*"'])
+        '--force-local', '--nonmatching', r'*\.\.*'])
     if verbosity > 1:
         cmdlist.append('-v')
-    cmdlist.extend(['<', util.shell_quote(os.path.abspath(archive))])
-    return (cmdlist, {'cwd': output_dir, 'shell': True})
+    return (cmdlist, {'cwd': output_dir, 'stdin_file': os.path.abspath(archive)})
 
 
 def list_cpio (archive, compression, cmd, verbosity, interactive):
@@ -43,14 +41,14 @@ test_cpio = list_cpio
 
 def create_cpio(archive, compression, cmd, verbosity, interactive, filenames):
     """Create a CPIO archive."""
-    cmdlist = [util.shell_quote(cmd), '--create']
+    cmdlist = [cmd, '--create']
     if verbosity > 1:
         cmdlist.append('-v')
     if len(filenames) != 0:
+        # pipe the names found by find(1) into cpio
         findcmd = ['find']
-        findcmd.extend([util.shell_quote(x) for x in filenames])
-        findcmd.extend(['-print0', '|'])
-        cmdlist[0:0] = findcmd
+        findcmd.extend(filenames)
+        findcmd.append('-print0')
         cmdlist.append('-0')
-    cmdlist.extend([">", util.shell_quote(archive)])
-    return (cmdlist, {'shell': True})
+        cmdlist = [findcmd, cmdlist]
+    return (cmdlist, {'stdout_file': archive})
@@ -15,4 +15,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the pbzip2 program."""
 # bzip2 and lbzip2 are compatible
-from .bzip2 import extract_bzip2, test_bzip2, create_bzip2
+from . import bzip2, with_thread_option
+
+extract_bzip2 = with_thread_option(bzip2.extract_bzip2, '-n', '%d')
+test_bzip2 = with_thread_option(bzip2.test_bzip2, '-n', '%d')
+create_bzip2 = with_thread_option(bzip2.create_bzip2, '-n', '%d')
@@ -15,11 +15,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the lrzip program."""
 import os
-from .. import util
+from .. import util, threads
 
 def extract_lrzip (archive, compression, cmd, verbosity, interactive, output_dir):
     """Extract a LRZIP archive."""
     cmdlist = [cmd, '-d']
+    cmdlist.extend(['-p', str(threads.current_share())])
     if verbosity > 1:
         cmdlist.append('-v')
     outfile = util.get_single_outfile(output_dir, archive)
@@ -29,6 +30,7 @@ def extract_lrzip (archive, compression, cmd, verbosity, interactive, output_dir
 def test_lrzip (archive, compression, cmd, verbosity, interactive):
     """Test a LRZIP archive."""
     cmdlist = [cmd, '-t']
+    cmdlist.extend(['-p', str(threads.current_share())])
     if verbosity > 1:
         cmdlist.append('-v')
     cmdlist.append(archive)
@@ -37,6 +39,7 @@ def test_lrzip (archive, compression, cmd, verbosity, interactive):
 def create_lrzip (archive, compression, cmd, verbosity, interactive, filenames):
     """Create a LRZIP archive."""
     cmdlist = [cmd, '-o', archive]
+    cmdlist.extend(['-p', str(threads.current_share())])
     if verbosity > 1:
         cmdlist.append('-v')
     cmdlist.extend(filenames)
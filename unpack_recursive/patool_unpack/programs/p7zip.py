@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the 7z program."""
+from .. import threads
 
 
 def _add_existing_action(cmdlist: [], existing_action: str = "rename"):
@@ -27,20 +28,32 @@ def _add_existing_action(cmdlist: [], existing_action: str = "rename"):
         cmdlist.append('-aoa')
 
 
+def _add_threads(cmdlist):
+    """Limit 7z to the thread share of this command"""
+    cmdlist.append('-mmt=%d' % threads.current_share())
+
+
 def _maybe_add_password(cmdlist, password):
     if password:
         cmdlist.append('-p%s' % password)
 
 
 def extract_7z(archive, compression, cmd, verbosity, interactive, output_dir, password=None,
-               existing_action: str = "rename"):
-    """Extract a 7z archive."""
+               existing_action: str = "rename", members=None):
+    """Extract a 7z archive, only the given members if any."""
     cmdlist = [cmd, 'x']
     if not interactive:
         cmdlist.append('-y')
     _maybe_add_password(cmdlist, password)
-    cmdlist.extend(['-o%s' % output_dir, archive])
+    _add_threads(cmdlist)
     _add_existing_action(cmdlist, existing_action)
+    cmdlist.extend(['-o%s' % output_dir])
+    if members:
+        # member names are no wildcards
+        cmdlist.extend(['-spd', '--', archive])
+        cmdlist.extend(members)
+    else:
+        cmdlist.append(archive)
     return cmdlist
 
 
@@ -53,6 +66,7 @@ def extract_7z_singlefile(archive, compression, cmd, verbosity, interactive, out
     if not interactive:
         cmdlist.append('-y')
     _maybe_add_password(cmdlist, password)
+    _add_threads(cmdlist)
     cmdlist.extend(['-o%s' % output_dir, archive])
     _add_existing_action(cmdlist, existing_action)
     return cmdlist
@@ -114,6 +128,7 @@ def test_7z(archive, compression, cmd, verbosity, interactive, password=None):
     if not interactive:
         cmdlist.append('-y')
     _maybe_add_password(cmdlist, password)
+    _add_threads(cmdlist)
     cmdlist.extend(['--', archive])
     return cmdlist
 
@@ -143,6 +158,7 @@ def create_7z(archive, compression, cmd, verbosity, interactive, filenames, pass
     if not interactive:
         cmdlist.append('-y')
     _maybe_add_password(cmdlist, password)
+    _add_threads(cmdlist)
     cmdlist.extend(['-t7z', '-mx=9', '--', archive])
     cmdlist.extend(filenames)
     return cmdlist
@@ -154,6 +170,7 @@ def create_zip(archive, compression, cmd, verbosity, interactive, filenames, pas
     if not interactive:
         cmdlist.append('-y')
     _maybe_add_password(cmdlist, password)
+    _add_threads(cmdlist)
     cmdlist.extend(['-tzip', '-mx=9', '--', archive])
     cmdlist.extend(filenames)
     return cmdlist
@@ -165,6 +182,7 @@ def create_xz(archive, compression, cmd, verbosity, interactive, filenames, pass
     if not interactive:
         cmdlist.append('-y')
     _maybe_add_password(cmdlist, password)
+    _add_threads(cmdlist)
     cmdlist.extend(['-txz', '-mx=9', '--', archive])
     cmdlist.extend(filenames)
     return cmdlist
@@ -176,6 +194,7 @@ def create_gzip(archive, compression, cmd, verbosity, interactive, filenames, pa
     if not interactive:
         cmdlist.append('-y')
     _maybe_add_password(cmdlist, password)
+    _add_threads(cmdlist)
     cmdlist.extend(['-tgzip', '-mx=9', '--', archive])
     cmdlist.extend(filenames)
     return cmdlist
@@ -187,6 +206,7 @@ def create_bzip2(archive, compression, cmd, verbosity, interactive, filenames, p
     if not interactive:
         cmdlist.append('-y')
     _maybe_add_password(cmdlist, password)
+    _add_threads(cmdlist)
     cmdlist.extend(['-tbzip2', '-mx=9', '--', archive])
     cmdlist.extend(filenames)
     return cmdlist
@@ -14,4 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the pigz program."""
-from .gzip import extract_gzip, test_gzip, create_gzip, list_gzip
+from . import gzip, with_thread_option
+from .gzip import list_gzip
+
+extract_gzip = with_thread_option(gzip.extract_gzip, '-p', '%d')
+test_gzip = with_thread_option(gzip.test_gzip, '-p', '%d')
+create_gzip = with_thread_option(gzip.create_gzip, '-p', '%d')
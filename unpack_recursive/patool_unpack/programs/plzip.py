@@ -15,9 +15,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the plzip program."""
 from . import extract_singlefile_standard, \
-    test_singlefile_standard, create_singlefile_standard
+    test_singlefile_standard, create_singlefile_standard, with_thread_option
 
 
-extract_lzip = extract_singlefile_standard
-test_lzip = test_singlefile_standard
-create_lzip = create_singlefile_standard
+extract_lzip = with_thread_option(extract_singlefile_standard, '-n', '%d')
+test_lzip = with_thread_option(test_singlefile_standard, '-n', '%d')
+create_lzip = with_thread_option(create_singlefile_standard, '-n', '%d')
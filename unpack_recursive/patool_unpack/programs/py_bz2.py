@@ -14,32 +14,155 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the bz2 Python module."""
-from .. import util
+import os
+import re
+from bz2 import BZ2Decompressor
+from .. import util, fileio, threads
 try:
     # try external bz2file module with multi-stream support
     import bz2file as bz2
 except ImportError:
     import bz2
 
-# read in 1MB chunks
-READ_SIZE_BYTES = 1024*1024
+# stream header ("BZh" and the block size) and magic number of the first block
+STREAM_START = re.compile(rb'BZh[1-9]1AY&SY')
+STREAM_START_LENGTH = 10
+# bytes scanned for stream headers at once, files without a second stream
+# in the first scan are decompressed sequentially
+SCAN_SIZE_BYTES = 8 * 1024 * 1024
+# compressed bytes decompressed by one task
+TASK_SIZE_BYTES = 4 * 1024 * 1024
+# decompressed bytes one task may hold in memory, files of streams that expand
+# more are decompressed sequentially
+MAX_TASK_OUTPUT_BYTES = 64 * 1024 * 1024
+# bigger streams are not read into memory at once
+MAX_STREAM_SIZE_BYTES = 64 * 1024 * 1024
 
-def extract_bzip2 (archive, compression, cmd, verbosity, interactive, output_dir):
-    """Extract a BZIP2 archive with the bz2 Python module."""
+def extract_bzip2 (archive, compression, cmd, verbosity, interactive, output_dir, output_hashes=None):
+    """Extract a BZIP2 archive with the bz2 Python module. Files of many
+    streams (written by pbzip2 or concatenated) are decompressed with
+    several threads (see threads module). If output_hashes is given, the
+    output is hashed while it is written (after that, if it was written by
+    several threads)."""
     targetname = util.get_single_outfile(output_dir, archive)
+    target = None
     try:
-        with bz2.BZ2File(archive) as bz2file:
-            with open(targetname, 'wb') as targetfile:
-                data = bz2file.read(READ_SIZE_BYTES)
-                while data:
-                    targetfile.write(data)
-                    data = bz2file.read(READ_SIZE_BYTES)
+        with fileio.open_sequential(archive) as archivefile:
+            with open(targetname, 'wb', buffering=0) as targetfile:
+                workers = threads.current_share()
+                tasks = get_stream_tasks(archivefile) if workers > 1 and hasattr(os, 'pread') else None
+                if not tasks or not extract_streams_parallel(archivefile, tasks, targetfile, workers):
+                    archivefile.seek(0)
+                    targetfile.seek(0)
+                    targetfile.truncate()
+                    target = targetfile if output_hashes is None else output_hashes.writer(targetfile)
+                    with bz2.BZ2File(archivefile) as bz2file:
+                        fileio.copy_stream(bz2file, target, fileio.get_buffer_size(archive))
+        if output_hashes is not None:
+            if target is None:
+                # written by several threads
+                output_hashes.add_file(targetname, output_dir)
+            else:
+                output_hashes.add_writer(target, targetname, output_dir)
     except Exception as err:
         msg = "error extracting %s to %s: %s" % (archive, targetname, err)
         raise util.PatoolError(msg)
     return None
 
 
+def get_stream_tasks(fileobj):
+    """Return an iterator of tasks (start, end, number of streams, last) of
+    about TASK_SIZE_BYTES, which scans the rest of the file for stream
+    headers while the tasks run. Return None, after reading only the first
+    SCAN_SIZE_BYTES, if the file does not start with two streams there:
+    most files have one stream (also those of lbzip2), pbzip2 writes
+    streams of at most 900 kB."""
+    data = fileobj.read(SCAN_SIZE_BYTES)
+    if not STREAM_START.match(data) or len(STREAM_START.findall(data)) < 2:
+        return None
+    return group_streams(iter_stream_boundaries(fileobj, data))
+
+
+def iter_stream_boundaries(fileobj, data=b''):
+    """Yield the offsets of all bzip2 stream headers, then the size of the
+    file. data was already read from the start of the file, the rest is
+    read in chunks of SCAN_SIZE_BYTES. Compressed data may contain the
+    header by chance, such false offsets make the stream before fail to
+    decompress."""
+    base = 0
+    last = -1
+    while True:
+        for match in STREAM_START.finditer(data):
+            if base + match.start() > last:
+                last = base + match.start()
+                yield last
+        chunk = fileobj.read(SCAN_SIZE_BYTES)
+        if not chunk:
+            yield base + len(data)
+            return
+        # a header may start in the previous chunk
+        tail = data[-(STREAM_START_LENGTH - 1):]
+        base += len(data) - len(tail)
+        data = tail + chunk
+
+
+def group_streams(boundaries):
+    """Group the streams between the boundaries into tasks, see
+    get_stream_tasks. Raise _BrokenSplit for streams too big for the
+    memory of one task."""
+    start = previous = next(boundaries)
+    streams = 0
+    end = next(boundaries, None)
+    while end is not None:
+        following = next(boundaries, None)
+        if end - previous > MAX_STREAM_SIZE_BYTES:
+            raise _BrokenSplit()
+        streams += 1
+        if end - start >= TASK_SIZE_BYTES or following is None:
+            yield start, end, streams, following is None
+            start = end
+            streams = 0
+        previous = end
+        end = following
+
+
+def extract_streams_parallel(archivefile, tasks, targetfile, workers):
+    """Decompress the tasks in a pool of threads and write their output in
+    order. Return False if the file is not split at real stream boundaries,
+    a stream is too big or a task would decompress to more than
+    MAX_TASK_OUTPUT_BYTES."""
+    fd = archivefile.fileno()
+    try:
+        for data in threads.imap(lambda task: _decompress_streams(fd, *task), tasks, workers):
+            fileio.write_all(targetfile, data)
+    except (_BrokenSplit, OSError, EOFError, ValueError):
+        # let the sequential decompression report real errors
+        return False
+    return True
+
+
+class _BrokenSplit(Exception):
+    pass
+
+
+def _decompress_streams(fd, start, end, streams, last):
+    data = os.pread(fd, end - start, start)
+    output = []
+    remaining = MAX_TASK_OUTPUT_BYTES
+    for _ in range(streams):
+        decompressor = BZ2Decompressor()
+        output.append(decompressor.decompress(data, max_length=remaining))
+        remaining -= len(output[-1])
+        # not at the end: a false stream boundary or output over the limit
+        if not decompressor.eof:
+            raise _BrokenSplit()
+        data = decompressor.unused_data
+    # the last stream may be followed by garbage, which bzip2 ignores
+    if data and not last:
+        raise _BrokenSplit()
+    return b''.join(output)
+
+
 def create_bzip2 (archive, compression, cmd, verbosity, interactive, filenames):
     """Create a BZIP2 archive with the bz2 Python module."""
     if len(filenames) > 1:
@@ -47,11 +170,8 @@ def create_bzip2 (archive, compression, cmd, verbosity, interactive, filenames):
     try:
         with bz2.BZ2File(archive, 'wb') as bz2file:
             filename = filenames[0]
-            with open(filename, 'rb') as srcfile:
-                data = srcfile.read(READ_SIZE_BYTES)
-                while data:
-                    bz2file.write(data)
-                    data = srcfile.read(READ_SIZE_BYTES)
+            with fileio.open_sequential(filename) as srcfile:
+                fileio.copy_stream(srcfile, bz2file, fileio.get_buffer_size(filename))
     except Exception as err:
         msg = "error creating %s: %s" % (archive, err)
         raise util.PatoolError(msg)
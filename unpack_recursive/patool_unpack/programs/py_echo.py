@@ -29,6 +29,7 @@ list_compress = \
   list_lzip = \
   list_lrzip = \
   list_rzip = \
+  list_zstd = \
   list_bzip2
 
 def list_ape (archive, compression, cmd, verbosity, interactive):
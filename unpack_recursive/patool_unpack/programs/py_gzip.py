@@ -17,20 +17,20 @@
 from __future__ import absolute_import
 # now gzip refers to the Python standard module, not the local one
 import gzip
-from .. import util
+from .. import util, fileio
 
-READ_SIZE_BYTES = 1024*1024
 
-def extract_gzip (archive, compression, cmd, verbosity, interactive, output_dir):
-    """Extract a GZIP archive with the gzip Python module."""
+def extract_gzip (archive, compression, cmd, verbosity, interactive, output_dir, output_hashes=None):
+    """Extract a GZIP archive with the gzip Python module, hashing the
+    output while it is written if output_hashes is given."""
     targetname = util.get_single_outfile(output_dir, archive)
     try:
-        with gzip.GzipFile(archive) as gzipfile:
-            with open(targetname, 'wb') as targetfile:
-                data = gzipfile.read(READ_SIZE_BYTES)
-                while data:
-                    targetfile.write(data)
-                    data = gzipfile.read(READ_SIZE_BYTES)
+        with fileio.open_sequential(archive) as archivefile, gzip.GzipFile(fileobj=archivefile) as gzipfile:
+            with open(targetname, 'wb', buffering=0) as targetfile:
+                target = targetfile if output_hashes is None else output_hashes.writer(targetfile)
+                fileio.copy_stream(gzipfile, target, fileio.get_buffer_size(archive))
+        if output_hashes is not None:
+            output_hashes.add_writer(target, targetname, output_dir)
     except Exception as err:
         msg = "error extracting %s to %s: %s" % (archive, targetname, err)
         raise util.PatoolError(msg)
@@ -44,11 +44,8 @@ def create_gzip (archive, compression, cmd, verbosity, interactive, filenames):
     try:
         with gzip.GzipFile(archive, 'wb') as gzipfile:
             filename = filenames[0]
-            with open(filename, 'rb') as srcfile:
-                data = srcfile.read(READ_SIZE_BYTES)
-                while data:
-                    gzipfile.write(data)
-                    data = srcfile.read(READ_SIZE_BYTES)
+            with fileio.open_sequential(filename) as srcfile:
+                fileio.copy_stream(srcfile, gzipfile, fileio.get_buffer_size(filename))
     except Exception as err:
         msg = "error creating %s: %s" % (archive, err)
         raise util.PatoolError(msg)
@@ -17,10 +17,15 @@
 
 from __future__ import absolute_import
 
-from .. import util
+from .. import util, fileio, listing, threads
 import lzma
+import os
+import struct
+import zlib
 
-READ_SIZE_BYTES = 1024*1024
+XZ_HEADER_MAGIC = b'\xfd7zXZ\x00'
+# bigger blocks are not decompressed into memory at once
+MAX_BLOCK_SIZE_BYTES = 256 * 1024 * 1024
 
 # Adapters for different lzma bindings.
 if hasattr(lzma, 'FORMAT_ALONE'):
@@ -47,28 +52,116 @@ else:
         return kwargs
 
 
-def _extract(archive, compression, cmd, format, verbosity, output_dir):
-    """Extract an LZMA or XZ archive with the lzma Python module."""
+def _extract(archive, compression, cmd, format, verbosity, output_dir, output_hashes=None):
+    """Extract an LZMA or XZ archive with the lzma Python module. XZ files
+    of many blocks (written by xz -T) are decompressed with several threads
+    (see threads module). If output_hashes is given, the output is hashed
+    while it is written (after that, if it was written by several threads)."""
     targetname = util.get_single_outfile(output_dir, archive)
+    target = None
     try:
-        with lzma.LZMAFile(archive, **_get_lzma_options(format)) as lzmafile:
-            with open(targetname, 'wb') as targetfile:
-                data = lzmafile.read(READ_SIZE_BYTES)
-                while data:
-                    targetfile.write(data)
-                    data = lzmafile.read(READ_SIZE_BYTES)
+        with fileio.open_sequential(archive) as archivefile:
+            with open(targetname, 'wb', buffering=0) as targetfile:
+                workers = threads.current_share()
+                blocks = None
+                if format == 'xz' and workers > 1 and hasattr(os, 'pwrite') and hasattr(lzma, 'LZMADecompressor'):
+                    blocks = get_parallel_blocks(archivefile)
+                if not blocks or not extract_blocks_parallel(archivefile, blocks, targetfile, workers):
+                    archivefile.seek(0)
+                    targetfile.seek(0)
+                    targetfile.truncate()
+                    target = targetfile if output_hashes is None else output_hashes.writer(targetfile)
+                    with lzma.LZMAFile(archivefile, **_get_lzma_options(format)) as lzmafile:
+                        fileio.copy_stream(lzmafile, target, fileio.get_buffer_size(archive))
+        if output_hashes is not None:
+            if target is None:
+                # written by several threads
+                output_hashes.add_file(targetname, output_dir)
+            else:
+                output_hashes.add_writer(target, targetname, output_dir)
     except Exception as err:
         msg = "error extracting %s to %s: %s" % (archive, targetname, err)
         raise util.PatoolError(msg)
     return None
 
-def extract_lzma(archive, compression, cmd, verbosity, interactive, output_dir):
+
+def get_parallel_blocks(archivefile):
+    """Return (offset, unpadded size, uncompressed size, stream flags, output
+    offset) of the blocks of an xz file from its index, or None if it has
+    one block only, blocks too big for memory or no readable index."""
+    try:
+        blocks = listing.read_xz_blocks(archivefile)
+    except (util.PatoolError, struct.error, IndexError, OSError):
+        return None
+    if len(blocks) < 2 or max(uncompressed for _, _, uncompressed, _ in blocks) > MAX_BLOCK_SIZE_BYTES:
+        return None
+    result = []
+    output_offset = 0
+    for offset, unpadded, uncompressed, flags in blocks:
+        result.append((offset, unpadded, uncompressed, flags, output_offset))
+        output_offset += uncompressed
+    return result
+
+
+def extract_blocks_parallel(archivefile, blocks, targetfile, workers):
+    """Decompress the blocks in a pool of threads, each one is written at its
+    offset of the preallocated output file. Return False if a block can't be
+    decompressed."""
+    fd = archivefile.fileno()
+    target_fd = targetfile.fileno()
+    _, _, uncompressed, _, output_offset = blocks[-1]
+    targetfile.truncate(output_offset + uncompressed)
+    try:
+        for _ in threads.imap(lambda block: _extract_block(fd, target_fd, *block), blocks, workers):
+            pass
+    except (_BrokenBlock, lzma.LZMAError, OSError, EOFError, ValueError):
+        # let the sequential decompression report the error
+        return False
+    return True
+
+
+class _BrokenBlock(Exception):
+    pass
+
+
+def _extract_block(fd, target_fd, offset, unpadded, uncompressed, flags, output_offset):
+    """Decompress one block as the only block of an xz stream made up
+    around it, so liblzma parses the block header and verifies the check."""
+    block = os.pread(fd, (unpadded + 3) & ~3, offset)
+    index = b'\x00' + _encode_multibyte_integer(1) + _encode_multibyte_integer(unpadded) + \
+        _encode_multibyte_integer(uncompressed)
+    index += b'\x00' * (-len(index) % 4)
+    index += struct.pack('<I', zlib.crc32(index))
+    backward = struct.pack('<I', len(index) // 4 - 1) + flags
+    footer = struct.pack('<I', zlib.crc32(backward)) + backward + b'YZ'
+    header = XZ_HEADER_MAGIC + flags + struct.pack('<I', zlib.crc32(flags))
+    decompressor = lzma.LZMADecompressor(lzma.FORMAT_XZ)
+    output = b''.join(decompressor.decompress(part) for part in (header, block, index + footer))
+    if not decompressor.eof or len(output) != uncompressed:
+        raise _BrokenBlock()
+    output = memoryview(output)
+    written = 0
+    while written < uncompressed:
+        written += os.pwrite(target_fd, output[written:], output_offset + written)
+
+
+def _encode_multibyte_integer(value):
+    """Encode a variable length integer of the xz format."""
+    data = bytearray()
+    while value >= 0x80:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def extract_lzma(archive, compression, cmd, verbosity, interactive, output_dir, output_hashes=None):
     """Extract an LZMA archive with the lzma Python module."""
-    return _extract(archive, compression, cmd, 'alone', verbosity, output_dir)
+    return _extract(archive, compression, cmd, 'alone', verbosity, output_dir, output_hashes)
 
-def extract_xz(archive, compression, cmd, verbosity, interactive, output_dir):
+def extract_xz(archive, compression, cmd, verbosity, interactive, output_dir, output_hashes=None):
     """Extract an XZ archive with the lzma Python module."""
-    return _extract(archive, compression, cmd, 'xz', verbosity, output_dir)
+    return _extract(archive, compression, cmd, 'xz', verbosity, output_dir, output_hashes)
 
 
 def _create(archive, compression, cmd, format, verbosity, filenames):
@@ -78,11 +171,8 @@ def _create(archive, compression, cmd, format, verbosity, filenames):
     try:
         with lzma.LZMAFile(archive, mode='wb', **_get_lzma_options(format, preset=9)) as lzmafile:
             filename = filenames[0]
-            with open(filename, 'rb') as srcfile:
-                data = srcfile.read(READ_SIZE_BYTES)
-                while data:
-                    lzmafile.write(data)
-                    data = srcfile.read(READ_SIZE_BYTES)
+            with fileio.open_sequential(filename) as srcfile:
+                fileio.copy_stream(srcfile, lzmafile, fileio.get_buffer_size(filename))
     except Exception as err:
         msg = "error creating %s: %s" % (archive, err)
         raise util.PatoolError(msg)
@@ -14,17 +14,82 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the tarfile Python module."""
-from .. import util, py_lzma
-import tarfile
+import copy
+import io
+from .. import util, py_lzma, fileio, scanning
+try:
+    # backport of the Python 3.14 tarfile module, which reads zstd compressed archives
+    from backports.zstd import tarfile
+except ImportError:
+    import tarfile
 
 READ_SIZE_BYTES = 1024*1024
 
 
+class UnpackTarFile(tarfile.TarFile):
+    """TarFile that copies the data of big members of uncompressed archives
+    with fileio.copy_range() instead of reading it into Python, and keeps
+    extracted members readable by the user. If output_hashes is set, the
+    data of regular members is hashed while it is written."""
+
+    output_hashes = None
+    output_dir = None
+
+    def makefile(self, tarinfo, targetpath, *args, **kwargs):
+        if self.output_hashes is not None and tarinfo.sparse is None:
+            self.fileobj.seek(tarinfo.offset_data)
+            with open(targetpath, 'wb', buffering=0) as target:
+                writer = self.output_hashes.writer(target)
+                source = _LimitedReader(self.fileobj, tarinfo.size)
+                if fileio.copy_stream(source, writer, READ_SIZE_BYTES) != tarinfo.size:
+                    raise tarfile.ReadError("unexpected end of data")
+            self.output_hashes.add_writer(writer, targetpath, self.output_dir)
+        # compressed archives are read through GzipFile, BZ2File, ...
+        elif tarinfo.sparse is None and tarinfo.size >= fileio.MIN_COPY_RANGE_BYTES and \
+                isinstance(self.fileobj, io.BufferedReader) and fileio.can_copy_range():
+            with open(targetpath, 'wb') as target:
+                fileio.copy_range(self.fileobj.fileno(), tarinfo.offset_data, tarinfo.size, target.fileno())
+        else:
+            super(UnpackTarFile, self).makefile(tarinfo, targetpath, *args, **kwargs)
+            if self.output_hashes is not None:
+                # sparse member
+                self.output_hashes.add_file(targetpath, self.output_dir)
+
+    def chmod(self, tarinfo, targetpath):
+        # add the flags scanning.scan_output_dir() would add afterwards
+        flags = scanning.DIRECTORY_MODE if tarinfo.isdir() else scanning.FILE_MODE
+        if tarinfo.mode is not None and tarinfo.mode & flags != flags:
+            tarinfo = copy.copy(tarinfo)
+            tarinfo.mode |= flags
+        super(UnpackTarFile, self).chmod(tarinfo, targetpath)
+
+
+class _LimitedReader(object):
+    """readinto() of at most size bytes of a file object."""
+
+    def __init__(self, fileobj, size):
+        self.fileobj = fileobj
+        self.remaining = size
+
+    def readinto(self, buffer):
+        if self.remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:self.remaining]
+        data = self.fileobj.read(len(view))
+        view[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
 def list_tar (archive, compression, cmd, verbosity, interactive):
     """List a TAR archive with the tarfile Python module."""
     try:
         with tarfile.open(archive) as tfile:
-            tfile.list(verbose=verbosity>1)
+            if verbosity >= 0:
+                tfile.list(verbose=verbosity>1)
+            else:
+                # still read all headers to detect a broken archive
+                tfile.getmembers()
     except Exception as err:
         msg = "error listing %s: %s" % (archive, err)
         raise util.PatoolError(msg)
@@ -32,11 +97,20 @@ def list_tar (archive, compression, cmd, verbosity, interactive):
 
 test_tar = list_tar
 
-def extract_tar (archive, compression, cmd, verbosity, interactive, output_dir):
-    """Extract a TAR archive with the tarfile Python module."""
+def extract_tar (archive, compression, cmd, verbosity, interactive, output_dir, member_filter=None,
+                 output_hashes=None):
+    """Extract a TAR archive with the tarfile Python module. With a
+    member_filter only the selected files are extracted, with output_hashes
+    the files are hashed while they are written."""
     try:
-        with tarfile.open(archive) as tfile:
-            tfile.extractall(path=output_dir)
+        with UnpackTarFile.open(archive) as tfile:
+            tfile.output_hashes = output_hashes
+            tfile.output_dir = output_dir
+            members = None
+            if member_filter:
+                # a generator, so compressed archives are still read only once
+                members = (member for member in tfile if not member.isdir() and member_filter(member.name))
+            tfile.extractall(path=output_dir, members=members)
     except Exception as err:
         msg = "error extracting %s: %s" % (archive, err)
         raise util.PatoolError(msg)
@@ -64,6 +138,8 @@ def get_tar_mode (compression):
         return 'w:bz2'
     if compression == 'lzma' and py_lzma:
         return 'w:xz'
+    if compression == 'zstd' and 'zst' in tarfile.TarFile.OPEN_METH:
+        return 'w:zst'
     if compression:
         msg = 'pytarfile does not support %s for tar compression'
         raise util.PatoolError(msg % compression)
@@ -15,11 +15,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the zipfile Python module."""
 from __future__ import print_function
-from .. import util
-import zipfile
+from .. import util, threads, fileio
+try:
+    # backport of the Python 3.14 zipfile module, which reads Zstandard compressed members (method 93)
+    from backports.zstd import zipfile
+except ImportError:
+    import zipfile
+import concurrent.futures
+import heapq
 import os
+import struct
 
 READ_SIZE_BYTES = 1024*1024
+# zips with fewer members per available thread are extracted by one thread
+MIN_MEMBERS_PER_WORKER = 16
+MEMBER_COST_BYTES = 4096
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+LOCAL_HEADER_SIZE = 30
 
 
 def list_zip(archive, compression, cmd, verbosity, interactive, password=None):
@@ -36,21 +48,170 @@ def list_zip(archive, compression, cmd, verbosity, interactive, password=None):
         raise util.PatoolError(msg)
     return None
 
-test_zip = list_zip
 
-def extract_zip(archive, compression, cmd, verbosity, interactive, output_dir, password=None):
-    """Extract a ZIP archive with the zipfile Python module."""
+def test_zip(archive, compression, cmd, verbosity, interactive, password=None):
+    """Test a ZIP archive with the zipfile Python module: read all members
+    and check their CRCs (this also fails for encrypted members without
+    the right password)."""
+    try:
+        with zipfile.ZipFile(archive, "r") as zfile:
+            if password:
+                zfile.setpassword(pwd=password.encode())
+            bad_member = zfile.testzip()
+    except Exception as err:
+        msg = "error testing %s: %s" % (archive, err)
+        raise util.PatoolError(msg)
+    if bad_member is not None:
+        raise util.PatoolError("error testing %s: bad CRC of member %s" % (archive, bad_member))
+    return None
+
+
+def extract_zip(archive, compression, cmd, verbosity, interactive, output_dir, password=None,
+                member_filter=None, output_hashes=None):
+    """Extract a ZIP archive with the zipfile Python module, with several
+    threads (see threads module) if it has many members. With a
+    member_filter only the selected files are extracted, with output_hashes
+    the files are hashed while they are written."""
     try:
         if password:
             password = password.encode()
         with zipfile.ZipFile(archive) as zfile:
-            zfile.extractall(output_dir, pwd=password)
+            members = zfile.infolist()
+            if member_filter:
+                members = [member for member in members
+                           if not member.is_dir() and member_filter(member.filename)]
+            workers = min(threads.current_share(), len(members) // MIN_MEMBERS_PER_WORKER)
+            if workers < 2:
+                extract_members(zfile, members, output_dir, password, output_hashes)
+                return None
+        extract_zip_parallel(archive, members, output_dir, password, workers, output_hashes)
     except Exception as err:
         msg = "error extracting %s: %s" % (archive, err)
         raise util.PatoolError(msg)
     return None
 
 
+def extract_zip_parallel(archive, members, output_dir, password, workers, output_hashes=None):
+    """Extract members with a pool of threads, each one with its own ZipFile.
+    zlib, bz2 and lzma release the GIL while they decompress."""
+    # ZipFile.extract() creates missing parent directories with os.makedirs(),
+    # which fails if another thread creates the same directory first
+    for directory in sorted(set(get_member_directories(members, output_dir))):
+        os.makedirs(directory, exist_ok=True)
+    partitions = partition_members(members, workers)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+        futures = [executor.submit(_extract_members, archive, partition, output_dir, password, output_hashes)
+                   for partition in partitions]
+        for future in futures:
+            future.result()
+
+
+def _extract_members(archive, members, output_dir, password, output_hashes):
+    with zipfile.ZipFile(archive) as zfile:
+        extract_members(zfile, members, output_dir, password, output_hashes)
+
+
+def extract_members(zfile, members, output_dir, password, output_hashes=None):
+    """Extract members like ZipFile.extractall(), big stored members are
+    copied by the kernel (see fileio module) unless they are hashed."""
+    zero_copy = fileio.can_copy_range() and hasattr(zfile.fp, 'fileno') and output_hashes is None
+    for member in members:
+        if zero_copy and is_plain_stored(member):
+            extract_stored_member(zfile, member, output_dir)
+        elif output_hashes is not None and not member.is_dir():
+            if output_hashes.dedup is None or not link_known_member(member, output_dir, output_hashes):
+                extract_hashed_member(zfile, member, output_dir, password, output_hashes)
+        else:
+            zfile.extract(member, output_dir, pwd=password)
+
+
+def extract_hashed_member(zfile, member, output_dir, password, output_hashes):
+    """Extract a member like ZipFile.extract() and record the hash of its data."""
+    path = get_member_path(member.filename, output_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zfile.open(member, pwd=password) as source, open(path, 'wb', buffering=0) as target:
+        writer = output_hashes.writer(target)
+        fileio.copy_stream(source, writer, READ_SIZE_BYTES)
+    output_hashes.add_writer(writer, path, output_dir)
+    if output_hashes.dedup is not None:
+        output_hashes.dedup.add_crc(member.file_size, member.CRC, path, writer.digest.hexdigest())
+    return path
+
+
+def link_known_member(member, output_dir, output_hashes):
+    """Link the member to an extracted file with the same size and CRC-32
+    (see dedup module) instead of extracting it.
+    @return: True if it was linked"""
+    path = get_member_path(member.filename, output_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = output_hashes.dedup.link_crc(member.file_size, member.CRC, path)
+    if digest is None:
+        return False
+    output_hashes.add(os.path.relpath(path, output_dir), member.file_size, digest, crc_match=True)
+    return True
+
+
+def is_plain_stored(member):
+    """Check if the member data is stored unencrypted and big enough to
+    copy it with fileio.copy_range()."""
+    return member.compress_type == zipfile.ZIP_STORED and not member.flag_bits & 0x1 and \
+        not member.is_dir() and member.file_size >= fileio.MIN_COPY_RANGE_BYTES and \
+        member.compress_size == member.file_size
+
+
+def extract_stored_member(zfile, member, output_dir):
+    """Copy the data of a stored member from the archive file into the
+    output file inside the kernel, then check its CRC-32 like
+    ZipFile.extract() does, reading the copied range of the archive again
+    (from the page cache)."""
+    path = get_member_path(member.filename, output_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = zfile.fp.fileno()
+    header = os.pread(fd, LOCAL_HEADER_SIZE, member.header_offset)
+    if len(header) != LOCAL_HEADER_SIZE or header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile("Bad magic number for file header of %s" % member.filename)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    offset = member.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+    with open(path, 'wb') as target:
+        fileio.copy_range(fd, offset, member.file_size, target.fileno())
+    if fileio.crc32_range(fd, offset, member.file_size) != member.CRC:
+        raise zipfile.BadZipFile("Bad CRC-32 for file %r" % member.filename)
+    return path
+
+
+def partition_members(members, count):
+    """Split the members into count lists of about the same compressed size,
+    the biggest members first (longest processing time first)."""
+    partitions = [(0, number, []) for number in range(count)]
+    for member in sorted(members, key=lambda member: member.compress_size, reverse=True):
+        size, number, partition = heapq.heappop(partitions)
+        partition.append(member)
+        # creating a file costs about as much as inflating a few KiB
+        heapq.heappush(partitions, (size + member.compress_size + MEMBER_COST_BYTES, number, partition))
+    return [partition for _, _, partition in sorted(partitions, key=lambda item: item[1]) if partition]
+
+
+def get_member_directories(members, output_dir):
+    """Yield the directories ZipFile.extract() needs for the members,
+    with the same sanitizing of member names as zipfile."""
+    for member in members:
+        path = get_member_path(member.filename, output_dir)
+        yield path if member.is_dir() else os.path.dirname(path)
+
+
+def get_member_path(name, output_dir):
+    """Return the path ZipFile.extract() writes the named member to."""
+    name = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        name = name.replace(os.path.altsep, os.path.sep)
+    name = os.path.splitdrive(name)[1]
+    name = os.path.sep.join(part for part in name.split(os.path.sep)
+                            if part not in ('', os.path.curdir, os.path.pardir))
+    if os.path.sep == '\\':
+        name = zipfile.ZipFile._sanitize_windows_name(name, os.path.sep)
+    return os.path.normpath(os.path.join(output_dir, name))
+
+
 def create_zip(archive, compression, cmd, verbosity, interactive, filenames):
     """Create a ZIP archive with the zipfile Python module."""
     try:
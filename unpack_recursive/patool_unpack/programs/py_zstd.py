@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Archive commands for the zstd Python module (compression.zstd of
+Python 3.14, or the backports.zstd package for older versions)."""
+from .. import util, fileio
+try:
+    from compression import zstd
+except ImportError:
+    from backports import zstd
+
+READ_SIZE_BYTES = 1024*1024
+
+
+def extract_zstd(archive, compression, cmd, verbosity, interactive, output_dir, output_hashes=None):
+    """Extract a ZSTD archive with the zstd Python module, hashing the
+    output while it is written if output_hashes is given."""
+    targetname = util.get_single_outfile(output_dir, archive)
+    try:
+        with fileio.open_sequential(archive) as archivefile, zstd.ZstdFile(archivefile) as zstdfile:
+            with open(targetname, 'wb', buffering=0) as targetfile:
+                target = targetfile if output_hashes is None else output_hashes.writer(targetfile)
+                fileio.copy_stream(zstdfile, target, fileio.get_buffer_size(archive))
+        if output_hashes is not None:
+            output_hashes.add_writer(target, targetname, output_dir)
+    except Exception as err:
+        msg = "error extracting %s to %s: %s" % (archive, targetname, err)
+        raise util.PatoolError(msg)
+    return None
+
+
+def test_zstd(archive, compression, cmd, verbosity, interactive):
+    """Test a ZSTD archive by decompressing it with the zstd Python module
+    (frames with a checksum are verified by the decompressor)."""
+    try:
+        with zstd.ZstdFile(archive) as zstdfile:
+            while zstdfile.read(READ_SIZE_BYTES):
+                pass
+    except Exception as err:
+        msg = "error testing %s: %s" % (archive, err)
+        raise util.PatoolError(msg)
+    return None
+
+
+def create_zstd(archive, compression, cmd, verbosity, interactive, filenames):
+    """Create a ZSTD archive with the zstd Python module."""
+    if len(filenames) > 1:
+        raise util.PatoolError('multi-file compression not supported in Python zstd')
+    try:
+        with zstd.ZstdFile(archive, 'wb', level=19) as zstdfile:
+            with fileio.open_sequential(filenames[0]) as srcfile:
+                fileio.copy_stream(srcfile, zstdfile, fileio.get_buffer_size(filenames[0]))
+    except Exception as err:
+        msg = "error creating %s: %s" % (archive, err)
+        raise util.PatoolError(msg)
+    return None
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Archive commands for the pzstd program (parallel zstd, decompression
+of archives made by pzstd is multi-threaded too)."""
+from . import extract_singlefile_standard, test_singlefile_standard, with_thread_option
+from .zstd import _create_zstd
+
+extract_zstd = with_thread_option(extract_singlefile_standard, '-p', '%d')
+test_zstd = with_thread_option(test_singlefile_standard, '-p', '%d')
+create_zstd = with_thread_option(_create_zstd, '-p', '%d')
@@ -23,11 +23,10 @@ def extract_rpm (archive, compression, cmd, verbosity, interactive, output_dir):
     cpio = util.find_program("cpio")
     if not cpio:
         raise util.PatoolError("cpio(1) is required for rpm2cpio extraction; please install it")
-    path = util.shell_quote(os.path.abspath(archive))
-    cmdlist = [util.shell_quote(cmd), path, "|", util.shell_quote(cpio),
-        '--extract', '--make-directories', '--preserve-modification-time',
-        '--no-absolute-filenames', '--force-local', '--nonmatching',
-        r'"*\.\.*"']
+    cpiocmd = [cpio, '--extract', '--make-directories', '--preserve-modification-time',
+        '--no-absolute-filenames', '--force-local', '--nonmatching', r'*\.\.*']
     if verbosity > 1:
-        cmdlist.append('-v')
-    return (cmdlist, {'cwd': output_dir, 'shell': True})
+        cpiocmd.append('-v')
+    # rpm2cpio writes the cpio archive to stdout, which is piped into cpio
+    cmdlist = [[cmd, os.path.abspath(archive)], cpiocmd]
+    return (cmdlist, {'cwd': output_dir})
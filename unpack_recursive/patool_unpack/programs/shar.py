@@ -14,11 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the shar program."""
-from .. import util
 
 def create_shar (archive, compression, cmd, verbosity, interactive, filenames):
     """Create a SHAR archive."""
-    cmdlist = [util.shell_quote(cmd)]
-    cmdlist.extend([util.shell_quote(x) for x in filenames])
-    cmdlist.extend(['>', util.shell_quote(archive)])
-    return (cmdlist, {'shell': True})
+    cmdlist = [cmd]
+    cmdlist.extend(filenames)
+    return (cmdlist, {'stdout_file': archive})
@@ -18,18 +18,14 @@ from .. import util
 
 def extract_shn (archive, compression, cmd, verbosity, interactive, output_dir):
     """Decompress a SHN archive to a WAV file."""
-    cmdlist = [util.shell_quote(cmd)]
     outfile = util.get_single_outfile(output_dir, archive, extension=".wav")
-    cmdlist.extend(['-x', '-', util.shell_quote(outfile), '<',
-                    util.shell_quote(archive)])
-    return (cmdlist, {'shell': True})
+    cmdlist = [cmd, '-x', '-', outfile]
+    return (cmdlist, {'stdin_file': archive})
 
 
 def create_shn (archive, compression, cmd, verbosity, interactive, filenames):
     """Compress a WAV file to a SHN archive."""
     if len(filenames) > 1:
         raise util.PatoolError("multiple filenames for shorten not supported")
-    cmdlist = [util.shell_quote(cmd)]
-    cmdlist.extend(['-', util.shell_quote(archive), '<',
-                    util.shell_quote(filenames[0])])
-    return (cmdlist, {'shell': True})
+    cmdlist = [cmd, '-', archive]
+    return (cmdlist, {'stdin_file': filenames[0]})
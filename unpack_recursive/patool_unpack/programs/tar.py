@@ -15,13 +15,35 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the GNU tar program."""
 import os
+from .. import util, tuning, threads
 
+# Multi-threaded (de)compressors GNU tar can run with --use-compress-program,
+# as (program, options) in the order they are tried; %d is replaced by the
+# thread share of the command (see threads module). Single-threaded
+# programs are not listed, tar's own options are used for them. zstd -T only
+# makes compression multi-threaded, so plain zstd is not listed; pzstd
+# decompresses in parallel only the multi-frame files pzstd itself wrote,
+# others with one thread like zstd.
+ParallelCompressPrograms = {
+    'gzip': (('pigz', ('-p', '%d')),),
+    'bzip2': (('lbzip2', ('-n', '%d')), ('pbzip2', ('-p%d',))),
+    'xz': (('xz', ('-T%d',)),),
+    'lzip': (('plzip', ('-n', '%d')),),
+    'zstd': (('pzstd', ('-p', '%d')),),
+}
 
-def extract_tar (archive, compression, cmd, verbosity, interactive, output_dir):
-    """Extract a TAR archive."""
+
+def extract_tar (archive, compression, cmd, verbosity, interactive, output_dir, members=None):
+    """Extract a TAR archive, only the given members if any."""
     cmdlist = [cmd, '--extract']
     add_tar_opts(cmdlist, compression, verbosity)
     cmdlist.extend(["--file", archive, '--directory', output_dir])
+    if members:
+        if os.path.basename(cmd) == 'tar':
+            # member names are no patterns
+            cmdlist.append('--no-wildcards')
+        cmdlist.append('--')
+        cmdlist.extend(members)
     return cmdlist
 
 def list_tar (archive, compression, cmd, verbosity, interactive):
@@ -44,15 +66,19 @@ def create_tar (archive, compression, cmd, verbosity, interactive, filenames):
 def add_tar_opts (cmdlist, compression, verbosity):
     """Add tar options to cmdlist."""
     progname = os.path.basename(cmdlist[0])
-    if compression == 'gzip':
+    compress_program = get_parallel_compress_program(compression) if progname == 'tar' else None
+    if compress_program:
+        # tar adds -d for decompression itself
+        cmdlist.extend(['--use-compress-program', compress_program])
+    elif compression == 'gzip':
         cmdlist.append('-z')
     elif compression == 'compress':
         cmdlist.append('-Z')
     elif compression == 'bzip2':
         cmdlist.append('-j')
-    elif compression in ('lzma', 'xz') and progname == 'bsdtar':
+    elif compression in ('lzma', 'xz', 'zstd') and progname == 'bsdtar':
         cmdlist.append('--%s' % compression)
-    elif compression in ('lzma', 'xz', 'lzip'):
+    elif compression in ('lzma', 'xz', 'lzip', 'zstd'):
         # use the compression name as program name since
         # tar is picky which programs it can use
         program = compression
@@ -62,3 +88,19 @@ def add_tar_opts (cmdlist, compression, verbosity):
         cmdlist.append('--verbose')
     if progname == 'tar':
         cmdlist.append('--force-local')
+
+
+def get_parallel_compress_program(compression):
+    """Return the --use-compress-program value of the fastest installed
+    multi-threaded program for the compression, or None if there is none.
+    The order is the one measured by autotune (see tuning module), if any."""
+    candidates = ParallelCompressPrograms.get(compression)
+    if not candidates:
+        return None
+    options = dict(candidates)
+    for program in tuning.rank_programs(compression, 'extract', [program for program, _ in candidates]):
+        if util.find_program(program):
+            # tar splits the value at spaces, so the program name is used instead of its path
+            share = str(threads.current_share())
+            return ' '.join((program,) + tuple(option.replace('%d', share) for option in options[program]))
+    return None
@@ -19,10 +19,9 @@ from .. import util
 
 def extract_compress (archive, compression, cmd, verbosity, interactive, output_dir):
     """Extract a compressed archive."""
-    cmdlist = [util.shell_quote(cmd)]
+    cmdlist = [cmd]
     if verbosity > 1:
         cmdlist.append('-v')
     outfile = util.get_single_outfile(output_dir, archive)
-    cmdlist.extend(['-c', util.shell_quote(archive), '>',
-                    util.shell_quote(outfile)])
-    return (cmdlist, {'shell': True})
+    cmdlist.extend(['-c', archive])
+    return (cmdlist, {'stdout_file': outfile})
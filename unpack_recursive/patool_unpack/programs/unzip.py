@@ -14,18 +14,26 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the unzip program."""
+import re
 
 def _maybe_add_password(cmdlist, password):
     if password:
         cmdlist.extend(['-P', password])
 
-def extract_zip (archive, compression, cmd, verbosity, interactive, output_dir, password=None):
-    """Extract a ZIP archive."""
+def _escape_wildcards(name):
+    """Make unzip match the member name literally."""
+    return re.sub(r'([*?\[])', r'[\1]', name)
+
+def extract_zip (archive, compression, cmd, verbosity, interactive, output_dir, password=None, members=None):
+    """Extract a ZIP archive, only the given members if any."""
     cmdlist = [cmd]
     if verbosity > 1:
         cmdlist.append('-v')
     _maybe_add_password(cmdlist, password)
-    cmdlist.extend(['--', archive, '-d', output_dir])
+    cmdlist.extend(['--', archive])
+    if members:
+        cmdlist.extend(_escape_wildcards(name) for name in members)
+    cmdlist.extend(['-d', output_dir])
     return cmdlist
 
 def list_zip (archive, compression, cmd, verbosity, interactive, password=None):
@@ -14,12 +14,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the xz program."""
-from . import extract_singlefile_standard, test_singlefile_standard
+from . import extract_singlefile_standard, test_singlefile_standard, with_thread_option
 from .. import util
 
 
-extract_xz = extract_singlefile_standard
-test_xz = test_singlefile_standard
+extract_xz = with_thread_option(extract_singlefile_standard, '-T%d')
+test_xz = with_thread_option(test_singlefile_standard, '-T%d')
 
 def list_xz (archive, compression, cmd, verbosity, interactive):
     """List a XZ archive."""
@@ -31,26 +31,26 @@ def list_xz (archive, compression, cmd, verbosity, interactive):
     return cmdlist
 
 
-def create_xz(archive, compression, cmd, verbosity, interactive, filenames):
+def _create_xz(archive, compression, cmd, verbosity, interactive, filenames):
     """Create an XZ archive."""
-    cmdlist = [util.shell_quote(cmd)]
+    cmdlist = [cmd]
     if verbosity > 1:
         cmdlist.append('-v')
     cmdlist.extend(['-c', '-9', '--'])
-    cmdlist.extend([util.shell_quote(x) for x in filenames])
-    cmdlist.extend(['>', util.shell_quote(archive)])
-    return (cmdlist, {'shell': True})
+    cmdlist.extend(filenames)
+    return (cmdlist, {'stdout_file': archive})
+
+create_xz = with_thread_option(_create_xz, '-T%d')
 
 
 def extract_lzma(archive, compression, cmd, verbosity, interactive, output_dir):
     """Extract an LZMA archive."""
-    cmdlist = [util.shell_quote(cmd), '--format=lzma']
+    cmdlist = [cmd, '--format=lzma']
     if verbosity > 1:
         cmdlist.append('-v')
     outfile = util.get_single_outfile(output_dir, archive)
-    cmdlist.extend(['-c', '-d', '--', util.shell_quote(archive), '>',
-                    util.shell_quote(outfile)])
-    return (cmdlist, {'shell': True})
+    cmdlist.extend(['-c', '-d', '--', archive])
+    return (cmdlist, {'stdout_file': outfile})
 
 
 def test_lzma(archive, compression, cmd, verbosity, interactive):
@@ -64,10 +64,9 @@ def test_lzma(archive, compression, cmd, verbosity, interactive):
 
 def create_lzma(archive, compression, cmd, verbosity, interactive, filenames):
     """Create an LZMA archive."""
-    cmdlist = [util.shell_quote(cmd), '--format=lzma']
+    cmdlist = [cmd, '--format=lzma']
     if verbosity > 1:
         cmdlist.append('-v')
     cmdlist.extend(['-c', '-9', '--'])
-    cmdlist.extend([util.shell_quote(x) for x in filenames])
-    cmdlist.extend(['>', util.shell_quote(archive)])
-    return (cmdlist, {'shell': True})
+    cmdlist.extend(filenames)
+    return (cmdlist, {'stdout_file': archive})
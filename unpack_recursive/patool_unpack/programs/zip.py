@@ -15,11 +15,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the zip program."""
 
-def create_zip (archive, compression, cmd, verbosity, interactive, filenames):
+def create_zip (archive, compression, cmd, verbosity, interactive, filenames, password=None):
     """Create a ZIP archive."""
     cmdlist = [cmd, '-r', '-9']
     if verbosity > 1:
         cmdlist.append('-v')
+    if password:
+        cmdlist.extend(['-P', password])
     cmdlist.append(archive)
     cmdlist.extend(filenames)
     return cmdlist
@@ -15,10 +15,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Archive commands for the zpaq program."""
 import os
+from .. import threads
 
 def extract_zpaq(archive, compression, cmd, verbosity, interactive, output_dir):
     """Extract a ZPAQ archive."""
-    cmdlist = [cmd, 'x', os.path.abspath(archive)]
+    cmdlist = [cmd, 'x', os.path.abspath(archive), '-threads', str(threads.current_share())]
     return (cmdlist, {'cwd': output_dir})
 
 
@@ -31,7 +32,7 @@ def create_zpaq(archive, compression, cmd, verbosity, interactive, filenames):
     """Create a ZPAQ archive."""
     cmdlist = [cmd, 'a', archive]
     cmdlist.extend(filenames)
-    cmdlist.extend(['-method', '4'])
+    cmdlist.extend(['-method', '4', '-threads', str(threads.current_share())])
     return cmdlist
 
 # zpaq has no separate test mode, so use listing instead
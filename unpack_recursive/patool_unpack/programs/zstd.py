@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Archive commands for the zstd program."""
+from . import extract_singlefile_standard, test_singlefile_standard, with_thread_option
+
+
+extract_zstd = extract_singlefile_standard
+test_zstd = test_singlefile_standard
+
+
+def list_zstd(archive, compression, cmd, verbosity, interactive):
+    """List a ZSTD archive."""
+    cmdlist = [cmd, '-l']
+    if verbosity > 1:
+        cmdlist.append('-v')
+    cmdlist.extend(['--', archive])
+    return cmdlist
+
+
+def _create_zstd(archive, compression, cmd, verbosity, interactive, filenames):
+    """Create a ZSTD archive."""
+    cmdlist = [cmd]
+    if verbosity > 1:
+        cmdlist.append('-v')
+    cmdlist.extend(['-c', '-19', '--'])
+    cmdlist.extend(filenames)
+    return (cmdlist, {'stdout_file': archive})
+
+# zstd decompresses with one thread, only compression is multi-threaded
+create_zstd = with_thread_option(_create_zstd, '-T%d')
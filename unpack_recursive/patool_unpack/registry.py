@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Registry of archive handlers.
+
+A handler is the function of a program module that builds the command
+list (or does the work itself) for one program, command and format,
+e.g. programs.star.extract_tar. resolve() imports the module, looks up
+the function and inspects its capabilities once per process; later
+calls are a dictionary lookup.
+
+Other packages can add programs through the 'unpack_recursive.backends'
+entry point group: the entry point name is the program name, its value
+a module with <command>_<format> functions like the modules in programs.
+The program becomes a candidate for every format and command it has a
+function for (after the built-in programs); it is used if an executable
+of that name is installed, or always if the name starts with "py_".
+"""
+import importlib
+import inspect
+import os
+import threading
+
+from . import util
+
+ENTRY_POINT_GROUP = 'unpack_recursive.backends'
+
+
+class Handler(object):
+    """Resolved archive handler, called like the handler function itself.
+    A password of None is not passed on, an existing_action is dropped if
+    the function doesn't take it, a password raises PatoolError then.
+    A member_filter or members (see filtering module) is dropped too, and
+    output_hashes (see hashing module), the caller hashes the output then."""
+
+    __slots__ = ('program', 'command', 'format', 'func', 'supports_password', 'supports_existing_action',
+                 'supports_member_filter', 'supports_members', 'supports_output_hashes')
+
+    def __init__(self, program, command, format, func):
+        self.program = program
+        self.command = command
+        self.format = format
+        self.func = func
+        parameters = inspect.signature(func).parameters
+        self.supports_password = 'password' in parameters
+        self.supports_existing_action = 'existing_action' in parameters
+        self.supports_member_filter = 'member_filter' in parameters
+        self.supports_members = 'members' in parameters
+        self.supports_output_hashes = 'output_hashes' in parameters
+
+    def __call__(self, *args, **kwargs):
+        if 'password' in kwargs:
+            if kwargs['password'] is None:
+                del kwargs['password']
+            elif not self.supports_password:
+                raise util.PatoolError('There is no support for password in %s' % self.program)
+        # only some programs (e.g. 7z) can be told what to do with existing files,
+        # the others just use their default behaviour
+        if 'existing_action' in kwargs and not self.supports_existing_action:
+            del kwargs['existing_action']
+        if 'member_filter' in kwargs and not self.supports_member_filter:
+            del kwargs['member_filter']
+        if 'members' in kwargs and not self.supports_members:
+            del kwargs['members']
+        if 'output_hashes' in kwargs and not self.supports_output_hashes:
+            del kwargs['output_hashes']
+        return self.func(*args, **kwargs)
+
+    def as_dict(self):
+        """Return a JSON serializable description."""
+        return {'program': self.program, 'command': self.command, 'format': self.format,
+                'function': '%s.%s' % (self.func.__module__, self.func.__name__),
+                'supports_password': self.supports_password,
+                'supports_existing_action': self.supports_existing_action,
+                'supports_member_filter': self.supports_member_filter,
+                'supports_members': self.supports_members,
+                'supports_output_hashes': self.supports_output_hashes}
+
+    def __repr__(self):
+        return '<Handler %s %s %s>' % (self.program, self.command, self.format)
+
+
+_lock = threading.Lock()
+# (program as passed, command, format) -> Handler
+_resolved = {}
+# program name -> module of third-party backends
+_plugin_modules = {}
+_entry_points_loaded = False
+
+
+def get_program_key(program):
+    """Return the program name used for module lookup, e.g. '7z' for '/usr/bin/7z.exe'."""
+    return util.strip_file_extension(os.path.basename(program).lower())
+
+
+def get_program_module(key):
+    """Import and return the module of a program."""
+    if key in _plugin_modules:
+        return _plugin_modules[key]
+    from . import ProgramModules
+    modulename = ".programs." + ProgramModules.get(key, key)
+    try:
+        return importlib.import_module(modulename, __package__)
+    except ImportError as msg:
+        raise util.PatoolError(msg)
+
+
+def resolve(program, command, archive_file_format):
+    """Return the Handler of a program (name or executable path) for command and format."""
+    try:
+        return _resolved[(program, command, archive_file_format)]
+    except KeyError:
+        pass
+    key = get_program_key(program)
+    module = get_program_module(key)
+    try:
+        func = getattr(module, '%s_%s' % (command, archive_file_format))
+    except AttributeError as msg:
+        raise util.PatoolError(msg)
+    handler = Handler(key, command, archive_file_format, func)
+    with _lock:
+        _resolved[(program, command, archive_file_format)] = handler
+    return handler
+
+
+def get_capabilities(program, command, archive_file_format):
+    """Return the Handler of the program or None if it can't do command for format."""
+    try:
+        return resolve(program, command, archive_file_format)
+    except util.PatoolError:
+        return None
+
+
+def get_handlers():
+    """Return all handlers resolved so far."""
+    with _lock:
+        return list(_resolved.values())
+
+
+def describe():
+    """Return the handlers of all programs listed for every format and command
+    (whether installed or not) as JSON serializable dictionaries."""
+    from . import ArchivePrograms
+    load_entry_points()
+    descriptions = []
+    for archive_file_format, commands in sorted(ArchivePrograms.items()):
+        for command in ('list', 'test', 'extract', 'create'):
+            programs = commands.get(None, ()) + commands.get(command, ())
+            for program in programs:
+                handler = get_capabilities(program, command, archive_file_format)
+                if handler is not None:
+                    descriptions.append(handler.as_dict())
+    return descriptions
+
+
+def register_module(program, module):
+    """Add a backend module for program, it becomes a candidate for all
+    formats and commands it has a function for."""
+    from . import ArchiveCommands, ArchiveFormats, ArchivePrograms
+    key = get_program_key(program)
+    with _lock:
+        _plugin_modules[key] = module
+        for stale in [resolved for resolved in _resolved if get_program_key(resolved[0]) == key]:
+            del _resolved[stale]
+    for archive_file_format in ArchiveFormats:
+        for command in ArchiveCommands:
+            if not hasattr(module, '%s_%s' % (command, archive_file_format)):
+                continue
+            commands = ArchivePrograms.setdefault(archive_file_format, {})
+            if program not in commands.get(command, ()):
+                commands[command] = commands.get(command, ()) + (program,)
+
+
+def load_entry_points():
+    """Register the backends of installed packages (once per process)."""
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python < 3.8
+        return
+    try:
+        found = entry_points()
+        if hasattr(found, 'select'):
+            found = found.select(group=ENTRY_POINT_GROUP)
+        else:
+            found = found.get(ENTRY_POINT_GROUP, ())
+        for entry_point in found:
+            register_module(entry_point.name, entry_point.load())
+    except Exception as msg:
+        util.log_error("could not load archive backends: %s" % msg)
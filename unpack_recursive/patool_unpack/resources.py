@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Resource accounting (wall time, CPU, max RSS, block I/O) of archiver processes.
+
+util.run() reports the usage of every finished external program here.
+Usage is aggregated per program and per archive format, the format and
+program being taken from the innermost usage_context() of the current thread.
+"""
+import os
+import sys
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+# Usage of a single finished process. max_rss is in bytes,
+# inblock and oublock are counted in 512 byte blocks (as reported by getrusage(2)).
+ProcessUsage = namedtuple('ProcessUsage', ['wall', 'user', 'sys', 'max_rss', 'inblock', 'oublock'])
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+_MAX_RSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+
+
+def usage_from_rusage(wall, rusage):
+    """Convert a resource.struct_rusage of a finished process to ProcessUsage."""
+    if rusage is None:
+        return ProcessUsage(wall, 0.0, 0.0, 0, 0, 0)
+    return ProcessUsage(wall, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss * _MAX_RSS_SCALE,
+                        rusage.ru_inblock, rusage.ru_oublock)
+
+
+class UsageTotals(object):
+    """Aggregated usage of several processes."""
+
+    __slots__ = ('runs', 'wall', 'user', 'sys', 'max_rss', 'inblock', 'oublock')
+
+    def __init__(self):
+        self.runs = 0
+        self.wall = self.user = self.sys = 0.0
+        self.max_rss = self.inblock = self.oublock = 0
+
+    def add(self, usage):
+        """Add usage of one more process; max_rss keeps the peak value."""
+        self.runs += 1
+        self.wall += usage.wall
+        self.user += usage.user
+        self.sys += usage.sys
+        self.max_rss = max(self.max_rss, usage.max_rss)
+        self.inblock += usage.inblock
+        self.oublock += usage.oublock
+
+    def as_dict(self):
+        """Return totals as a JSON serializable dictionary."""
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+_lock = threading.Lock()
+_by_program = {}
+_by_format = {}
+_context = threading.local()
+
+
+@contextmanager
+def usage_context(program=None, format=None, compression=None):
+    """Attribute processes run inside the 'with' block to given program and archive format
+    (compressed tar archives are accounted e.g. as 'tar+xz')."""
+    if format and compression:
+        format = '%s+%s' % (format, compression)
+    previous = getattr(_context, 'value', None)
+    _context.value = (program and os.path.basename(program), format)
+    try:
+        yield
+    finally:
+        _context.value = previous
+
+
+def record(cmd, usage):
+    """Add usage of a finished process running cmd to the run summary."""
+    program, format = getattr(_context, 'value', None) or (None, None)
+    if program is None:
+        # no context, fall back to the name of the executable
+        command = cmd.split(' ', 1)[0] if isinstance(cmd, str) else cmd[0]
+        program = os.path.basename(command.strip("'\""))
+    with _lock:
+        _by_program.setdefault(program, UsageTotals()).add(usage)
+        _by_format.setdefault(format or 'unknown', UsageTotals()).add(usage)
+
+
+def get_summary():
+    """Return the usage aggregated per program and per format since the last reset()."""
+    with _lock:
+        return {
+            'by_program': dict((key, totals.as_dict()) for key, totals in _by_program.items()),
+            'by_format': dict((key, totals.as_dict()) for key, totals in _by_format.items()),
+        }
+
+
+def reset():
+    """Forget all recorded usage."""
+    with _lock:
+        _by_program.clear()
+        _by_format.clear()
+
+
+def format_summary(summary=None):
+    """Return the run summary as a human readable table."""
+    if summary is None:
+        summary = get_summary()
+    lines = []
+    for title, key in (('program', 'by_program'), ('format', 'by_format')):
+        lines.append("%-16s %6s %10s %10s %10s %10s %12s %12s" % (
+            title, 'runs', 'wall s', 'user s', 'sys s', 'rss MiB', 'read blk', 'write blk'))
+        for name, totals in sorted(summary[key].items(), key=lambda item: -item[1]['wall']):
+            lines.append("%-16s %6d %10.3f %10.3f %10.3f %10.1f %12d %12d" % (
+                name, totals['runs'], totals['wall'], totals['user'], totals['sys'],
+                totals['max_rss'] / (1024.0 * 1024.0), totals['inblock'], totals['oublock']))
+        lines.append("")
+    return "\n".join(lines)
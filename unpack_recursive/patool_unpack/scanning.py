@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""One pass over the output directory of an extraction.
+
+scan_output_dir() walks the tree with os.scandir once: it adds the user
+read permission (and execute for directories) only where it is missing,
+counts files, directories and bytes, and collects the files a caller
+wants to look at next (e.g. nested archives). Symbolic links are neither
+changed nor followed.
+"""
+import collections
+import os
+import stat
+
+from . import util, tracing
+
+ScanResult = collections.namedtuple('ScanResult', ('files', 'directories', 'bytes', 'fixed', 'candidates'))
+
+FILE_MODE = stat.S_IRUSR
+DIRECTORY_MODE = stat.S_IRUSR | stat.S_IXUSR
+
+
+def scan_output_dir(directory, is_candidate=None, fix_permissions=True, output_hashes=None):
+    """Walk directory once; is_candidate(name) selects the files returned
+    as candidates, regular files are hashed into output_hashes (see hashing
+    module) if it is given. Return a ScanResult."""
+    with tracing.span('scan_output_dir', directory=directory) as span:
+        result = _scan(directory, is_candidate, fix_permissions, output_hashes)
+        span.tag(files=result.files, directories=result.directories, bytes=result.bytes, fixed=result.fixed,
+                 candidates=len(result.candidates))
+    return result
+
+
+def _scan(directory, is_candidate, fix_permissions, output_hashes):
+    files = directories = size = fixed = 0
+    candidates = []
+    stack = [directory]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError as err:
+            util.log_error(err)
+            continue
+        for entry in entries:
+            try:
+                mode = entry.stat(follow_symlinks=False).st_mode
+            except OSError as err:
+                util.log_error(err)
+                continue
+            if stat.S_ISDIR(mode):
+                directories += 1
+                if fix_permissions and mode & DIRECTORY_MODE != DIRECTORY_MODE:
+                    fixed += _add_mode(entry.path, mode, DIRECTORY_MODE)
+                stack.append(entry.path)
+            elif stat.S_ISREG(mode):
+                files += 1
+                size += entry.stat(follow_symlinks=False).st_size
+                if fix_permissions and not mode & FILE_MODE:
+                    fixed += _add_mode(entry.path, mode, FILE_MODE)
+                if output_hashes is not None:
+                    _hash_file(output_hashes, entry.path, directory)
+                if is_candidate is not None and is_candidate(entry.name):
+                    candidates.append(entry.path)
+    return ScanResult(files, directories, size, fixed, candidates)
+
+
+def _hash_file(output_hashes, path, directory):
+    try:
+        output_hashes.add_file(path, directory)
+    except OSError as err:
+        util.log_error(err)
+
+
+def _add_mode(path, mode, flags):
+    try:
+        os.chmod(path, stat.S_IMODE(mode) | flags)
+        return 1
+    except OSError as err:
+        util.log_error(err)
+        return 0
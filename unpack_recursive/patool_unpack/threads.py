@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Global thread budget shared by the archivers running at the same time.
+
+Every archive command runs inside lease(), which takes its share from a
+pool of the budget and returns it when the command ends. The share is the
+budget divided by the number of commands running when it starts, but no
+more than what is left in the pool (and at least one thread), so commands
+running together never get more than the budget, apart from the one
+thread each of them gets if the pool is empty.
+Program modules read current_share() and translate it into their thread
+option (7z -mmt, xz -T, pigz -p, lbzip2 -n, ...).
+The budget defaults to $UNPACK_RECURSIVE_THREADS or the number of CPUs.
+In-process backends spread their work over their share with imap().
+"""
+import collections
+import concurrent.futures
+import os
+import threading
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_budget = None
+_running = 0
+# threads leased to running commands
+_in_use = 0
+_context = threading.local()
+
+
+def get_default_budget():
+    """Return $UNPACK_RECURSIVE_THREADS, or the number of usable CPUs."""
+    try:
+        return max(1, int(os.environ['UNPACK_RECURSIVE_THREADS']))
+    except (KeyError, ValueError):
+        pass
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_budget():
+    """Return the number of threads all archivers may use together."""
+    global _budget
+    if _budget is None:
+        _budget = get_default_budget()
+    return _budget
+
+
+def set_budget(threads=None):
+    """Set the thread budget, None restores the default."""
+    global _budget
+    _budget = max(1, int(threads)) if threads is not None else None
+
+
+@contextmanager
+def lease():
+    """Register a running archive command and yield its share of the budget."""
+    global _running, _in_use
+    with _lock:
+        _running += 1
+        budget = get_budget()
+        share = max(1, min(budget // _running, budget - _in_use))
+        _in_use += share
+    previous = getattr(_context, 'share', None)
+    _context.share = share
+    try:
+        yield share
+    finally:
+        _context.share = previous
+        with _lock:
+            _running -= 1
+            _in_use -= share
+
+
+def current_share():
+    """Return the thread share of the archive command of the current thread
+    (the whole budget outside of lease())."""
+    share = getattr(_context, 'share', None)
+    return share if share is not None else get_budget()
+
+
+def imap(func, iterable, workers, window=None):
+    """Like map(), but func runs in a pool of workers threads. The results
+    are yielded in order; at most window (default 2 * workers) results are
+    computed ahead of the consumer, which bounds the memory used."""
+    window = window or 2 * workers
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for item in iterable:
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(func, item))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Span tracing of the unpacking phases (detection, testing, extraction...).
+
+Tracing is disabled by default: span() then returns a shared no-op object,
+so instrumented code pays only for one global lookup per phase.
+When enabled, finished spans are collected in memory and can be written
+in the Chrome trace-event format (chrome://tracing, Perfetto, speedscope).
+"""
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan(object):
+    """Span used when tracing is disabled, does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def tag(self, **tags):
+        """Ignore tags."""
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+    """A timed phase, recorded in the tracer when the 'with' block exits."""
+
+    __slots__ = ('tracer', 'name', 'tags', 'start')
+
+    def __init__(self, tracer, name, tags):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.tags['error'] = exc_type.__name__
+        self.tracer.add_event(self.name, self.start, end, self.tags)
+        return False
+
+    def tag(self, **tags):
+        """Add tags that became known only inside the span (e.g. the chosen program)."""
+        self.tags.update(tags)
+
+
+class Tracer(object):
+    """Collects finished spans of the current process."""
+
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+        # all timestamps are relative to the tracer creation
+        self.origin = time.perf_counter()
+
+    def add_event(self, name, start, end, tags):
+        """Store a finished span (list.append is atomic, no lock needed)."""
+        self.events.append((name, start, end, threading.get_ident(), tags))
+
+    def get_chrome_trace(self):
+        """Return collected spans as a Chrome trace-event format dictionary."""
+        trace_events = []
+        for name, start, end, thread_id, tags in self.events:
+            trace_events.append({
+                'name': name,
+                'cat': name.split('.', 1)[0],
+                'ph': 'X',
+                'ts': (start - self.origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': self.pid,
+                'tid': thread_id,
+                'args': dict((key, str(value)) for key, value in tags.items()),
+            })
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, filename):
+        """Write collected spans to filename in the Chrome trace-event format."""
+        with open(filename, 'w') as trace_file:
+            json.dump(self.get_chrome_trace(), trace_file)
+
+
+# the active tracer, None when tracing is disabled
+_tracer = None
+
+
+def enable():
+    """Start collecting spans, return the new active tracer."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable():
+    """Stop collecting spans, return the previously active tracer (or None)."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def is_enabled():
+    """Return True if spans are currently collected."""
+    return _tracer is not None
+
+
+def get_tracer():
+    """Return the active tracer or None."""
+    return _tracer
+
+
+def span(name, **tags):
+    """Return a context manager timing the phase with given name and tags,
+    e.g. `with span('extract', archive=path, format='zip'): ...`"""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, tags)
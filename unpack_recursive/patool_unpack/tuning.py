@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2022 Theo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Machine-local ranking of archive programs.
+
+autotune() times every installed program of a format on sample archives
+and saves a preference table; find_archive_program() then tries programs
+in the measured order instead of the static ArchivePrograms order.
+The table is a JSON file:
+
+    {"version": 2, "formats": {"gzip": {"extract": {
+        "ranking": ["pigz", "gzip", "py_gzip", "7z"],
+        "size_rules": [{"max_bytes": 1048576, "program": "py_gzip"}]}},
+        "tar.gzip": {"extract": {"ranking": ["tar", "py_tarfile", "7z"], ...}}}}
+
+Rankings are kept per format and compression (see get_format_key), a
+ranking of plain tar says nothing about tar.gz, where the decompression
+dominates. A size rule prefers its program for archives up to max_bytes
+bytes.
+"""
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+# Formats tuned by default, with the compression of the sample archive
+TunedFormats = (
+    ('gzip', None), ('bzip2', None), ('xz', None), ('lzma', None), ('lzip', None),
+    ('zstd', None), ('zip', None), ('tar', None), ('tar', 'gzip'), ('tar', 'bzip2'), ('tar', 'xz'),
+    ('tar', 'zstd'), ('7z', None),
+)
+
+# Uncompressed sizes of the sample archives
+SampleSizes = (256 * 1024, 4 * 1024 * 1024, 64 * 1024 * 1024)
+
+# version 1 tables were keyed by the format alone
+PREFERENCES_VERSION = 2
+
+# loaded preference table, False until the first lookup
+_preferences = False
+
+
+def get_preferences_filename():
+    """Return the preference table path: $UNPACK_RECURSIVE_BACKENDS or
+    $XDG_CONFIG_HOME/unpack_recursive/backends.json."""
+    filename = os.environ.get('UNPACK_RECURSIVE_BACKENDS')
+    if filename:
+        return filename
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(config_home, 'unpack_recursive', 'backends.json')
+
+
+def load_preferences(filename=None):
+    """(Re)load the preference table, return None if there is none (or it is unusable)."""
+    global _preferences
+    filename = filename or get_preferences_filename()
+    try:
+        with open(filename) as preferences_file:
+            preferences = json.load(preferences_file)
+        if preferences.get('version') != PREFERENCES_VERSION:
+            preferences = None
+    except (OSError, ValueError):
+        preferences = None
+    _preferences = preferences
+    return preferences
+
+
+def get_preferences():
+    """Return the preference table, loading it on first use."""
+    if _preferences is False:
+        return load_preferences()
+    return _preferences
+
+
+def save_preferences(preferences, filename=None):
+    """Write the preference table and make it active."""
+    global _preferences
+    filename = filename or get_preferences_filename()
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(filename, 'w') as preferences_file:
+        json.dump(preferences, preferences_file, indent=2)
+    _preferences = preferences
+
+
+def get_format_key(archive_file_format, compression=None):
+    """Return the key of a format and compression in the preference table,
+    e.g. 'gzip' or 'tar.gzip'."""
+    if compression:
+        return '%s.%s' % (archive_file_format, compression)
+    return archive_file_format
+
+
+def rank_programs(archive_file_format, command, programs, archive=None, compression=None):
+    """Reorder candidate programs by the preference table entry of the
+    format and compression: the program of a matching size rule first, then
+    the measured ranking, then programs that were not measured in their
+    original order. Without an entry the order is not changed."""
+    preferences = get_preferences()
+    if not preferences:
+        return programs
+    key = get_format_key(archive_file_format, compression)
+    entry = preferences.get('formats', {}).get(key, {}).get(command)
+    if not entry:
+        return programs
+    ranking = list(entry.get('ranking', ()))
+    size_rules = entry.get('size_rules')
+    if size_rules and archive is not None:
+        try:
+            size = os.path.getsize(archive)
+        except OSError:
+            size = None
+        if size is not None:
+            for rule in size_rules:
+                if size <= rule['max_bytes']:
+                    ranking.insert(0, rule['program'])
+                    break
+    order = {}
+    for position, program in enumerate(ranking):
+        order.setdefault(program, position)
+    unranked = len(order)
+    # sort is stable, so unranked programs keep the static order
+    return sorted(programs, key=lambda program: order.get(program, unranked))
+
+
+def write_sample_data(filename, size, rng):
+    """Write a half compressible sample file."""
+    words = b"archive unpack data value index block stream member header config error debug "
+    with open(filename, 'wb') as sample_file:
+        written = 0
+        while written < size:
+            chunk = rng.getrandbits(8 * 32768).to_bytes(32768, 'little') + words * 400
+            chunk = chunk[:size - written]
+            sample_file.write(chunk)
+            written += len(chunk)
+
+
+def create_sample(directory, archive_file_format, compression, size, rng):
+    """Create a sample archive with about `size` uncompressed bytes, return its path."""
+    from . import create_archive
+    source_dir = os.path.join(directory, 'source')
+    os.makedirs(source_dir)
+    if archive_file_format in ('gzip', 'bzip2', 'xz', 'lzma', 'lzip', 'compress', 'zstd'):
+        # single file formats
+        filenames = ['sample']
+        write_sample_data(os.path.join(source_dir, 'sample'), size, rng)
+    else:
+        filenames = []
+        for number in range(16):
+            filenames.append('sample_%02d' % number)
+            write_sample_data(os.path.join(source_dir, filenames[-1]), size // 16, rng)
+    extensions = {'gzip': 'gz', 'bzip2': 'bz2', 'lzip': 'lz', 'lzma': 'lzma', 'xz': 'xz', 'zstd': 'zst'}
+    archive = os.path.join(directory, 'sample.' + extensions.get(archive_file_format, archive_file_format))
+    if compression:
+        archive += '.' + extensions[compression]
+    previous_cwd = os.getcwd()
+    os.chdir(source_dir)
+    try:
+        create_archive(archive, filenames, archive_file_format, compression=compression, verbosity=-1,
+                       interactive=False)
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(source_dir)
+    return archive
+
+
+def get_candidates(archive_file_format, command, compression=None):
+    """Return installed programs (names as used in ArchivePrograms) for
+    format and command that can handle the compression."""
+    from . import ArchivePrograms, program_handles_compression, util
+    commands = ArchivePrograms.get(archive_file_format, {})
+    candidates = []
+    for key in (None, command):
+        for program in commands.get(key, ()):
+            if program in candidates:
+                continue
+            if compression and not program_handles_compression(program, compression):
+                continue
+            if program.startswith('py_') or util.find_program(program):
+                candidates.append(program)
+    return candidates
+
+
+def time_program(archive, archive_file_format, compression, command, program, directory, repeat):
+    """Return median seconds of running program on archive, or None if it
+    fails or another program would run instead."""
+    from . import _extract_archive, _handle_archive, find_archive_program, registry, util
+    try:
+        resolved = find_archive_program(archive_file_format, command, program=program, compression=compression)
+    except util.PatoolError:
+        return None
+    if registry.get_program_key(resolved) != program:
+        # the time of the program that runs instead must not be stored as this one's
+        return None
+    timings = []
+    for number in range(repeat):
+        output_dir = os.path.join(directory, 'out_%d' % number)
+        start = time.perf_counter()
+        try:
+            if command == 'extract':
+                _extract_archive(archive, verbosity=-1, interactive=False, output_dir=output_dir,
+                                 program=program, format=archive_file_format, compression=compression)
+            else:
+                _handle_archive(archive, command, verbosity=-1, interactive=False, program=program,
+                                archive_file_format=archive_file_format, compression=compression)
+        except (util.PatoolError, OSError):
+            return None
+        finally:
+            timings.append(time.perf_counter() - start)
+            shutil.rmtree(output_dir, ignore_errors=True)
+    return statistics.median(timings)
+
+
+def autotune(formats=TunedFormats, commands=('extract', 'test'), sizes=SampleSizes, repeat=3,
+             filename=None, log=None, seed=0):
+    """Benchmark all installed programs of the given formats and commands on
+    sample archives, save the resulting preference table and return it."""
+    from . import util
+    rng = random.Random(seed)
+    preferences = {'version': PREFERENCES_VERSION, 'formats': {}, 'measurements': {}}
+    work_dir = tempfile.mkdtemp(prefix='Unpack_autotune_')
+    try:
+        for archive_file_format, compression in formats:
+            key = get_format_key(archive_file_format, compression)
+            for command in commands:
+                candidates = get_candidates(archive_file_format, command, compression)
+                if len(candidates) < 2:
+                    # nothing to choose from
+                    continue
+                # per sample size: (archive size, {program: seconds})
+                results = []
+                for size in sizes:
+                    sample_dir = tempfile.mkdtemp(dir=work_dir)
+                    try:
+                        archive = create_sample(sample_dir, archive_file_format, compression, size, rng)
+                    except util.PatoolError as msg:
+                        if log:
+                            log("cannot create %s sample: %s" % (key, msg))
+                        break
+                    timings = {}
+                    for program in candidates:
+                        seconds = time_program(archive, archive_file_format, compression, command, program,
+                                               sample_dir, repeat)
+                        if seconds is not None:
+                            timings[program] = seconds
+                    results.append((os.path.getsize(archive), timings))
+                    shutil.rmtree(sample_dir)
+                    if log:
+                        log("%s %s %d bytes: %s" % (command, key, size, ", ".join(
+                            "%s %.4fs" % item for item in sorted(timings.items(), key=lambda item: item[1]))))
+                entry = make_entry(results)
+                if entry:
+                    preferences['formats'].setdefault(key, {})[command] = entry
+                    preferences['measurements'].setdefault(key, {})[command] = results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    save_preferences(preferences, filename)
+    return preferences
+
+
+def make_entry(results):
+    """Turn measurements per sample size into a ranking (by the biggest sample)
+    and size rules for smaller samples where another program was fastest."""
+    results = [(archive_size, timings) for archive_size, timings in results if timings]
+    if not results:
+        return None
+    largest_timings = results[-1][1]
+    ranking = sorted(largest_timings, key=largest_timings.get)
+    size_rules = []
+    for index, (archive_size, timings) in enumerate(results[:-1]):
+        fastest = min(timings, key=timings.get)
+        if fastest == ranking[0]:
+            continue
+        # the rule holds up to halfway (geometrically) to the next measured size
+        next_size = results[index + 1][0]
+        max_bytes = int((archive_size * next_size) ** 0.5)
+        if size_rules and size_rules[-1]['program'] == fastest:
+            size_rules[-1]['max_bytes'] = max_bytes
+        else:
+            size_rules.append({'max_bytes': max_bytes, 'program': fastest})
+    return {'ranking': ranking, 'size_rules': size_rules}
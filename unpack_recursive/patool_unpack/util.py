@@ -15,12 +15,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """Utility functions."""
 from __future__ import print_function
+import contextlib
 import os
 import sys
 import subprocess
 import mimetypes
 import tempfile
+import time
 from . import ArchiveMimetypes, ArchiveCompressions, program_supports_compression
+from . import resources
 try:
     from shutil import which
 except ImportError:
@@ -106,7 +109,9 @@ def add_mimedb_data(mimedb):
     mimedb.encodings_map['.lzma'] = 'lzma'
     mimedb.encodings_map['.xz'] = 'xz'
     mimedb.encodings_map['.lz'] = 'lzip'
+    mimedb.encodings_map['.zst'] = 'zstd'
     mimedb.suffix_map['.tbz2'] = '.tar.bz2'
+    mimedb.suffix_map['.tzst'] = '.tar.zst'
     add_mimetype(mimedb, 'application/x-lzop', '.lzo')
     add_mimetype(mimedb, 'application/x-adf', '.adf')
     add_mimetype(mimedb, 'application/x-arj', '.arj')
@@ -186,32 +191,121 @@ class memoized(object):
         return self.func.__doc__
 
 
+def popen(cmd, **kwargs):
+    """Start cmd like subprocess.Popen(), but cheaper on POSIX systems.
+    subprocess only uses posix_spawn() (or vfork() if it can't, e.g. with
+    cwd) instead of fork(), whose cost grows with the memory of this process,
+    if file descriptors are not closed and the executable is given as path.
+    Files opened by Python are not inherited anyway (PEP 446); the path is
+    passed as executable, so the argument list (and argv[0]) is unchanged."""
+    if os.name == 'posix' and not kwargs.get('shell'):
+        kwargs.setdefault('close_fds', False)
+        if 'executable' not in kwargs and not os.path.dirname(cmd[0]):
+            executable = find_program(cmd[0])
+            if executable:
+                kwargs['executable'] = executable
+    return subprocess.Popen(cmd, **kwargs)
+
+
 def backtick(cmd, encoding='utf-8'):
     """Return decoded output from command."""
-    data = subprocess.Popen(cmd, stdout=subprocess.PIPE).communicate()[0]
+    data = popen(cmd, stdout=subprocess.PIPE).communicate()[0]
     return data.decode(encoding)
 
 
 def run(cmd, verbosity=0, **kwargs):
-    """Run command without error checking.
+    """Run command without error checking. The command may be a list of
+    command lists, which run as a pipeline (see call_pipeline()).
+    The keyword arguments stdin_file and stdout_file name files that
+    are opened as standard input and output instead of shell redirections.
     @return: command return code"""
     # Note that shell_quote_nt() result is not suitable for copy-paste
     # (especially on Unix systems), but it looks nicer than shell_quote().
     if verbosity > 0:
-        log_info("running %s" % " ".join(map(shell_quote_nt, cmd)))
+        cmds = cmd if is_pipeline(cmd) else [cmd]
+        log_info("running %s" % " | ".join(" ".join(map(shell_quote_nt, part)) for part in cmds))
     if kwargs:
         if verbosity > 0:
             log_info("    with %s" % ", ".join("%s=%s" % (k, shell_quote(str(v))) for k, v in kwargs.items()))
         if kwargs.get("shell"):
             # for shell calls the command must be a string
             cmd = " ".join(cmd)
+    stdin_file = kwargs.pop("stdin_file", None)
+    stdout_file = kwargs.pop("stdout_file", None)
     if verbosity < 0:
-        res = subprocess.call(cmd, **kwargs, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    elif verbosity < 1:
-        res = subprocess.call(cmd, **kwargs, stdout=subprocess.DEVNULL)
+        kwargs["stderr"] = subprocess.DEVNULL
+    stdout = subprocess.DEVNULL if verbosity < 1 else None
+    with contextlib.ExitStack() as files:
+        if stdin_file is not None:
+            kwargs["stdin"] = files.enter_context(open(stdin_file, 'rb'))
+        if stdout_file is not None:
+            stdout = files.enter_context(open(stdout_file, 'wb'))
+        return call(cmd, stdout=stdout, **kwargs)
+
+
+def is_pipeline(cmd):
+    """Check if cmd is a list of command lists."""
+    return bool(cmd) and isinstance(cmd[0], (list, tuple))
+
+
+def call(cmd, **kwargs):
+    """Like subprocess.call(), but also record wall time and resource usage
+    of the finished process in the run summary (see resources module).
+    @return: command return code"""
+    if is_pipeline(cmd):
+        return call_pipeline(cmd, **kwargs)
+    start = time.perf_counter()
+    with popen(cmd, **kwargs) as process:
+        try:
+            rusage = wait_for_process(process)
+        except BaseException:
+            process.kill()
+            raise
+    resources.record(cmd, resources.usage_from_rusage(time.perf_counter() - start, rusage))
+    return process.returncode
+
+
+def call_pipeline(cmds, stdin=None, stdout=None, **kwargs):
+    """Run the commands with the standard output of each one connected to
+    the standard input of the next one, like a shell pipeline but without
+    a shell. The other keyword arguments are passed to every process.
+    @return: the first non-zero return code, or 0"""
+    start = time.perf_counter()
+    processes = []
+    try:
+        for index, cmd in enumerate(cmds):
+            last = index == len(cmds) - 1
+            process = popen(cmd, stdin=stdin, stdout=stdout if last else subprocess.PIPE, **kwargs)
+            if processes:
+                # only the next process holds the read end, so a writer
+                # gets SIGPIPE when its reader exits early
+                processes[-1].stdout.close()
+            processes.append(process)
+            stdin = process.stdout
+        for cmd, process in zip(cmds, processes):
+            rusage = wait_for_process(process)
+            resources.record(cmd, resources.usage_from_rusage(time.perf_counter() - start, rusage))
+    except BaseException:
+        for process in processes:
+            if process.returncode is None:
+                process.kill()
+                process.wait()
+        raise
+    return next((process.returncode for process in processes if process.returncode), 0)
+
+
+def wait_for_process(process):
+    """Wait for the process to finish and set its return code.
+    @return: resource usage of the process or None if the platform can't report it"""
+    if not hasattr(os, 'wait4'):
+        process.wait()
+        return None
+    _, status, rusage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
     else:
-        res = subprocess.call(cmd, **kwargs)
-    return res
+        process.returncode = os.WEXITSTATUS(status)
+    return rusage
 
 
 def run_checked(cmd, ret_ok=(0,), **kwargs):
@@ -245,6 +339,7 @@ Encoding2Mime = {
     'lzma': "application/x-lzma",
     'lzip': "application/x-lzip",
     'xz': "application/x-xz",
+    'zstd': "application/zstd",
 }
 Mime2Encoding = dict([(_val, _key) for _key, _val in Encoding2Mime.items()])
 # libmagic before version 5.14 identified .gz files as application/x-gzip
@@ -297,9 +392,11 @@ def guess_mime_file(filename):
         # implementation return the original file type.
         # The following detects both cases.
         if (mime2 in ('application/x-empty', 'application/octet-stream') or
-                mime2 in Mime2Encoding or not mime2):
+                mime2 in Mime2Encoding or not mime2 or
+                mime2.startswith('application/x-decompression-error')):
             # The uncompressor program file(1) uses is not installed
-            # or is not able to uncompress.
+            # or is not able to uncompress (newer file(1) versions
+            # report this as application/x-decompression-error-...).
             # Try to get mime information from the file extension.
             mime2, encoding2 = guess_mime_mimedb(filename)
             if mime2 in ArchiveMimetypes:
@@ -374,6 +471,7 @@ FileText2Mime = {
     "FLAC audio bitstream data": "audio/flac",
     "MS Windows HtmlHelp Data": "application/x-chm",
     "ZPAQ stream": "application/zpaq",
+    "Zstandard compressed data": "application/zstd",
 }
 
 
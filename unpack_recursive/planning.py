@@ -0,0 +1,234 @@
+"""
+Dry-run planning: walks a tree like 'unpack_recursive' does, but only detects and lists archives
+(also archives nested in zip, tar, gzip and xz archives) and estimates the result of unpacking
+without extracting anything.
+"""
+import os
+import sys
+from collections import Counter
+from os.path import isdir, isfile, join, getsize
+from typing import Dict, List, NamedTuple, Optional
+
+from . import is_archive, get_extension_without_dot_from_path, COMPRESSION_EXTENSIONS
+from .patool_unpack import get_archive_format, find_archive_program, ArchiveFormats, ArchiveMimetypes, \
+    util, tracing, listing, registry
+
+if sys.version_info > (3, 7):
+    from typing import Literal
+else:
+    from typing_extensions import Literal
+
+# nested archives bigger than this are not opened to list their members
+DEFAULT_MAX_NESTED_BYTES = 1024 * 1024 * 1024
+
+# separates the path of an archive from the path of a member inside it
+NESTED_SEPARATOR = "!/"
+
+
+class PlannedArchive(NamedTuple):
+    """One archive the unpacking would extract; sizes and counts are None if unknown"""
+    path: str
+    depth: int
+    format: str
+    compression: Optional[str]
+    program: Optional[str]
+    compressed_bytes: Optional[int]
+    encrypted: Optional[bool]
+    files: Optional[int]
+    uncompressed_bytes: Optional[int]
+    skipped: bool
+    error: Optional[str]
+
+
+class UnpackPlan(object):
+    """Result of 'plan_unpack': the planned archives and estimated totals"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.archives: List[PlannedArchive] = []
+
+    def summary(self) -> Dict[str, object]:
+        """Totals of the plan; estimates only cover archives that were listed and not skipped"""
+        extracted = [archive for archive in self.archives if not archive.skipped]
+        by_format = Counter(archive.format + ("+" + archive.compression if archive.compression else "")
+                            for archive in self.archives)
+        programs = Counter(archive.program or "none" for archive in extracted)
+        return {
+            "archives": len(self.archives),
+            "by_format": dict(by_format),
+            "encrypted": sum(1 for archive in self.archives if archive.encrypted),
+            "skipped_encrypted": len(self.archives) - len(extracted),
+            "unlisted": sum(1 for archive in extracted if archive.uncompressed_bytes is None),
+            "compressed_bytes": sum(archive.compressed_bytes or 0 for archive in extracted),
+            "estimated_files": sum(archive.files or 0 for archive in extracted),
+            "estimated_bytes": sum(archive.uncompressed_bytes or 0 for archive in extracted),
+            "max_depth": max((archive.depth for archive in self.archives), default=0),
+            "programs": dict(programs),
+        }
+
+    def as_dict(self) -> Dict[str, object]:
+        """The whole plan as JSON serializable dictionary"""
+        return {"path": self.path, "summary": self.summary(),
+                "archives": [archive._asdict() for archive in self.archives]}
+
+    def format(self, verbosity_level: int = 0) -> str:
+        """Human readable plan, with one line per archive if verbosity_level > 0"""
+        summary = self.summary()
+        lines = []
+        if verbosity_level > 0:
+            for archive in self.archives:
+                size = "?" if archive.uncompressed_bytes is None else _format_bytes(archive.uncompressed_bytes)
+                files = "?" if archive.files is None else str(archive.files)
+                notes = ("encrypted " if archive.encrypted else "") + ("skipped " if archive.skipped else "") + \
+                        (archive.error or "")
+                lines.append(f"{'  ' * (archive.depth - 1)}{archive.path}  [{archive.format}"
+                             f"{'+' + archive.compression if archive.compression else ''}, "
+                             f"{archive.program or 'no program'}]  {files} files, {size}  {notes}".rstrip())
+            lines.append("")
+        lines.append(f"Archives:          {summary['archives']} (" +
+                     ", ".join(f"{name} {count}" for name, count in sorted(summary['by_format'].items())) + ")")
+        lines.append(f"Encrypted:         {summary['encrypted']} ({summary['skipped_encrypted']} skipped)")
+        lines.append(f"Maximal depth:     {summary['max_depth']}")
+        lines.append(f"Archive bytes:     {_format_bytes(summary['compressed_bytes'])}")
+        lines.append(f"Estimated output:  {summary['estimated_files']} files, "
+                     f"{_format_bytes(summary['estimated_bytes'])}")
+        if summary["unlisted"]:
+            lines.append(f"Not listed:        {summary['unlisted']} archives (not included in the estimate)")
+        lines.append("Programs:          " + ", ".join(f"{name} {count}" for name, count in
+                                                       sorted(summary['programs'].items())))
+        return "\n".join(lines)
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024.0
+
+
+def get_member_archive_format(name: str) -> Optional[tuple]:
+    """(format, compression) of an archive member guessed from its name only, None if it's no archive"""
+    file_extension = get_extension_without_dot_from_path(name)
+    if not file_extension or not (file_extension in ArchiveFormats or file_extension in COMPRESSION_EXTENSIONS):
+        return None
+    mime, compression = util.guess_mime_mimedb(name)
+    if mime not in ArchiveMimetypes:
+        return None
+    archive_format = ArchiveMimetypes[mime]
+    return archive_format, None if compression == archive_format else compression
+
+
+def get_program_name(archive_format: str, path: Optional[str] = None, compression: Optional[str] = None
+                     ) -> Optional[str]:
+    """Name of the program that would extract the archive, None if none is installed"""
+    try:
+        return os.path.basename(find_archive_program(archive_format, "extract", archive=path,
+                                                     compression=compression))
+    except util.PatoolError:
+        return None
+
+
+def plan_unpack(path: str, encrypted_files_action: Literal["skip", "default", "manually"] = "skip",
+                max_nested_bytes: int = DEFAULT_MAX_NESTED_BYTES) -> UnpackPlan:
+    """
+    Plans the unpacking of an archive or of all archives in a folder without extracting anything
+
+    :param str path: Path to archive or folder with archives, as for 'unpack_recursive'
+    :param encrypted_files_action: As for 'unpack_recursive', with 'skip' encrypted archives are not
+                                   included in the estimate
+    :param int max_nested_bytes: Nested archives bigger than this are not listed (listing them requires
+                                 decompressing the outer archive)
+    :returns: the plan with one entry per archive (nested archives included) and the estimated totals
+    """
+    plan = UnpackPlan(path)
+    with tracing.span("plan_unpack", path=path):
+        if isdir(path):
+            for root, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    _plan_file(plan, join(root, filename), encrypted_files_action, max_nested_bytes)
+        elif isfile(path):
+            _plan_file(plan, path, encrypted_files_action, max_nested_bytes)
+    return plan
+
+
+def _plan_file(plan: UnpackPlan, path: str, encrypted_files_action: str, max_nested_bytes: int) -> None:
+    if not is_archive(path):
+        return
+    archive_format, compression = get_archive_format(path)
+    program = get_program_name(archive_format, path, compression)
+    size = getsize(path)
+    if listing.can_list_in_process(archive_format, compression):
+        try:
+            with open(path, "rb") as fileobj:
+                _plan_listing(plan, path, 1, fileobj, archive_format, compression, program, size,
+                              encrypted_files_action, max_nested_bytes)
+        except util.PatoolError as error:
+            plan.archives.append(PlannedArchive(path, 1, archive_format, compression, program, size, None,
+                                                None, None, False, str(error)))
+        return
+    encrypted, error, members = None, None, None
+    try:
+        members = listing.list_members(path, archive_format, compression)
+        encrypted = any(member.encrypted for member in members)
+    except util.PatoolError as list_error:
+        error = str(list_error)
+        if "wrong password" in error:
+            encrypted = True
+    plan.archives.append(_make_planned(path, 1, archive_format, compression, program, size, encrypted, members,
+                                       encrypted_files_action, error))
+
+
+def _make_planned(path: str, depth: int, archive_format: str, compression: Optional[str], program: Optional[str],
+                  size: Optional[int], encrypted: Optional[bool], members: Optional[List[listing.Member]],
+                  encrypted_files_action: str, error: Optional[str] = None) -> PlannedArchive:
+    files = uncompressed_bytes = None
+    if encrypted and program and encrypted_files_action != "skip" and error is None:
+        handler = registry.get_capabilities(program, "extract", archive_format)
+        if handler is not None and not handler.supports_password:
+            error = f"{program} can't extract with a password"
+    if members is not None:
+        files = sum(1 for member in members if not member.is_dir)
+        if all(member.size is not None for member in members):
+            uncompressed_bytes = sum(member.size for member in members)
+    return PlannedArchive(path, depth, archive_format, compression, program, size, encrypted, files,
+                          uncompressed_bytes, bool(encrypted) and encrypted_files_action == "skip", error)
+
+
+def _plan_listing(plan: UnpackPlan, path: str, depth: int, fileobj, archive_format: str,
+                  compression: Optional[str], program: Optional[str], size: Optional[int],
+                  encrypted_files_action: str, max_nested_bytes: int) -> None:
+    """Add the archive read from fileobj and, recursively, the archives nested in it"""
+    with listing.open_listing(fileobj, path, archive_format, compression) as archive_listing:
+        members = archive_listing.members
+        encrypted = any(member.encrypted for member in members)
+        planned = _make_planned(path, depth, archive_format, compression, program, size, encrypted, members,
+                                encrypted_files_action)
+        plan.archives.append(planned)
+        if planned.skipped:
+            return
+        for member in members:
+            if member.is_dir:
+                continue
+            member_format = get_member_archive_format(member.name)
+            if member_format is None:
+                continue
+            member_path = path + NESTED_SEPARATOR + member.name
+            member_program = get_program_name(*member_format)
+            if member.encrypted or member.size is None or member.size > max_nested_bytes or \
+                    not listing.can_list_in_process(*member_format):
+                reason = "encrypted" if member.encrypted else "not listed"
+                plan.archives.append(PlannedArchive(member_path, depth + 1, member_format[0], member_format[1],
+                                                    member_program, member.size, member.encrypted or None,
+                                                    None, None, bool(member.encrypted) and
+                                                    encrypted_files_action == "skip", reason))
+                continue
+            try:
+                with archive_listing.open(member.name) as member_fileobj:
+                    _plan_listing(plan, member_path, depth + 1, member_fileobj, member_format[0], member_format[1],
+                                  member_program, member.size, encrypted_files_action, max_nested_bytes)
+            except Exception as error:
+                # e.g. a file with an archive extension that is no archive
+                plan.archives.append(PlannedArchive(member_path, depth + 1, member_format[0], member_format[1],
+                                                    member_program, member.size, None, None, None, False,
+                                                    str(error)))
@@ -0,0 +1,259 @@
+"""
+Streaming access to the leaf files of (nested) archives: 'iter_leaf_files' reads zip, tar, gzip, bzip2, xz, lzma
+and zstd archives with the Python modules, member by member, and only extracts other formats (with the same
+programs 'unpack_recursive' uses) into a scratch directory that is removed right after their files were read.
+"""
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+from os.path import isdir, isfile, join, getsize, basename
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+from . import is_archive
+from .planning import NESTED_SEPARATOR, get_member_archive_format
+from .patool_unpack import get_archive_format, extract_archive, listing, tracing
+from .patool_unpack.filtering import normalize_member_name
+from .patool_unpack.scanning import scan_output_dir
+from .patool_unpack.util import PatoolError, strip_file_extension
+
+try:
+    # backports of the Python 3.14 modules, which read zstd compressed data
+    from backports.zstd import tarfile, zipfile
+except ImportError:
+    import tarfile
+    import zipfile
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+# nested archives that need random access (zip, formats extracted by external programs) are copied into
+# a temporary file, which is kept in memory up to this size
+DEFAULT_SPOOL_BYTES = 64 * 1024 * 1024
+
+# bytes read from the start of a nested member to check that it really is an archive (the tar magic is at 257)
+HEAD_SIZE_BYTES = 512
+
+SINGLE_FILE_FORMATS = ("gzip", "bzip2", "xz", "lzma", "zstd")
+
+
+class LeafFile(NamedTuple):
+    """A file that is no archive: its logical path ('outer.zip!/inner.tar.gz!/dir/file.txt'), its size
+    (None if the format doesn't record it) and a readable file object of its data"""
+    path: str
+    size: Optional[int]
+    fileobj: BinaryIO
+
+
+class _Settings(NamedTuple):
+    password: Optional[str]
+    spool_bytes: int
+    scratch_dir: Optional[str]
+
+
+def iter_leaf_files(path: str, password: Optional[str] = None, spool_bytes: int = DEFAULT_SPOOL_BYTES,
+                    scratch_dir: Optional[str] = None) -> Iterator[LeafFile]:
+    """
+    Yields every file that is no archive in an archive or folder, recursing into nested archives, without
+    writing an extracted tree
+
+    :param str path: Path to archive or folder with archives, as for 'unpack_recursive'
+    :param Optional[str] password: Password of encrypted zip members and archives, encrypted members are skipped
+                                   if it's not given
+    :param int spool_bytes: Nested archives that need random access are kept in memory up to this size, bigger
+                            ones are copied to a temporary file
+    :param Optional[str] scratch_dir: Directory of the temporary files and of the output of formats that are
+                                      extracted by external programs (default - the system temporary directory)
+    :returns: (logical path, size, file object) of each leaf file; the file object can only be read until
+              the next file is requested
+    :raise: PatoolError if an archive can't be read
+    """
+    settings = _Settings(password, spool_bytes, scratch_dir)
+    with tracing.span("iter_leaf_files", path=path):
+        if isdir(path):
+            for root, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    yield from _iter_path(join(root, filename), settings)
+        elif isfile(path):
+            yield from _iter_path(path, settings)
+
+
+def _iter_path(path: str, settings: _Settings) -> Iterator[LeafFile]:
+    """Leaf files of a file on disk"""
+    if not is_archive(path):
+        with open(path, "rb") as fileobj:
+            yield LeafFile(path, getsize(path), fileobj)
+        return
+    archive_format, compression = get_archive_format(path)
+    if not can_stream(archive_format, compression):
+        yield from _iter_extracted(path, path, None, settings)
+        return
+    with open(path, "rb") as fileobj:
+        if archive_format == "zip" and not zipfile.is_zipfile(fileobj) or archive_format != "zip" and \
+                not _matches_magic(archive_format, compression, fileobj.peek(HEAD_SIZE_BYTES)[:HEAD_SIZE_BYTES]):
+            # e.g. a text file named '.zip', 'unpack_recursive' leaves it as it is
+            yield LeafFile(path, getsize(path), _rewind(fileobj))
+            return
+        yield from _iter_archive(path, _rewind(fileobj), archive_format, compression, settings)
+
+
+def can_stream(archive_format: str, compression: Optional[str]) -> bool:
+    """Check if an archive of this format can be read with the Python modules"""
+    if archive_format == "tar":
+        return compression in listing.TarfileCompressions
+    if archive_format == "zstd":
+        return zstd is not None and compression is None
+    return (archive_format == "zip" or archive_format in SINGLE_FILE_FORMATS) and compression is None
+
+
+def _iter_archive(path: str, fileobj: BinaryIO, archive_format: str, compression: Optional[str],
+                  settings: _Settings) -> Iterator[LeafFile]:
+    """Leaf files of the archive read from fileobj, which only has to be seekable for zip"""
+    if archive_format == "tar":
+        yield from _iter_tar(path, fileobj, settings)
+    elif archive_format == "zip":
+        yield from _iter_zip(path, fileobj, settings)
+    else:
+        name = strip_file_extension(path)
+        with open_single_file(fileobj, archive_format) as member_fileobj:
+            yield from _iter_member(path + NESTED_SEPARATOR + name, name, None, member_fileobj, settings)
+
+
+def open_single_file(fileobj: BinaryIO, archive_format: str) -> BinaryIO:
+    """Decompressing file object of a gzip, bzip2, zstd, xz or lzma file"""
+    if archive_format == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if archive_format == "bzip2":
+        return bz2.BZ2File(fileobj)
+    if archive_format == "zstd":
+        return zstd.ZstdFile(fileobj)
+    return lzma.LZMAFile(fileobj)
+
+
+def _iter_tar(path: str, fileobj: BinaryIO, settings: _Settings) -> Iterator[LeafFile]:
+    try:
+        # stream mode: the archive is read once from start to end, also if it's compressed
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tfile:
+            for info in tfile:
+                if not info.isfile():
+                    continue
+                name = normalize_member_name(info.name)
+                yield from _iter_member(path + NESTED_SEPARATOR + name, name, info.size, tfile.extractfile(info),
+                                        settings)
+    except tarfile.TarError as error:
+        raise PatoolError(f"error reading {path}: {error}")
+
+
+def _iter_zip(path: str, fileobj: BinaryIO, settings: _Settings) -> Iterator[LeafFile]:
+    try:
+        with zipfile.ZipFile(fileobj) as zfile:
+            for info in zfile.infolist():
+                if info.is_dir():
+                    continue
+                encrypted = bool(info.flag_bits & 0x1)
+                if encrypted and not settings.password:
+                    continue
+                name = normalize_member_name(info.filename)
+                with zfile.open(info, pwd=settings.password.encode() if encrypted else None) as member_fileobj:
+                    yield from _iter_member(path + NESTED_SEPARATOR + name, name, info.file_size, member_fileobj,
+                                            settings)
+    except (zipfile.BadZipFile, RuntimeError) as error:
+        # RuntimeError: wrong password
+        raise PatoolError(f"error reading {path}: {error}")
+
+
+def _iter_member(path: str, name: str, size: Optional[int], fileobj: BinaryIO,
+                 settings: _Settings) -> Iterator[LeafFile]:
+    """Leaf files of an archive member: the member itself, or the files in it if it's an archive"""
+    member_format = get_member_archive_format(name)
+    if member_format is None:
+        yield LeafFile(path, size, fileobj)
+        return
+    archive_format, compression = member_format
+    if archive_format == "zip" or not can_stream(archive_format, compression):
+        # random access needed, e.g. to read the central directory of a zip
+        with _spool(fileobj, settings) as spooled:
+            if archive_format == "zip" and zipfile.is_zipfile(spooled):
+                yield from _iter_zip(path, _rewind(spooled), settings)
+            elif archive_format != "zip" and _looks_like(archive_format, compression, _rewind(spooled)):
+                yield from _iter_extracted(path, basename(name), _rewind(spooled), settings)
+            else:
+                yield LeafFile(path, size, _rewind(spooled))
+        return
+    # without peek() the member is read as archive anyway, errors are raised then
+    if hasattr(fileobj, "peek") and \
+            not _matches_magic(archive_format, compression, fileobj.peek(HEAD_SIZE_BYTES)[:HEAD_SIZE_BYTES]):
+        yield LeafFile(path, size, fileobj)
+        return
+    yield from _iter_archive(path, fileobj, archive_format, compression, settings)
+
+
+# magic numbers of the streamed formats, the compression of a tar comes first
+MAGIC_NUMBERS = {
+    "gzip": b"\x1f\x8b",
+    "bzip2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+
+
+def _matches_magic(archive_format: str, compression: Optional[str], head: bytes) -> bool:
+    """Check the start of a member before it is read as archive, so files with a misleading extension stay files"""
+    magic_format = compression or archive_format
+    if magic_format in MAGIC_NUMBERS:
+        return head.startswith(MAGIC_NUMBERS[magic_format])
+    if magic_format == "tar":
+        return head[257:262] == b"ustar" or len(head) < 262
+    # lzma has no magic number
+    return True
+
+
+def _looks_like(archive_format: str, compression: Optional[str], fileobj: BinaryIO) -> bool:
+    return _matches_magic(archive_format, compression, fileobj.read(HEAD_SIZE_BYTES))
+
+
+def _spool(fileobj: BinaryIO, settings: _Settings) -> BinaryIO:
+    spooled = tempfile.SpooledTemporaryFile(max_size=settings.spool_bytes, dir=settings.scratch_dir)
+    shutil.copyfileobj(fileobj, spooled, 1024 * 1024)
+    return _rewind(spooled)
+
+
+def _rewind(fileobj: BinaryIO) -> BinaryIO:
+    fileobj.seek(0)
+    return fileobj
+
+
+def _iter_extracted(path: str, name: str, fileobj: Optional[BinaryIO], settings: _Settings) -> Iterator[LeafFile]:
+    """Leaf files of an archive only external programs can read, extracted into a scratch directory;
+    fileobj is None if path is the archive file itself"""
+    scratch = tempfile.mkdtemp(prefix="unpack_recursive_", dir=settings.scratch_dir)
+    try:
+        archive = path
+        if fileobj is not None:
+            archive = join(scratch, name)
+            with open(archive, "wb") as archive_file:
+                shutil.copyfileobj(fileobj, archive_file, 1024 * 1024)
+        output_dir = join(scratch, "output")
+        extract_archive(archive, verbosity=-1, output_dir=output_dir, interactive=False, password=settings.password)
+        # external programs may create files without read permissions
+        scan_output_dir(output_dir)
+        for root, dirnames, filenames in os.walk(output_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                file_path = join(root, filename)
+                if os.path.islink(file_path):
+                    # could point anywhere outside the archive
+                    continue
+                member_name = os.path.relpath(file_path, output_dir).replace(os.sep, "/")
+                with open(file_path, "rb") as member_fileobj:
+                    yield from _iter_member(path + NESTED_SEPARATOR + member_name, member_name, getsize(file_path),
+                                            member_fileobj, settings)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)